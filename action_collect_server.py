@@ -1,38 +1,318 @@
-import os
-import datetime
 import argparse
-from flask import Flask, request, jsonify
+import asyncio
+import atexit
+import threading
+import time
+from contextlib import asynccontextmanager
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.responses import Response as StarletteResponse
+from starlette.routing import Route
+
+from utils.event_catalog import EventCatalog
+from utils.event_schema import EventSchemaError, decode_event_json
+from utils.ingest import EventCoalescer, EventWriter, IngestQueue, ack_map, client_seqs, decode_event_batch
+from utils.live_compile import LiveCompiler
+from utils.metrics import CONTENT_TYPE, REGISTRY
+from utils.snapshot_store import SnapshotStore
 
 app = Flask(__name__)
 CORS(app)
+writer = EventWriter("data", durable=False, snapshots=SnapshotStore.for_data_root("data"))
+ACK_TIMEOUT = 10.0     # seconds a batch response waits for its events to be written
+
+ROUTES = ("/action-data", "/action-data/batch", "/recorder-stats", "/metrics")
+REQUEST_SECONDS = REGISTRY.histogram(
+    "collector_request_seconds", "Request latency per route, from the first byte read to the response.",
+    ("route", "method", "status"))
+REQUEST_BYTES = REGISTRY.counter(
+    "collector_request_bytes_total", "Request body bytes received (as sent, i.e. compressed).", ("route",))
+DECODE_SECONDS = REGISTRY.histogram(
+    "collector_decode_seconds", "Time to decompress, parse and validate a request body.", ("route",))
+EVENTS_RECEIVED = REGISTRY.counter(
+    "collector_events_received_total", "Valid events received, before coalescing.", ("route",))
+EVENTS_REJECTED = REGISTRY.counter(
+    "collector_events_rejected_total", "Events rejected by the schema.", ("route",))
+
+
+def observe_request(route: str, method: str, status: int, seconds: float, nbytes: int) -> None:
+    route = route if route in ROUTES else "unmatched"
+    REQUEST_SECONDS.labels(route=route, method=method, status=status).observe(seconds)
+    REQUEST_BYTES.labels(route=route).inc(nbytes)
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
 
-def mkdir_n_define_file_name(data_root_dir, task_name):
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    date_folder = timestamp.split('_')[0]
-    # Include task_name after the date folder
-    folderpath = os.path.join(data_root_dir, date_folder, task_name)
-    if not os.path.exists(folderpath):
-        os.makedirs(folderpath)
-    filename = f"summary_event_{timestamp}.json"
-    filepath = os.path.join(folderpath, filename)
-    return filepath
+
+@app.after_request
+def _record_request(response):
+    rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    observe_request(rule, request.method, response.status_code,
+                    time.perf_counter() - g.get("request_started", time.perf_counter()),
+                    request.content_length or 0)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.route('/action-data', methods=['POST'])
 def handle_event():
     if not request.is_json:
         return jsonify({"status": "error", "message": "Request must be JSON"}), 400
 
-    event_data = request.get_json()
-    task_id = event_data["taskId"]
-    filepath = mkdir_n_define_file_name("data", task_id)
+    try:
+        with DECODE_SECONDS.labels(route="/action-data").time():
+            event_data = decode_event_json(request.get_data())
+    except EventSchemaError as exc:
+        EVENTS_REJECTED.labels(route="/action-data").inc()
+        return jsonify({"status": "error", "message": f"Invalid event: {exc}"}), 400
+    EVENTS_RECEIVED.labels(route="/action-data").inc()
+    events, resync = writer.prepare([event_data])
+    if resync:
+        return jsonify(resync_error(resync)), 409
+    entries = writer.write_batch(events)
+    if not entries:
+        return jsonify({"status": "success",
+                        "message": "Event received and held for duplicate coalescing",
+                        "written": []}), 200
+
+    last = entries[-1]
+    return jsonify({"status": "success",
+                    "message": f"Event received; {len(entries)} event(s) saved to {last['folder']}, "
+                               f"last seq {last['seq']}",
+                    "seq": last["seq"],
+                    "written": [e["seq"] for e in entries]}), 200
+
+
+def count_batch(events, rejected) -> None:
+    EVENTS_RECEIVED.labels(route="/action-data/batch").inc(len(events))
+    EVENTS_REJECTED.labels(route="/action-data/batch").inc(len(rejected))
+    for item in rejected:
+        print(f"[OTA warning] rejected event {item['index']} of batch: {item['error']}")
+
+
+def resync_error(resync) -> dict:
+    return {"status": "error", "message": "Snapshot delta base unknown, resend the event with pageHTMLContent",
+            "resync": resync}
+
+
+def batch_ack(events, rejected, resync, settled) -> dict:
+    """Response body of the batch endpoint: the clientSeqs per task that are
+    written (or dropped as duplicates) and may leave the recorder's buffer,
+    and the tasks whose snapshots must be uploaded whole.  Events that are
+    neither acked nor rejected are still held or queued, or (for the tasks in
+    resync) were not written: the recorder resends them and the retry is
+    acked once they are written."""
+    return {"status": "success", "accepted": len(events), "rejected": rejected, "acked": ack_map(settled),
+            "resync": resync}
+
+
+@app.route('/action-data/batch', methods=['POST'])
+def handle_event_batch():
+    try:
+        with DECODE_SECONDS.labels(route="/action-data/batch").time():
+            events, rejected = decode_event_batch(request.get_data(), request.headers.get("Content-Encoding"))
+    except EventSchemaError as exc:
+        return jsonify({"status": "error", "message": f"Invalid batch: {exc}"}), 400
+    count_batch(events, rejected)
+
+    events, resync = writer.prepare(events)
+    writer.write_batch(events)
+    settled = writer.wait_settled(client_seqs(events), ACK_TIMEOUT)
+    return jsonify(batch_ack(events, rejected, resync, settled)), 200
+
+
+@app.route('/recorder-stats', methods=['GET'])
+def recorder_stats():
+    return jsonify(writer.recorder_timings.summary()), 200
+
+
+def start_flush_thread(event_writer: EventWriter, interval: float = 0.5) -> None:
+    """[flask] Release coalesced events whose window is over even when no request arrives."""
+    if event_writer.coalescer is None:
+        return
+
+    def loop() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                event_writer.flush_due()
+            except Exception as exc:
+                print(f"[OTA error] failed to flush held events: {exc}")
+
+    threading.Thread(target=loop, name="coalesce-flush", daemon=True).start()
+    atexit.register(event_writer.flush_due, True)
+
+
+# ---------------------------------------------------------------------------
+# ASGI ingest mode: handlers only enqueue, a background task writes to disk
+# ---------------------------------------------------------------------------
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware timing every request and counting its body bytes."""
+
+    def __init__(self, asgi_app) -> None:
+        self.app = asgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status, received = [500], [0]
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                received[0] += len(message.get("body", b""))
+            return message
+
+        async def status_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, status_send)
+        finally:
+            observe_request(scope["path"], scope["method"], status[0],
+                            time.perf_counter() - started, received[0])
+
+
+def create_asgi_app(event_writer: EventWriter,
+                    queue_size: int = 1024,
+                    batch_size: int = 64,
+                    queue_full_status: int = 503,
+                    ack_timeout: float = ACK_TIMEOUT) -> Starlette:
+    ingest = IngestQueue(event_writer, maxsize=queue_size, batch_size=batch_size)
+
+    async def action_data(request: Request) -> JSONResponse:
+        body = await request.body()
+        try:
+            with DECODE_SECONDS.labels(route="/action-data").time():
+                event_data = decode_event_json(body)
+        except EventSchemaError as exc:
+            EVENTS_REJECTED.labels(route="/action-data").inc()
+            return JSONResponse({"status": "error", "message": f"Invalid event: {exc}"}, status_code=400)
+        EVENTS_RECEIVED.labels(route="/action-data").inc()
+
+        events, resync = await asyncio.to_thread(event_writer.prepare, [event_data])
+        if resync:
+            return JSONResponse(resync_error(resync), status_code=409)
+        if not ingest.offer(event_data):
+            return JSONResponse({"status": "error", "message": "Ingest queue is full, retry later"},
+                                status_code=queue_full_status, headers={"Retry-After": "1"})
+        return JSONResponse({"status": "success", "message": "Event queued"}, status_code=202)
+
+    async def action_data_batch(request: Request) -> JSONResponse:
+        body = await request.body()
+        try:
+            with DECODE_SECONDS.labels(route="/action-data/batch").time():
+                events, rejected = await asyncio.to_thread(
+                    decode_event_batch, body, request.headers.get("content-encoding"))
+        except EventSchemaError as exc:
+            return JSONResponse({"status": "error", "message": f"Invalid batch: {exc}"}, status_code=400)
+        count_batch(events, rejected)
+
+        events, resync = await asyncio.to_thread(event_writer.prepare, events)
+        if not ingest.offer_many(events):
+            return JSONResponse({"status": "error", "message": "Ingest queue is full, retry later"},
+                                status_code=queue_full_status, headers={"Retry-After": "1"})
+        settled = await ingest.acknowledge(client_seqs(events), ack_timeout)
+        return JSONResponse(batch_ack(events, rejected, resync, settled), status_code=202)
+
+    async def recorder_stats(request: Request) -> JSONResponse:
+        return JSONResponse(event_writer.recorder_timings.summary())
+
+    async def metrics_text(request: Request) -> StarletteResponse:
+        return StarletteResponse(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+
+    @asynccontextmanager
+    async def lifespan(_app):
+        ingest.start()
+        try:
+            yield
+        finally:
+            await ingest.close()
+
+    asgi_app = Starlette(
+        routes=[Route('/action-data', action_data, methods=['POST']),
+                Route('/action-data/batch', action_data_batch, methods=['POST']),
+                Route('/recorder-stats', recorder_stats, methods=['GET']),
+                Route('/metrics', metrics_text, methods=['GET'])],
+        middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+                    Middleware(RequestMetricsMiddleware)],
+        lifespan=lifespan,
+    )
+    asgi_app.state.ingest = ingest
+    return asgi_app
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Collect recorder events from the WAP Chrome extension.")
+    parser.add_argument("--mode", choices=["flask", "asgi"], default="flask",
+                        help="flask: synchronous dev server (default); asgi: non-blocking queued ingest")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=4934)
+    parser.add_argument("--data_root", default="data", help="Folder where recordings are stored.")
+    parser.add_argument("--queue_size", type=int, default=1024,
+                        help="[asgi] maximum number of events waiting to be written")
+    parser.add_argument("--batch_size", type=int, default=64,
+                        help="[asgi] maximum number of events written per fsync group")
+    parser.add_argument("--queue_full_status", type=int, choices=[429, 503], default=503,
+                        help="[asgi] HTTP status returned when the queue is full")
+    parser.add_argument("--no_fsync", action="store_true",
+                        help="[asgi] skip fsync after each written batch")
+    parser.add_argument("--inline_snapshots", action="store_true",
+                        help="keep pageHTMLContent inside each event file instead of the <data_root>/blobs store")
+    parser.add_argument("--catalog", action="store_true",
+                        help="also index every event in <data_root>/catalog.sqlite3")
+    parser.add_argument("--live_compile", action="store_true",
+                        help="compile exact-replay actions while recording; the plan is written on task-finish")
+    parser.add_argument("--coalesce_window", type=float, default=0.0,
+                        help="seconds to hold events so duplicate eventHash deliveries can be dropped "
+                             "(0, the default, writes every event as it arrives)")
+    parser.add_argument("--ack_timeout", type=float, default=ACK_TIMEOUT,
+                        help="seconds a batch response waits for its events to be written before "
+                             "acking only those that are")
+    return parser.parse_args()
+
 
-    with open(filepath, "w", encoding='utf-8') as json_file:
-        import json
-        json.dump(event_data, json_file, indent=2)
+def build_writer(args: argparse.Namespace) -> EventWriter:
+    durable = args.mode == "asgi" and not args.no_fsync
+    snapshots = None
+    if not args.inline_snapshots:
+        snapshots = SnapshotStore.for_data_root(args.data_root, durable=durable)
+    catalog = EventCatalog.for_data_root(args.data_root) if args.catalog else None
+    coalescer = EventCoalescer(args.coalesce_window) if args.coalesce_window > 0 else None
+    compiler = LiveCompiler() if args.live_compile else None
+    return EventWriter(args.data_root, durable=durable, snapshots=snapshots, catalog=catalog,
+                       coalescer=coalescer, compiler=compiler)
 
-    return jsonify({"status": "success", "message": f"Event received and saved as {filepath}"}), 200
 
 if __name__ == '__main__':
-    # Run the Flask app
-    app.run(debug=True, host='0.0.0.0', port=4934)
\ No newline at end of file
+    args = parse_args()
+    writer = build_writer(args)
+    if args.mode == "asgi":
+        import uvicorn
+        asgi_app = create_asgi_app(
+            writer,
+            queue_size=args.queue_size,
+            batch_size=args.batch_size,
+            queue_full_status=args.queue_full_status,
+            ack_timeout=args.ack_timeout,
+        )
+        uvicorn.run(asgi_app, host=args.host, port=args.port)
+    else:
+        # Run the Flask app
+        ACK_TIMEOUT = args.ack_timeout
+        start_flush_thread(writer)
+        app.run(debug=True, host=args.host, port=args.port)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import logging
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 
 from langchain_core.messages import (
 	AIMessage,
@@ -23,7 +23,8 @@ logger = logging.getLogger(__name__)
 
 class MessageManagerSettings(BaseModel):
 	max_input_tokens: int = 128000
-	estimated_characters_per_token: int = 3
+	estimated_characters_per_token: int = 3  # only used without a token_counter
+	token_counter: Optional[Callable[[str], int]] = None  # the model's tokenizer, if the caller has one
 	image_tokens: int = 800
 	include_attributes: list[str] = []
 	message_context: Optional[str] = None
@@ -241,6 +242,8 @@ class MessageManager:
 
 	def _count_text_tokens(self, text: str) -> int:
 		"""Count tokens in a text string"""
+		if self.settings.token_counter is not None:
+			return self.settings.token_counter(text)
 		tokens = len(text) // self.settings.estimated_characters_per_token  # Rough estimate if no tokenizer available
 		return tokens
 
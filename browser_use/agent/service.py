@@ -39,7 +39,9 @@ from browser_use.agent.views import (
 	AgentState,
 	AgentStepInfo,
 	StepMetadata,
+	TokenCounter,
 	ToolCallingMethod,
+	UsageRecorder,
 )
 from browser_use.browser.browser import Browser
 from browser_use.browser.context import BrowserContext
@@ -155,7 +157,10 @@ class Agent(Generic[Context]):
 		memory_config: Optional[dict] = None,
 		subgoal_list: list[dict] = None,
 		exact_replay_list: list[dict] = None,
-		replay_mode: str = None
+		replay_mode: str = None,
+		# LLM accounting (the controller takes its own, for page extraction)
+		token_counter: Optional[TokenCounter] = None,
+		usage_recorder: Optional[UsageRecorder] = None,
 	):
 		if page_extraction_llm is None:
 			page_extraction_llm = llm
@@ -201,6 +206,7 @@ class Agent(Generic[Context]):
 
 		# Initialize state
 		self.state = injected_agent_state or AgentState()
+		self.usage = usage_recorder  # LLM tokens and cost of the run's agent and planner calls, if accounted
 
 		# Action setup
 		self._setup_action_models()
@@ -243,6 +249,7 @@ class Agent(Generic[Context]):
 			).get_system_message(),
 			settings=MessageManagerSettings(
 				max_input_tokens=self.settings.max_input_tokens,
+				token_counter=(lambda text: token_counter(text, self.model_name)) if token_counter else None,
 				include_attributes=self.settings.include_attributes,
 				message_context=self.settings.message_context,
 				sensitive_data=sensitive_data,
@@ -399,6 +406,7 @@ class Agent(Generic[Context]):
 		result: list[ActionResult] = []
 		step_start_time = time.time()
 		tokens = 0
+		usage_before = self._usage_totals()
 
 		try:
 			state = await self.browser_context.get_state()
@@ -540,12 +548,7 @@ class Agent(Generic[Context]):
 				return
 
 			if state:
-				metadata = StepMetadata(
-					step_number=self.state.n_steps,
-					step_start_time=step_start_time,
-					step_end_time=step_end_time,
-					input_tokens=tokens,
-				)
+				metadata = self._step_metadata(step_start_time, step_end_time, tokens, usage_before)
 				self._make_history_item(model_output, state, result, metadata)
 
 
@@ -558,6 +561,7 @@ class Agent(Generic[Context]):
 		result: list[ActionResult] = []
 		step_start_time = time.time()
 		tokens = 0
+		usage_before = self._usage_totals()
 
 		try:
 			state = await self.browser_context.get_state()
@@ -654,12 +658,7 @@ class Agent(Generic[Context]):
 				return
 
 			if state:
-				metadata = StepMetadata(
-					step_number=self.state.n_steps,
-					step_start_time=step_start_time,
-					step_end_time=step_end_time,
-					input_tokens=tokens,
-				)
+				metadata = self._step_metadata(step_start_time, step_end_time, tokens, usage_before)
 				self._make_history_item(model_output, state, result, metadata)
 
 	@time_execution_async('--step (agent)')
@@ -671,6 +670,7 @@ class Agent(Generic[Context]):
 		result: list[ActionResult] = []
 		step_start_time = time.time()
 		tokens = 0
+		usage_before = self._usage_totals()
 
 		try:
 			state = await self.browser_context.get_state()
@@ -717,12 +717,7 @@ class Agent(Generic[Context]):
 				return
 
 			if state:
-				metadata = StepMetadata(
-					step_number=self.state.n_steps,
-					step_start_time=step_start_time,
-					step_end_time=step_end_time,
-					input_tokens=tokens,
-				)
+				metadata = self._step_metadata(step_start_time, step_end_time, tokens, usage_before)
 				self._make_history_item(model_output, state, result, metadata)
 
 
@@ -771,6 +766,27 @@ class Agent(Generic[Context]):
 
 		return [ActionResult(error=error_msg, include_in_memory=True)]
 
+	def _usage_totals(self) -> tuple[int, int, float]:
+		return self.usage.totals() if self.usage is not None else (0, 0, 0.0)
+
+	def _record_reply(self, model: str, reply: Any, prompt_text: str = '', input_tokens: Optional[int] = None) -> None:
+		if self.usage is not None:
+			self.usage.record_reply(model, reply, prompt_text, input_tokens)
+
+	def _step_metadata(
+		self, step_start_time: float, step_end_time: float, tokens: int, usage_before: tuple[int, int, float]
+	) -> StepMetadata:
+		"""Step metadata with the tokens and cost of the LLM calls made since *usage_before*"""
+		input_tokens, output_tokens, cost = (now - before for now, before in zip(self._usage_totals(), usage_before))
+		return StepMetadata(
+			step_number=self.state.n_steps,
+			step_start_time=step_start_time,
+			step_end_time=step_end_time,
+			input_tokens=input_tokens or tokens,
+			output_tokens=output_tokens,
+			cost=cost,
+		)
+
 	def _make_history_item(
 		self,
 		model_output: AgentOutput | None,
@@ -828,6 +844,8 @@ class Agent(Generic[Context]):
 			except Exception as e:
 				logger.error(f'Failed to invoke model: {str(e)}')
 				raise LLMException(401, 'LLM API call failed') from e
+			# the call is billed even if its output cannot be parsed below
+			self._record_reply(self.model_name, output, input_tokens=self._message_manager.state.history.current_tokens)
 			# TODO: currently invoke does not return reasoning_content, we should override invoke
 			output.content = self._remove_think_tags(str(output.content))
 			try:
@@ -853,6 +871,9 @@ class Agent(Generic[Context]):
 			structured_llm = self.llm.with_structured_output(self.AgentOutput, include_raw=True, method=self.tool_calling_method)
 			response: dict[str, Any] = await structured_llm.ainvoke(input_messages)
 
+		if self.tool_calling_method != 'raw' and response.get('raw') is not None:
+			self._record_reply(self.model_name, response['raw'], input_tokens=self._message_manager.state.history.current_tokens)
+
 		# Handle tool call responses
 		if response.get('parsing_error') and 'raw' in response:
 			raw_msg = response['raw']
@@ -1442,6 +1463,7 @@ class Agent(Generic[Context]):
 		except Exception as e:
 			logger.error(f'Failed to invoke planner: {str(e)}')
 			raise LLMException(401, 'LLM API call failed') from e
+		self._record_reply(self.planner_model_name or 'Unknown', response, '\n'.join(str(m.content) for m in planner_messages))
 
 		plan = str(response.content)
 		# if deepseek-reasoner, remove think tags
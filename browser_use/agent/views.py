@@ -5,7 +5,7 @@ import traceback
 import uuid
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Literal, Optional, Type
+from typing import Any, Callable, Dict, List, Literal, Optional, Protocol, Type
 
 from langchain_core.language_models.chat_models import BaseChatModel
 from openai import RateLimitError
@@ -22,6 +22,7 @@ from browser_use.dom.history_tree_processor.service import (
 from browser_use.dom.views import SelectorMap
 
 ToolCallingMethod = Literal['function_calling', 'json_mode', 'raw', 'auto']
+TokenCounter = Callable[[str, str], int]  # (text, model name) -> tokens, e.g. utils.tokenizer.count_tokens
 REQUIRED_LLM_API_ENV_VARS = {
 	'ChatOpenAI': ['OPENAI_API_KEY'],
 	'AzureOpenAI': ['AZURE_ENDPOINT', 'AZURE_OPENAI_API_KEY'],
@@ -33,6 +34,16 @@ REQUIRED_LLM_API_ENV_VARS = {
 }
 
 
+class UsageRecorder(Protocol):
+	"""Accounts the tokens and cost of LLM calls, e.g. utils.llm_usage.Usage"""
+
+	def record_reply(self, model: str, reply: Any, prompt_text: str = '', input_tokens: Optional[int] = None) -> Any: ...
+
+	def totals(self) -> tuple[int, int, float]:
+		"""(input tokens, output tokens, cost) recorded so far"""
+		...
+
+
 class AgentSettings(BaseModel):
 	"""Options for the agent"""
 
@@ -118,8 +129,10 @@ class StepMetadata(BaseModel):
 
 	step_start_time: float
 	step_end_time: float
-	input_tokens: int  # Approximate tokens from message manager for this step
+	input_tokens: int  # Billed input tokens of the step's LLM calls, else the message manager's count
 	step_number: int
+	output_tokens: int = 0
+	cost: float = 0.0  # USD, for models with a known price (as reported by the agent's UsageRecorder)
 
 	@property
 	def duration_seconds(self) -> float:
@@ -223,9 +236,9 @@ class AgentHistoryList(BaseModel):
 
 	def total_input_tokens(self) -> int:
 		"""
-		Get total tokens used across all steps.
-		Note: These are from the approximate token counting of the message manager.
-		For accurate token counting, use tools like LangChain Smith or OpenAI's token counters.
+		Get total input tokens across all steps.
+		Note: Steps that made LLM calls report the provider's counts, the others the
+		message manager's count.
 		"""
 		total = 0
 		for h in self.history:
@@ -233,6 +246,14 @@ class AgentHistoryList(BaseModel):
 				total += h.metadata.input_tokens
 		return total
 
+	def total_output_tokens(self) -> int:
+		"""Get total output tokens of the LLM calls across all steps"""
+		return sum(h.metadata.output_tokens for h in self.history if h.metadata)
+
+	def total_cost(self) -> float:
+		"""Get the total estimated cost in USD of the LLM calls across all steps"""
+		return sum(h.metadata.cost for h in self.history if h.metadata)
+
 	def input_token_usage(self) -> list[int]:
 		"""Get token usage for each step"""
 		return [h.metadata.input_tokens for h in self.history if h.metadata]
@@ -3,6 +3,7 @@ import datetime
 import enum
 import json
 import logging
+import os
 import re
 import traceback
 from typing import Dict, Generic, Optional, Tuple, Type, TypeVar, cast
@@ -14,7 +15,7 @@ from playwright.async_api import ElementHandle, Page
 # from lmnr.sdk.laminar import Laminar
 from pydantic import BaseModel
 
-from browser_use.agent.views import ActionModel, ActionResult
+from browser_use.agent.views import ActionModel, ActionResult, TokenCounter, UsageRecorder
 from browser_use.browser.context import BrowserContext
 from browser_use.controller.registry.service import Registry
 from browser_use.controller.views import (
@@ -44,17 +45,37 @@ from browser_use.utils import time_execution_sync
 
 logger = logging.getLogger(__name__)
 
+# page tokens sent to the extraction LLM at most (the prompt and reply need the rest of the context)
+EXTRACT_TOKEN_BUDGET = int(os.getenv('OTA_EXTRACT_TOKEN_BUDGET', '100000'))
+
 
 Context = TypeVar('Context')
 
 
+def _estimate_tokens(text: str, model_name: str) -> int:
+	return len(text) // 3  # Rough estimate if no tokenizer available
+
+
+def _truncate_to_tokens(text: str, max_tokens: int, tokens: int, model_name: str, count: TokenCounter) -> str:
+	"""*text* of *tokens* tokens cut to at most *max_tokens* tokens"""
+	keep = int(len(text) * max_tokens / tokens)
+	while keep > 0 and count(text[:keep], model_name) > max_tokens:
+		keep = int(keep * 0.95)
+	return text[:keep]
+
+
 class Controller(Generic[Context]):
 	def __init__(
 		self,
 		exclude_actions: list[str] = [],
 		output_model: Optional[Type[BaseModel]] = None,
+		token_counter: Optional[TokenCounter] = None,
+		usage_recorder: Optional[UsageRecorder] = None,
 	):
 		self.registry = Registry[Context](exclude_actions)
+		# page extraction: tokenizer of the extraction model, and where its calls are accounted
+		self.token_counter = token_counter or _estimate_tokens
+		self.usage_recorder = usage_recorder
 
 		"""Register all default browser actions"""
 
@@ -348,10 +369,19 @@ class Controller(Generic[Context]):
 					content += f'\n\nIFRAME {iframe.url}:\n'
 					content += markdownify.markdownify(await iframe.content())
 
+			model_name = getattr(page_extraction_llm, 'model_name', None) or getattr(page_extraction_llm, 'model', None) or 'Unknown'
+			page_tokens = self.token_counter(content, model_name)
+			if page_tokens > EXTRACT_TOKEN_BUDGET:
+				logger.info(f'Page content has {page_tokens} tokens, truncated to {EXTRACT_TOKEN_BUDGET} for extraction')
+				content = _truncate_to_tokens(content, EXTRACT_TOKEN_BUDGET, page_tokens, model_name, self.token_counter)
+
 			prompt = 'Your task is to extract the content of the page. You will be given a page and a goal and you should extract all relevant information around this goal from the page. If the goal is vague, summarize the page. Respond in json format. Extraction goal: {goal}, Page: {page}'
 			template = PromptTemplate(input_variables=['goal', 'page'], template=prompt)
 			try:
-				output = page_extraction_llm.invoke(template.format(goal=goal, page=content))
+				prompt_text = template.format(goal=goal, page=content)
+				output = await page_extraction_llm.ainvoke(prompt_text)
+				if self.usage_recorder is not None:
+					self.usage_recorder.record_reply(model_name, output, prompt_text)
 				msg = f'📄  Extracted from page\n: {output.content}\n'
 				logger.info(msg)
 				return ActionResult(extracted_content=msg, include_in_memory=True)
@@ -9,13 +9,71 @@
 	let clickTimer = null;
 	let doubleClicked = false;
 	let pageContentIntervalId = null;
+	let pageContentUpdatePending = false;
 	let taskId = null;
 	let taskDescription = "";
 	const CLICK_DELAY = 500; // delay in ms to distinguish single vs double clic
 	const TopKEvents = 40;
 
-	var mutationBuffer = [];
 	var BUFFER_WINDOW = 1000; // milliseconds for before/after user action
+	const MUTATION_RING_SIZE = 4096;
+
+	/* Mutation records are kept in a fixed-size ring ordered by timestamp:
+	 * the before/after window of an action is found with two binary searches
+	 * instead of filtering (and clearing) a growing array on every action,
+	 * and overlapping actions no longer steal each other's records. */
+	class MutationRing {
+		constructor(capacity) {
+			this.records = new Array(capacity);
+			this.times   = new Float64Array(capacity);
+			this.start   = 0;
+			this.size    = 0;
+		}
+
+		push(record) {
+			const capacity = this.records.length;
+			const slot = (this.start + this.size) % capacity;
+			this.records[slot] = record;
+			this.times[slot]   = record.timestamp;
+			if (this.size < capacity) { this.size++; }
+			else { this.start = (this.start + 1) % capacity; }
+		}
+
+		// first logical index whose timestamp is > t (or >= t when `inclusive`)
+		_bound(t, inclusive) {
+			let lo = 0, hi = this.size;
+			while (lo < hi) {
+				const mid = (lo + hi) >> 1;
+				const time = this.times[(this.start + mid) % this.records.length];
+				if (inclusive ? time < t : time <= t) { lo = mid + 1; } else { hi = mid; }
+			}
+			return lo;
+		}
+
+		_slice(lo, hi) {
+			const out = [];
+			for (let i = lo; i < hi; i++) { out.push(this.records[(this.start + i) % this.records.length]); }
+			return out;
+		}
+
+		// the `max` records closest to `t` within [t - window, t]
+		before(t, window, max) {
+			const hi = this._bound(t, false);
+			const lo = Math.max(this._bound(t - window, true), hi - max);
+			return this._slice(lo, hi);
+		}
+
+		// the first `max` records within (t, t + window]
+		after(t, window, max) {
+			const lo = this._bound(t, false);
+			const hi = Math.min(this._bound(t + window, false), lo + max);
+			return this._slice(lo, hi);
+		}
+
+		clear() { this.start = 0; this.size = 0; this.records.fill(undefined); }
+	}
+
+	const mutationRing = new MutationRing(MUTATION_RING_SIZE);
 	let _globalEventHash = null;   // current hash or null
 	let _hashResetTimer  = null;   // id returned by setTimeout
 
@@ -40,6 +98,18 @@
 
     var nodeRegistry = [];
 
+	/* The sanitized snapshot is only rebuilt when the page may have changed
+	 * since the last one: any DOM mutation (text included), scrolling or
+	 * resizing (the snapshot only keeps nodes in the viewport) or typing. */
+	let snapshotCache = null;
+	let snapshotGeneration = 0;        // bumped on every invalidation
+	const snapshotObserver = new MutationObserver(invalidateSnapshot);
+	const snapshotObserverSettings = { subtree: true, childList: true, attributes: true, characterData: true };
+
+	function invalidateSnapshot(){ snapshotCache = null; snapshotGeneration++; }
+
+	function watchSnapshot(root){ snapshotObserver.observe(root, snapshotObserverSettings); }
+
 	let bgPort = null;
 	function openBGPort() {
 		if (bgPort) return;                    // already connected
@@ -200,13 +270,14 @@
         for (var i = 0, l = records.length; i < l; i++) {
             var record = records[i];
             record.timestamp = now;
-            mutationBuffer.push(record);
+            mutationRing.push(record);
 
             // For added nodes, still observe any new shadow roots
             if (record.type === 'childList' && record.addedNodes.length) {
                 Array.prototype.forEach.call(record.addedNodes, function (node) {
                     findShadowRoots(node).forEach(function (shadowRoot) {
                         observer.observe(shadowRoot, observerSettings);
+                        watchSnapshot(shadowRoot);
                     });
                 });
             }
@@ -292,12 +363,16 @@
 	function sendPageContentUpdatetoBackground(status) {
 
 		if (status == "update"){
-			chrome.runtime.sendMessage({
-			  type: 'update-page-content',
-			  sanitizedPageHTML: getCurrentHTMLSanitized()
-			}, function(response) {
-				taskId = response.taskId;
-			});
+			if (pageContentUpdatePending) { return; }      // previous idle capture still running
+			pageContentUpdatePending = true;
+			captureSnapshotIdle().then(({ html }) => {
+				chrome.runtime.sendMessage({
+				  type: 'update-page-content',
+				  sanitizedPageHTML: html
+				}, function(response) {
+					taskId = response.taskId;
+				});
+			}).finally(() => { pageContentUpdatePending = false; });
 		}
 		else if (status == "delete"){
 			chrome.runtime.sendMessage({
@@ -318,26 +393,30 @@
 					type: "task-start",
 					current_url: window.location.href
 				}],
-				pageHTMLContent: getCurrentHTMLSanitized()
+				pageURL: window.location.href
 			};
-			chrome.runtime.sendMessage({
-			  type: 'task-start',
-			  summaryEvent: summaryEvent
-			}, function(response) {
-
-				taskId = response.taskId;
-				console.log("Content script: Task start message sent", response);
-
-				if (window.SpecialEvents?.init) {
-					window.SpecialEvents.init({
-						nodeToHTMLString,
-						trimTarget,
-						getEventHash,
-						getCurrentHTMLSanitized,
-						taskId
-					});
-				}
+			captureSnapshotIdle().then(({ html, stats }) => {
+				summaryEvent.pageHTMLContent = html;
+				summaryEvent.recorderStats = recorderStats(stats, 0);
+				chrome.runtime.sendMessage({
+				  type: 'task-start',
+				  summaryEvent: summaryEvent
+				}, function(response) {
+
+					taskId = response.taskId;
+					console.log("Content script: Task start message sent", response);
+
+					if (window.SpecialEvents?.init) {
+						window.SpecialEvents.init({
+							nodeToHTMLString,
+							trimTarget,
+							getEventHash,
+							getCurrentHTMLSanitized,
+							taskId
+						});
+					}
 
+				});
 			});
 		  } else if (status === "task-finish"){
 			var summaryEvent = {
@@ -351,14 +430,18 @@
 					type: "task-finish",
 					current_url: window.location.href
 				}],
-				pageHTMLContent: getCurrentHTMLSanitized()
+				pageURL: window.location.href
 			};
-			  chrome.runtime.sendMessage({
-				type: 'task-finish',
-				summaryEvent: summaryEvent
-			}, function(response) {
-				console.log("Content script: Task finish message sent", response);
-			  });
+			captureSnapshotIdle().then(({ html, stats }) => {
+				summaryEvent.pageHTMLContent = html;
+				summaryEvent.recorderStats = recorderStats(stats, 0);
+				chrome.runtime.sendMessage({
+					type: 'task-finish',
+					summaryEvent: summaryEvent
+				}, function(response) {
+					console.log("Content script: Task finish message sent", response);
+				});
+			});
 		  }
 	}
 
@@ -413,45 +496,212 @@
 		return 0;
 	}
 
+	const SNAPSHOT_PURIFY_CONFIG = {
+		ALLOWED_TAGS: [
+		'a', 'abbr', 'address', 'article', 'aside', 'audio', 
+		'b', 'blockquote', 'br', 'button', 'caption', 'cite', 'code', 'col', 'colgroup', 
+		'data', 'datalist', 'dd', 'del', 'details', 'div', 'dl', 'dt', 'em', 
+		'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 
+		'h5', 'h6', 'header', 'hr', 'i', 'img', 'input', 'ins', 'label', 'legend', 
+		'li', 'main', 'menu', 'nav', 'ol', 'option', 'output', 'p', 'pre', 'progress', 
+		'q', 's', 'section', 'select', 'small', 'span', 'strong', 'sub', 'summary', 'svg',
+		'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'textarea', 'time', 'tr', 'ul', 'video',
+		'html', 'title', 'body'
+		],
+		ALLOWED_ATTR: [
+		'abbr', 'accept', 'accept-charset', 'accesskey', 'action', 'align', 'alt', 
+		'aria-describedby', 'aria-hidden', 'aria-label', 'aria-labelledby', 'border', 
+		'cellpadding', 'cellspacing', 'checked', 'cite', 'class', 'cols', 'colspan', 
+		'content', 'data', 'datetime', 'default', 'dir', 'disabled', 'download', 'draggable', 
+		'enctype', 'for', 'height', 'hidden', 'high', 'href', 'hreflang', 'id', 'inputmode', 
+		'ismap', 'label', 'lang', 'list', 'loop', 'low', 'max', 'maxlength', 'media', 
+		'method', 'min', 'multiple', 'muted', 'name', 'novalidate', 'onabort', 'onblur', 
+		'onchange', 'onclick', 'oncontextmenu', 'onfocus', 'oninput', 'oninvalid', 
+		'onreset', 'onscroll', 'onselect', 'onsubmit', 'outerHTML', 'placeholder', 
+		'poster', 'preload', 'readonly', 'rel', 'required', 'reversed', 'rows', 'rowspan', 
+		'sandbox', 'scope', 'selected', 'shape', 'size', 'span', 'spellcheck', 'src', 
+		'srcdoc', 'start', 'step', 'style', 'tabindex', 'target', 'title', 'translate', 
+		'type', 'usemap', 'value', 'width', 'wrap', 'ota-use-interactive-target',
+		]
+	};
+
+	// Remove inline styles after attributes are sanitized.  Registered once:
+	// DOMPurify keeps every hook it is given, so adding it per snapshot made
+	// each sanitize pass slower than the previous one.
+	DOMPurify.addHook('afterSanitizeAttributes', function(node) {
+		if (node.hasAttribute && node.hasAttribute('style')) {
+		node.removeAttribute('style');
+		}
+	});
+
 	function getCurrentHTMLSanitized(){
-		// Add a hook to remove inline styles after attributes are sanitized.
-		DOMPurify.addHook('afterSanitizeAttributes', function(node) {
-			if (node.hasAttribute && node.hasAttribute('style')) {
-			node.removeAttribute('style');
+		if (snapshotObserver.takeRecords().length) { invalidateSnapshot(); }
+		if (snapshotCache !== null) { return snapshotCache; }
+
+		const visibleHTML = getVisibleHTML(0);
+		snapshotCache = DOMPurify.sanitize(visibleHTML, SNAPSHOT_PURIFY_CONFIG);
+		return snapshotCache;
+	}
+
+	/* ---------------------------------------------------------------------
+	 * Idle-time snapshot capture
+	 *
+	 * Same result as `getCurrentHTMLSanitized`, but the visible clone is
+	 * built and sanitized in small steps inside requestIdleCallback, so a
+	 * heavy page never blocks the main thread for the whole snapshot.  Large
+	 * flow containers are sanitized child by child; their own tags are
+	 * sanitized as an empty shell around the children.  Used wherever the
+	 * page is not about to unload (link clicks and submits stay synchronous).
+	 * A capture that saw the page change between its slices is restarted, at
+	 * most IDLE_MAX_RESTARTS times, then taken synchronously, so a snapshot
+	 * never mixes two states of the page.
+	 *
+	 * There is no JS test runner in this repo: to check that both captures
+	 * agree on a page, run `verifyIdleSnapshot()` in the content script's
+	 * console context (DevTools → Console → context
+	 * "WAP Browser Action Capturer").
+	 * ------------------------------------------------------------------- */
+	const SPLITTABLE_TAGS = new Set(['BODY', 'DIV', 'SECTION', 'MAIN', 'ARTICLE', 'ASIDE', 'NAV',
+									 'HEADER', 'FOOTER', 'FORM', 'UL', 'OL', 'SPAN']);
+	const SPLIT_MIN_ELEMENTS = 300;     // containers with more descendants get split
+	const IDLE_TIMEOUT_MS    = 1000;    // run anyway if the page is never idle that long
+	const IDLE_MAX_RESTARTS  = 2;       // page changed mid-capture this often → capture synchronously
+
+	// per-event recorder cost, attached to summary events as `recorderStats`
+	const RECORDER_CPU_BUDGET_MS = 50;
+
+	function escapeText(text){
+		return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+				   .replace(/\u00a0/g, '&nbsp;');
+	}
+
+	function* sanitizeSteps(node, out){
+		for (const child of node.childNodes) {
+			if (child.nodeType === Node.TEXT_NODE) {
+				out.push(escapeText(child.data));
+			} else if (SPLITTABLE_TAGS.has(child.tagName) &&
+					   child.getElementsByTagName('*').length > SPLIT_MIN_ELEMENTS) {
+				const shell = DOMPurify.sanitize(child.cloneNode(false).outerHTML, SNAPSHOT_PURIFY_CONFIG);
+				const cut   = shell.lastIndexOf('</');
+				out.push(cut >= 0 ? shell.slice(0, cut) : shell);
+				yield* sanitizeSteps(child, out);
+				if (cut >= 0) { out.push(shell.slice(cut)); }
+			} else {
+				out.push(DOMPurify.sanitize(child.outerHTML, SNAPSHOT_PURIFY_CONFIG));
+				yield;
 			}
+		}
+	}
+
+	function* snapshotSteps(){
+		const clone = yield* visibleCloneSteps(0);
+		const body  = clone.querySelector('body');
+		const out   = [];
+		// a whole-document sanitize only returns the body content: do the same
+		if (body) { yield* sanitizeSteps(body, out); }
+		return out.join('');
+	}
+
+	const requestIdle = window.requestIdleCallback
+		? cb => window.requestIdleCallback(cb, { timeout: IDLE_TIMEOUT_MS })
+		: cb => setTimeout(() => cb({ didTimeout: true, timeRemaining: () => 8 }), 0);
+
+	/**
+	 * Resolve with {html, stats}.  `stats.snapshotMs` is the main-thread time
+	 * spent on the snapshot (the recorder's CPU cost), `snapshotWallMs` the
+	 * time until it was ready.
+	 */
+	function captureSnapshotIdle(){
+		const started = performance.now();
+		if (snapshotObserver.takeRecords().length) { invalidateSnapshot(); }
+		if (snapshotCache !== null) {
+			return Promise.resolve({ html: snapshotCache,
+									 stats: { snapshotMs: 0, snapshotWallMs: 0, snapshotSlices: 0, snapshotCached: true } });
+		}
+
+		const stats = { snapshotMs: 0, snapshotWallMs: 0, snapshotSlices: 0, snapshotCached: false, snapshotRestarts: 0 };
+		return new Promise((resolve, reject) => {
+			let generation = snapshotGeneration;
+			let steps = snapshotSteps();
+			const slice = deadline => {
+				const sliceStart = performance.now();
+				let step;
+				try {
+					do { step = steps.next(); }
+					while (!step.done && (deadline.didTimeout ? performance.now() - sliceStart < 8
+															  : deadline.timeRemaining() > 1));
+				} catch (err) {
+					reject(err);
+					return;
+				}
+				stats.snapshotMs += performance.now() - sliceStart;
+				stats.snapshotSlices += 1;
+				if (!step.done) { requestIdle(slice); return; }
+
+				if (snapshotObserver.takeRecords().length) { invalidateSnapshot(); }
+				if (generation !== snapshotGeneration) {
+					// the page changed between slices: the pieces belong to different states
+					if (stats.snapshotRestarts < IDLE_MAX_RESTARTS) {
+						stats.snapshotRestarts += 1;
+						generation = snapshotGeneration;
+						steps = snapshotSteps();
+						requestIdle(slice);
+						return;
+					}
+					const now = captureSnapshotNow();
+					stats.snapshotMs += now.stats.snapshotMs;
+					stats.snapshotSlices += 1;
+					stats.snapshotWallMs = performance.now() - started;
+					resolve({ html: now.html, stats });
+					return;
+				}
+				snapshotCache = step.value;
+				stats.snapshotWallMs = performance.now() - started;
+				resolve({ html: step.value, stats });
+			};
+			requestIdle(slice);
 		});
-		
-		var config = {
-			ALLOWED_TAGS: [
-			'a', 'abbr', 'address', 'article', 'aside', 'audio', 
-			'b', 'blockquote', 'br', 'button', 'caption', 'cite', 'code', 'col', 'colgroup', 
-			'data', 'datalist', 'dd', 'del', 'details', 'div', 'dl', 'dt', 'em', 
-			'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 
-			'h5', 'h6', 'header', 'hr', 'i', 'img', 'input', 'ins', 'label', 'legend', 
-			'li', 'main', 'menu', 'nav', 'ol', 'option', 'output', 'p', 'pre', 'progress', 
-			'q', 's', 'section', 'select', 'small', 'span', 'strong', 'sub', 'summary', 'svg',
-			'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'textarea', 'time', 'tr', 'ul', 'video',
-			'html', 'title', 'body'
-			],
-			ALLOWED_ATTR: [
-			'abbr', 'accept', 'accept-charset', 'accesskey', 'action', 'align', 'alt', 
-			'aria-describedby', 'aria-hidden', 'aria-label', 'aria-labelledby', 'border', 
-			'cellpadding', 'cellspacing', 'checked', 'cite', 'class', 'cols', 'colspan', 
-			'content', 'data', 'datetime', 'default', 'dir', 'disabled', 'download', 'draggable', 
-			'enctype', 'for', 'height', 'hidden', 'high', 'href', 'hreflang', 'id', 'inputmode', 
-			'ismap', 'label', 'lang', 'list', 'loop', 'low', 'max', 'maxlength', 'media', 
-			'method', 'min', 'multiple', 'muted', 'name', 'novalidate', 'onabort', 'onblur', 
-			'onchange', 'onclick', 'oncontextmenu', 'onfocus', 'oninput', 'oninvalid', 
-			'onreset', 'onscroll', 'onselect', 'onsubmit', 'outerHTML', 'placeholder', 
-			'poster', 'preload', 'readonly', 'rel', 'required', 'reversed', 'rows', 'rowspan', 
-			'sandbox', 'scope', 'selected', 'shape', 'size', 'span', 'spellcheck', 'src', 
-			'srcdoc', 'start', 'step', 'style', 'tabindex', 'target', 'title', 'translate', 
-			'type', 'usemap', 'value', 'width', 'wrap', 'ota-use-interactive-target',
-			]
-		};
+	}
 
-		const visibleHTML = getVisibleHTML(0);
-		return DOMPurify.sanitize(visibleHTML, config);
+	// manual check of the idle capture against the synchronous one (see above)
+	function verifyIdleSnapshot(){
+		invalidateSnapshot();
+		return captureSnapshotIdle().then(({ html, stats }) => {
+			invalidateSnapshot();
+			const expected = getCurrentHTMLSanitized();
+			const same = html === expected;
+			let at = 0;
+			while (!same && at < html.length && html[at] === expected[at]) { at++; }
+			console.log(same ? '[OTA] idle snapshot matches getCurrentHTMLSanitized'
+							 : `[OTA] idle snapshot differs from getCurrentHTMLSanitized at ${at}`, stats);
+			return same;
+		});
+	}
+	window.verifyIdleSnapshot = verifyIdleSnapshot;
+
+	// synchronous capture for events right before the page may unload
+	function captureSnapshotNow(){
+		const started = performance.now();
+		const cached  = snapshotCache !== null && !snapshotObserver.takeRecords().length;
+		const html    = getCurrentHTMLSanitized();
+		const elapsed = performance.now() - started;
+		return { html, stats: { snapshotMs: elapsed, snapshotWallMs: elapsed, snapshotSlices: 1, snapshotCached: cached } };
+	}
+
+	function recorderStats(snapshotStats, mutationMs){
+		const stats = {
+			mutationMs: Math.round(mutationMs * 100) / 100,
+			snapshotMs: Math.round(snapshotStats.snapshotMs * 100) / 100,
+			snapshotWallMs: Math.round(snapshotStats.snapshotWallMs),
+			snapshotSlices: snapshotStats.snapshotSlices,
+			snapshotCached: snapshotStats.snapshotCached,
+			budgetMs: RECORDER_CPU_BUDGET_MS
+		};
+		stats.cpuMs = Math.round((mutationMs + snapshotStats.snapshotMs) * 100) / 100;
+		if (stats.cpuMs > RECORDER_CPU_BUDGET_MS) {
+			console.warn(`[OTA] recorder spent ${stats.cpuMs} ms on one event (budget ${RECORDER_CPU_BUDGET_MS} ms)`, stats);
+		}
+		return stats;
 	}
 
     function handleUserAction(event, evHash) {
@@ -478,32 +728,17 @@
 		actionTarget.target = trimTarget(bestInteractiveElement);
         var actionTime = Date.now();
 
-        // Get mutations that occurred within the BUFFER_WINDOW before the action.
-        var beforeMutations = mutationBuffer.filter(function (record) {
-            return actionTime - record.timestamp <= BUFFER_WINDOW && actionTime - record.timestamp >= 0;
-        });
+		const MAX_MUTATIONS_PER_SIDE = 100;
 
-        // Clear the buffer so we can capture after-mutations freshly.
-        mutationBuffer = [];
+        // Mutations within the BUFFER_WINDOW before the action, closest first kept.
+		let mutationStart = performance.now();
+        var beforeMutations = mutationRing.before(actionTime, BUFFER_WINDOW, MAX_MUTATIONS_PER_SIDE);
+		let mutationMs = performance.now() - mutationStart;
 
         // Wait for after-mutations to be recorded.
         setTimeout(function () {
-            var afterMutations = mutationBuffer.filter(function (record) {
-                return record.timestamp - actionTime <= BUFFER_WINDOW && record.timestamp - actionTime >= 0;
-            });
-
-			const MAX_MUTATIONS_PER_SIDE = 100;
-
-			if (beforeMutations.length > MAX_MUTATIONS_PER_SIDE) {
-				// keep the LAST `MAX` records (closest to the user action)
-				beforeMutations =
-				  beforeMutations.slice(-MAX_MUTATIONS_PER_SIDE);
-			  }
-			  if (afterMutations.length > MAX_MUTATIONS_PER_SIDE) {
-				// keep the FIRST `MAX` records (immediately after the action)
-				afterMutations =
-				  afterMutations.slice(0, MAX_MUTATIONS_PER_SIDE);
-			  }
+			mutationStart = performance.now();
+            var afterMutations = mutationRing.after(actionTime, BUFFER_WINDOW, MAX_MUTATIONS_PER_SIDE);
 
             // // Transform the raw mutation records to the loggable event format.
 			const beforeEventsRaw = beforeMutations.map(transformRecord).reduce((acc,item)=>{
@@ -525,6 +760,8 @@
 			allEvents.sort((a,b)=>scoreEvent(b)-scoreEvent(a));
 			allEvents = allEvents.slice(0, TopKEvents);
 
+			mutationMs += performance.now() - mutationStart;
+
 			if( (allEvents.length == 0)){
 				bestInteractiveElement.removeAttribute("ota-use-interactive-target");
 				return;
@@ -539,17 +776,21 @@
 				actionTimestamp: actionTime,
 				eventTarget: actionTarget,
 				allEvents: allEvents,
-				pageHTMLContent: getCurrentHTMLSanitized()
+				pageURL: window.location.href
 			};
 
-			bestInteractiveElement.removeAttribute("ota-use-interactive-target");
-
-			chrome.runtime.sendMessage({
-				type: 'send-summary-event',
-				summaryEvent: summaryEvent
-			  }, function(response) {
-				console.log("Response from background:", response);
-			  });
+			captureSnapshotIdle().then(({ html, stats }) => {
+				bestInteractiveElement.removeAttribute("ota-use-interactive-target");
+				summaryEvent.pageHTMLContent = html;
+				summaryEvent.recorderStats = recorderStats(stats, mutationMs);
+
+				chrome.runtime.sendMessage({
+					type: 'send-summary-event',
+					summaryEvent: summaryEvent
+				  }, function(response) {
+					console.log("Response from background:", response);
+				  });
+			});
 
             // Log the summary of mutations surrounding the user action.
 			if (allEvents.length > 0) {
@@ -559,9 +800,6 @@
 					}
 				});
 			  }
-
-            // Clear the buffer after processing.
-            mutationBuffer = [];
         }, BUFFER_WINDOW);
     }
 
@@ -597,32 +835,17 @@
 		actionTarget.target = trimTarget(bestInteractiveElement);
         var actionTime = Date.now();
 
-        // Get mutations that occurred within the BUFFER_WINDOW before the action.
-        var beforeMutations = mutationBuffer.filter(function (record) {
-            return actionTime - record.timestamp <= BUFFER_WINDOW && actionTime - record.timestamp >= 0;
-        });
+		const MAX_MUTATIONS_PER_SIDE = 30;
 
-        // Clear the buffer so we can capture after-mutations freshly.
-        mutationBuffer = [];
+        // Mutations within the BUFFER_WINDOW before the action, closest first kept.
+		let mutationStart = performance.now();
+        var beforeMutations = mutationRing.before(actionTime, BUFFER_WINDOW, MAX_MUTATIONS_PER_SIDE);
+		let mutationMs = performance.now() - mutationStart;
 
         // Wait for after-mutations to be recorded.
         setTimeout(function () {
-            var afterMutations = mutationBuffer.filter(function (record) {
-                return record.timestamp - actionTime <= BUFFER_WINDOW && record.timestamp - actionTime >= 0;
-            });
-
-			const MAX_MUTATIONS_PER_SIDE = 30;
-
-			if (beforeMutations.length > MAX_MUTATIONS_PER_SIDE) {
-				// keep the LAST `MAX` records (closest to the user action)
-				beforeMutations =
-				  beforeMutations.slice(-MAX_MUTATIONS_PER_SIDE);
-			  }
-			  if (afterMutations.length > MAX_MUTATIONS_PER_SIDE) {
-				// keep the FIRST `MAX` records (immediately after the action)
-				afterMutations =
-				  afterMutations.slice(0, MAX_MUTATIONS_PER_SIDE);
-			  }
+			mutationStart = performance.now();
+            var afterMutations = mutationRing.after(actionTime, BUFFER_WINDOW, MAX_MUTATIONS_PER_SIDE);
 
             // // Transform the raw mutation records to the loggable event format.
 			const beforeEventsRaw = beforeMutations.map(transformRecord).reduce((acc,item)=>{
@@ -644,6 +867,8 @@
 			allEvents.sort((a,b)=>scoreEvent(b)-scoreEvent(a));
 			allEvents = allEvents.slice(0, TopKEvents);
 
+			mutationMs += performance.now() - mutationStart;
+
 			sendToBG({ type: 'clear-events' });
 
 			var summaryEvent = {
@@ -653,17 +878,21 @@
 				actionTimestamp: actionTime,
 				eventTarget: actionTarget,
 				allEvents: allEvents,
-				pageHTMLContent: getCurrentHTMLSanitized()
+				pageURL: window.location.href
 			};
 
-			bestInteractiveElement.removeAttribute("ota-use-interactive-target");
-
-			chrome.runtime.sendMessage({
-				type: 'input-value-changed',
-				summaryEvent: summaryEvent
-			  }, function(response) {
-				console.log("Response from background:", response);
-			  });
+			captureSnapshotIdle().then(({ html, stats }) => {
+				bestInteractiveElement.removeAttribute("ota-use-interactive-target");
+				summaryEvent.pageHTMLContent = html;
+				summaryEvent.recorderStats = recorderStats(stats, mutationMs);
+
+				chrome.runtime.sendMessage({
+					type: 'input-value-changed',
+					summaryEvent: summaryEvent
+				  }, function(response) {
+					console.log("Response from background:", response);
+				  });
+			});
 
             // Log the summary of mutations surrounding the user action.
 			if (allEvents.length > 0) {
@@ -673,9 +902,6 @@
 					}
 				});
 			  }
-
-            // Clear the buffer after processing.
-            mutationBuffer = [];
         }, BUFFER_WINDOW);
     }
 
@@ -696,7 +922,7 @@
 
 			target.setAttribute("ota-use-interactive-target", "1");
 			actionTarget.target = trimTarget(target);
-			var sanitizedPageHTML = getCurrentHTMLSanitized();
+			var snapshot = captureSnapshotNow();
 			var summaryEvent = {
 				taskId: taskId,
 				eventHash: evHash,
@@ -704,7 +930,9 @@
 				actionTimestamp: Date.now(),
 				eventTarget: actionTarget,
 				allEvents: {},
-				pageHTMLContent: sanitizedPageHTML
+				pageURL: window.location.href,
+				pageHTMLContent: snapshot.html,
+				recorderStats: recorderStats(snapshot.stats, 0)
 			};
 
 		  // Send the click data to the background script.
@@ -827,6 +1055,7 @@
 		};
 	  
 		// Build your normal summaryEvent…
+		const snapshot = captureSnapshotNow();
 		const summaryEvent = {
 		  taskId: taskId,
 		  eventHash: getEventHash(),
@@ -834,7 +1063,9 @@
 		  actionTimestamp: Date.now(),
 		  eventTarget:     actionTarget,
 		  allEvents: detailedValues,
-		  pageHTMLContent: getCurrentHTMLSanitized()
+		  pageURL: window.location.href,
+		  pageHTMLContent: snapshot.html,
+		  recorderStats: recorderStats(snapshot.stats, 0)
 		};
 
 		chrome.runtime.sendMessage({ type: 'submit', summaryEvent });
@@ -867,6 +1098,13 @@
 		findShadowRoots(document).forEach(function (shadowRoot) {
 			observer.observe(shadowRoot, observerSettings);
 		});
+		snapshotObserver.disconnect();
+		invalidateSnapshot();
+		watchSnapshot(document);
+		findShadowRoots(document).forEach(watchSnapshot);
+		window.addEventListener('scroll', invalidateSnapshot, { capture: true, passive: true });
+		window.addEventListener('resize', invalidateSnapshot, { passive: true });
+		document.addEventListener('input', invalidateSnapshot, true);
 
 		document.addEventListener('click', debouncedClickHandler, true);
 		document.addEventListener('dblclick', dblClickHandler, true);
@@ -880,6 +1118,11 @@
 	function removeListeners(task_finish=false){
 		if(task_finish){ sendPageContentUpdatetoBackground("task-finish"); }
 		observer.disconnect();
+		snapshotObserver.disconnect();
+		invalidateSnapshot();
+		window.removeEventListener('scroll', invalidateSnapshot, { capture: true });
+		window.removeEventListener('resize', invalidateSnapshot);
+		document.removeEventListener('input', invalidateSnapshot, true);
 		document.removeEventListener('click', debouncedClickHandler, true);
 		document.removeEventListener('dblclick', dblClickHandler, true);
 		document.removeEventListener('submit', submitHandler, true);
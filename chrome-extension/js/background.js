@@ -38,23 +38,232 @@
 	});
 	
 
+	/* -------------------------------------------------------------------
+	 * Upload buffer
+	 *
+	 * Events leaving the de-dupe queue get a per-task `clientSeq` and are
+	 * persisted in chrome.storage.local (one key per event, so a service
+	 * worker restart does not lose them).  The buffer is flushed in order as
+	 * one gzip NDJSON request to /action-data/batch once it holds
+	 * FLUSH_MAX_EVENTS events / FLUSH_MAX_BYTES bytes or FLUSH_MS after the
+	 * first buffered event.  An event leaves the buffer only once the
+	 * collector acks its clientSeq (written, or dropped as a duplicate) or
+	 * rejects it; the rest is sent again and the collector skips what it
+	 * already has.  Failed uploads are retried with exponential backoff,
+	 * except a 400 (undecodable body, dropped) and a 413 (batch split).
+	 * ----------------------------------------------------------------- */
+	const BUFFER_PREFIX     = 'otaUpload:';
+	const SEQ_KEY           = 'otaUploadSeq';
+	const FLUSH_MS          = 2000;
+	const FLUSH_MAX_EVENTS  = 50;
+	const FLUSH_MAX_BYTES   = 2 * 1024 * 1024;
+	const RETRY_BASE_MS     = 1000;
+	const RETRY_MAX_MS      = 60000;
+
+	let uploadBuffer   = [];          // [{key, body, taskId, clientSeq, html?}] in buffering order
+	let bufferedBytes  = 0;
+	let uploadSeq      = { next: 0, byTask: {} };   // next storage key, next clientSeq per task
+	let flushTimer     = null;
+	let flushing       = false;
+	let retryAttempt   = 0;
+	let batchLimit     = FLUSH_MAX_EVENTS;          // halved on 413, grows back after each success
+
+	/* Snapshots: task-start and navigation events carry the whole page, the
+	 * others only a splice of the previous snapshot uploaded for the task
+	 * (`pageHTMLDelta`: base hash, UTF-16 start/end in the base, inserted
+	 * text, hash of the result).  The collector rebuilds the page; when it
+	 * cannot, it lists the task under `resync` and does not ack the event, so
+	 * the unacked events of the task are sent again whole (`asKeyframes`).
+	 * Their pages are kept in memory only (`html`): after a service worker
+	 * restart such an event is sent without its page. */
+	const KEYFRAME_TYPES     = new Set(['task-start', 'go-back-or-forward']);
+	const lastSnapshotByTask = {};    // taskId → {html, hash} of the last uploaded snapshot
+
+	const bufferReady = chrome.storage.local.get(null).then(items => {
+		if (items[SEQ_KEY]) { uploadSeq = items[SEQ_KEY]; }
+		uploadBuffer = Object.keys(items)
+			.filter(key => key.startsWith(BUFFER_PREFIX))
+			.sort()                                        // zero-padded keys sort in buffering order
+			.map(key => {
+				const { taskId, clientSeq } = JSON.parse(items[key]);
+				return { key, body: items[key], taskId, clientSeq };
+			});
+		bufferedBytes = uploadBuffer.reduce((n, item) => n + item.body.length, 0);
+		if (uploadBuffer.length) {
+			console.log(`[OTA DOM Background]: ${uploadBuffer.length} buffered event(s) restored, flushing`);
+			scheduleFlush(0);
+		}
+	});
+
+	async function sha256Hex(text){
+		const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+		return [...new Uint8Array(digest)].map(b => b.toString(16).padStart(2, '0')).join('');
+	}
+
+	function spliceOf(base, html){
+		const max = Math.min(base.length, html.length);
+		let start = 0;
+		while (start < max && base.charCodeAt(start) === html.charCodeAt(start)) { start++; }
+		let tail = 0;
+		while (tail < max - start &&
+			   base.charCodeAt(base.length - 1 - tail) === html.charCodeAt(html.length - 1 - tail)) { tail++; }
+		// never cut a surrogate pair in half
+		const isHigh = c => c >= 0xD800 && c <= 0xDBFF;
+		const isLow  = c => c >= 0xDC00 && c <= 0xDFFF;
+		if (start > 0 && isHigh(html.charCodeAt(start - 1))) { start--; }
+		if (tail > 0 && isLow(html.charCodeAt(html.length - tail))) { tail--; }
+		return { start, end: base.length - tail, text: html.slice(start, html.length - tail) };
+	}
+
+	async function encodeSnapshot(data){
+		const html = data.pageHTMLContent;
+		if (typeof html !== 'string') { return data; }
+
+		const taskId = data.taskId;
+		const hash   = await sha256Hex(html);
+		const last   = lastSnapshotByTask[taskId];
+		lastSnapshotByTask[taskId] = { html, hash };
+		if (data.type === 'task-finish') { delete lastSnapshotByTask[taskId]; }
+
+		if (!last || KEYFRAME_TYPES.has(data.type)) { return data; }
+		const splice = spliceOf(last.html, html);
+		if (splice.text.length > html.length / 2) { return data; }      // mostly a new page
+
+		const { pageHTMLContent, ...rest } = data;
+		return { ...rest, pageHTMLDelta: { base: last.hash, hash, ...splice } };
+	}
+
+	let bufferChain = bufferReady;    // keeps buffering (and clientSeq) in call order
+
 	function sendDataToCollectorServer(data){
-		const url = `http://${collectorHost}:${collectorPort}/action-data`;
-		// Optionally send a response back.
-		fetch(url, {
-			method: 'POST',
-			headers: {
-				'Content-Type': 'application/json'
-			},
-			body: JSON.stringify(data)
-			})
-			.then(response => response.json())
-			.then(data => {
-			console.log("[OTA DOM Background]: Data sent to server successfully:", data);
-			})
-			.catch(err => {
-			console.error("[OTA DOM Background]: Error sending data to server:", err);
+		bufferChain = bufferChain.then(() => bufferEvent(data)).catch(err => {
+			console.error("[OTA DOM Background]: Error buffering event:", err);
+		});
+	}
+
+	// the collector could not rebuild a snapshot of taskId: send its buffered deltas as whole pages
+	function asKeyframes(taskId, done){
+		for (const item of uploadBuffer) {
+			if (item.taskId !== taskId || done.has(item)) { continue; }
+			const { pageHTMLDelta, ...rest } = JSON.parse(item.body);
+			if (!pageHTMLDelta) { continue; }
+			const body = JSON.stringify(item.html !== undefined ? { ...rest, pageHTMLContent: item.html } : rest);
+			bufferedBytes += body.length - item.body.length;
+			item.body = body;
+			delete item.html;
+			chrome.storage.local.set({ [item.key]: body });
+		}
+	}
+
+	async function bufferEvent(data){
+		const html = data.pageHTMLContent;
+		data = await encodeSnapshot(data);
+		const taskId    = data.taskId;
+		const clientSeq = uploadSeq.byTask[taskId] || 0;
+		uploadSeq.byTask[taskId] = clientSeq + 1;
+
+		const key  = BUFFER_PREFIX + String(uploadSeq.next++).padStart(12, '0');
+		const body = JSON.stringify({ ...data, clientSeq });
+		const item = { key, body, taskId, clientSeq };
+		if (data.pageHTMLDelta) { item.html = html; }      // to resend it whole if the collector asks
+		uploadBuffer.push(item);
+		bufferedBytes += body.length;
+		chrome.storage.local.set({ [key]: body, [SEQ_KEY]: uploadSeq });
+
+		const urgent = data.type === 'submit' || data.type === 'task-finish';
+		if (urgent || uploadBuffer.length >= FLUSH_MAX_EVENTS || bufferedBytes >= FLUSH_MAX_BYTES) {
+			scheduleFlush(0);
+		} else {
+			scheduleFlush(FLUSH_MS);
+		}
+	}
+
+	function scheduleFlush(delay){
+		if (flushing) { return; }                          // the running flush reschedules itself
+		if (flushTimer !== null) {
+			if (delay > 0) { return; }                     // keep the earlier deadline
+			clearTimeout(flushTimer);
+		}
+		flushTimer = setTimeout(flushUploadBuffer, delay);
+	}
+
+	async function gzipBody(text){
+		const stream = new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'));
+		return new Response(stream).arrayBuffer();
+	}
+
+	async function flushUploadBuffer(){
+		flushTimer = null;
+		if (flushing || !uploadBuffer.length) { return; }
+		flushing = true;
+
+		// take a prefix of the buffer so the collector receives events in clientSeq order
+		const batch = [];
+		let bytes = 0;
+		for (const item of uploadBuffer) {
+			if (batch.length && (batch.length >= batchLimit || bytes + item.body.length > FLUSH_MAX_BYTES)) { break; }
+			batch.push(item);
+			bytes += item.body.length;
+		}
+
+		let retryAfterMs = null;
+		try {
+			const url = `http://${collectorHost}:${collectorPort}/action-data/batch`;
+			const response = await fetch(url, {
+				method: 'POST',
+				headers: {
+					'Content-Type': 'application/x-ndjson',
+					'Content-Encoding': 'gzip'
+				},
+				body: await gzipBody(batch.map(item => item.body).join('\n'))
 			});
+			let done = [];
+			let nextDelay = 0;
+			if (response.ok) {
+				const result = await response.json().catch(() => ({}));
+				console.log("[OTA DOM Background]: Data sent to server successfully:", result);
+				const acked    = result.acked || {};
+				const rejected = new Set((result.rejected || []).map(item => item.index));
+				done = batch.filter((item, index) =>
+					rejected.has(index) || (acked[item.taskId] || []).includes(item.clientSeq));
+				for (const taskId of result.resync || []) {
+					delete lastSnapshotByTask[taskId];
+					asKeyframes(taskId, new Set(done));
+				}
+				// not acked yet: still held or queued by the collector, send again later
+				if (done.length < batch.length) { nextDelay = FLUSH_MS; }
+				batchLimit = Math.min(FLUSH_MAX_EVENTS, batchLimit * 2);
+			} else if (response.status === 413 && batch.length > 1) {
+				batchLimit = Math.max(1, Math.ceil(batch.length / 2));
+				console.warn(`[OTA DOM Background]: Batch too large, retrying ${batchLimit} event(s) at a time`);
+			} else if (response.status === 400 || response.status === 413) {
+				// the collector will never accept this body: do not retry it forever
+				const result = await response.json().catch(() => ({}));
+				console.error("[OTA DOM Background]: Server rejected batch, dropping it:", response.status, result);
+				done = batch;
+			} else {
+				const retryAfter = Number(response.headers.get('Retry-After'));
+				if (retryAfter > 0) { retryAfterMs = retryAfter * 1000; }
+				throw new Error(`HTTP ${response.status}`);
+			}
+			if (done.length) {
+				const gone = new Set(done);
+				uploadBuffer = uploadBuffer.filter(item => !gone.has(item));
+				bufferedBytes -= done.reduce((n, item) => n + item.body.length, 0);
+				chrome.storage.local.remove(done.map(item => item.key));
+			}
+			retryAttempt = 0;
+			flushing = false;
+			if (uploadBuffer.length) { scheduleFlush(nextDelay); }
+			return;
+		} catch (err) {
+			retryAttempt += 1;
+			const backoff = Math.min(RETRY_MAX_MS, RETRY_BASE_MS * 2 ** (retryAttempt - 1));
+			const delay   = Math.max(retryAfterMs || 0, backoff * (0.5 + Math.random() / 2));
+			console.error(`[OTA DOM Background]: Error sending data to server, retry #${retryAttempt} in ${Math.round(delay)} ms:`, err);
+			flushing = false;
+			flushTimer = setTimeout(flushUploadBuffer, delay);
+		}
 	}
 
 
@@ -303,6 +512,7 @@
 					target: details.url
 				},
 				allEvents: "",
+				pageURL: details.url,
 				pageHTMLContent: pageContentStore[tabId]
 			};
 			// sendDataToCollectorServer(summaryEvent);
@@ -290,6 +290,43 @@ function getVisibleHTML(viewportExpansion = 0) {
 }
 
 
+/**
+ * Incremental version of `getVisibleHTML` for idle-time capture.
+ *
+ * A generator that builds the same visible clone as `cloneVisible`, but
+ * iteratively and yielding every `stepSize` nodes, so the caller can spread
+ * the walk over several idle periods.  Returns the (masked) clone of the
+ * document element rather than its HTML string.
+ *
+ * @param {number} viewportExpansion - How much extra area to consider as visible.
+ * @param {number} stepSize - Number of nodes visited between two yields.
+ */
+function* visibleCloneSteps(viewportExpansion = 0, stepSize = 200) {
+	DOM_CACHE.clearCache();
+	const root = document.documentElement.cloneNode(false);
+	const stack = [[document.documentElement, root]];
+	let visited = 0;
+
+	while (stack.length) {
+		const [node, clone] = stack.pop();
+		node.childNodes.forEach(child => {
+			if (child.nodeType === Node.TEXT_NODE) {
+				if (child.textContent.trim()) { clone.appendChild(child.cloneNode(false)); }
+			} else if (child.nodeType === Node.ELEMENT_NODE && isInExpandedViewport(child, viewportExpansion)) {
+				const childClone = child.cloneNode(false);
+				clone.appendChild(childClone);          // appended now: document order is kept
+				stack.push([child, childClone]);
+			}
+		});
+		visited += 1;
+		if (visited % stepSize === 0) { yield; }
+	}
+
+	if (MASK_DATA) { maskNode(root); }
+	return root;
+}
+
+
 function getUniqueIdentifierForInput(element) {
 	let uid = element.getAttribute(OTA_INPUT_ELEMENT_UNIQUE_ID_PREFIX);
 	if (!uid) {
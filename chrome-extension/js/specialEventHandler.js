@@ -57,6 +57,7 @@ register(/(^|\.)google\.[a-z.]+$/, ({
 	  actionTimestamp: Date.now(),
 	  eventTarget    : actionTarget,
 	  allEvents      : {},                          // nothing to diff for a submit
+	  pageURL        : location.href,
 	  pageHTMLContent: getCurrentHTMLSanitized()
 	};
   
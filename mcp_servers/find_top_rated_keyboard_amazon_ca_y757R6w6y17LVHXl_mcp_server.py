@@ -1,38 +1,37 @@
+import json
+import os
 
 from mcp.server.fastmcp import FastMCP
 import httpx
 
 mcp = FastMCP("find a top rated keyboard on amazon.ca")
 
+REPLAY_SERVICE = os.getenv("OTA_REPLAY_SERVICE", "http://localhost:3089")
+
+
+async def run_replay(file_path: str) -> str:
+    """Queue a replay on the replay service (wap_service.py) and wait for its result."""
+    async with httpx.AsyncClient(base_url=REPLAY_SERVICE, timeout=90.0) as client:
+        response = await client.post("/jobs", json={"model": "openai", "file_path": file_path})
+        if response.status_code != 202:
+            return response.text
+        job = response.json()
+        while job["status"] in ("queued", "running"):
+            response = await client.get(f"/jobs/{job['id']}", params={"wait": 55})
+            if response.status_code != 200:        # e.g. 404 once the service restarted
+                return response.text
+            job = response.json()
+        return json.dumps({"status": job["status"], "result": job["result"], "error": job["error"]})
+
 @mcp.tool()
 async def find_top_rated_keyboard_amazon_ca_smart_replay() -> str:
     """smart replay: find a top rated keyboard on amazon.ca"""
-    async with httpx.AsyncClient(timeout=600.0) as client:
-        response = await client.get(
-            "http://localhost:3089/replay",
-            params={
-                "concurrent": 1,
-                "model": "openai",
-                "file_path": 'data_processed/smart_replay/wap_smart_replay_list_y757R6w6y17LVHXl.json'
-            }
-        )
-        return response.text
-    return "FAILED"
+    return await run_replay('data_processed/smart_replay/wap_smart_replay_list_y757R6w6y17LVHXl.json')
 
 @mcp.tool()
 async def find_top_rated_keyboard_amazon_ca_exact_replay() -> str:
     """exact replay: find a top rated keyboard on amazon.ca"""
-    async with httpx.AsyncClient(timeout=600.0) as client:
-        response = await client.get(
-            "http://localhost:3089/replay",
-            params={
-                "concurrent": 1,
-                "model": "openai",
-                "file_path": 'data_processed/exact_replay/wap_exact_replay_list_y757R6w6y17LVHXl.json'
-            }
-        )
-        return response.text
-    return "FAILED"
+    return await run_replay('data_processed/exact_replay/wap_exact_replay_list_y757R6w6y17LVHXl.json')
 
 if __name__ == "__main__":
     mcp.run(transport="stdio")
@@ -10,13 +10,16 @@ from pathlib import Path
 from typing import Generator, Literal, TypedDict, Dict
 import traceback
 
-from browser_use import Agent, Browser, BrowserConfig
+from browser_use import Agent, Browser, BrowserConfig, Controller
 from browser_use.browser.context import BrowserContextConfig
 from dotenv import load_dotenv
 from langchain_anthropic import ChatAnthropic
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
 from langchain_ollama import ChatOllama
 from pydantic import SecretStr
+from utils.llm import aclose_chat_models, get_chat_model
+from utils.llm_usage import Usage
+from utils.tokenizer import count_tokens
 
 load_dotenv()
 
@@ -107,14 +110,95 @@ def get_llm_model_generator(
             yield east_us_2.model  # 450
             yield west_us.model  # 450
         elif model_provider == "openai":
-            llm = ChatOpenAI(model="gpt-4o", temperature=0)
-            yield llm
+            # shared client: keeps its HTTP connections across tasks
+            yield get_chat_model("gpt-4o", temperature=0)
         elif model_provider == "ollama":
             llm = ChatOllama(model="ota-preview-v16", num_ctx=20000,temperature=0)
             yield llm
         else:
             raise ValueError(f"Invalid model provider: {model_provider}")
 
+def make_browser() -> Browser:
+    """A browser configured for replays."""
+    return Browser(
+        config=BrowserConfig(
+            # headless=True,
+            headless=False,
+            disable_security=True,
+            new_context_config=BrowserContextConfig(
+                disable_security=True,
+                wait_for_network_idle_page_load_time=5,
+                maximum_wait_page_load_time=20,
+                # no_viewport=True,
+                browser_window_size={
+                    "width": 1280,
+                    "height": 1100,
+                },
+            ),
+        )
+    )
+
+def write_usage(path: Path, task_id: str, history, usage) -> None:
+    """Per-step and per-task LLM tokens and cost of a replay, next to history.json."""
+    steps = [{"step": h.metadata.step_number, "input_tokens": h.metadata.input_tokens,
+              "output_tokens": h.metadata.output_tokens, "cost_usd": round(h.metadata.cost, 6)}
+             for h in history.history if h.metadata]
+    path.write_text(json.dumps({"task_id": task_id, **usage.as_dict(), "steps": steps}, indent=2), encoding="utf-8")
+    print(f"[OTA Info] task {task_id}: {usage.input_tokens} input + {usage.output_tokens} output tokens "
+          f"in {usage.calls} LLM calls, ${usage.cost:.4f}")
+
+def load_replay_list(replay_list: Dict) -> tuple[list[dict], list[dict]]:
+    """(subgoal list, exact action list) of a WAP replay list, by its replay mode."""
+    replay_mode = replay_list["type"]
+    if replay_mode == "smart_replay":
+        return replay_list["subgoal_list"], []
+    if replay_mode == "exact_replay":
+        return [], replay_list["action_list"]
+    raise Exception("Error setting WAP replay mode, no mode type: ", replay_mode)
+
+async def replay_task(
+    replay_list: Dict,
+    client: AzureChatOpenAI | ChatAnthropic | ChatOpenAI,
+    results_dir: Path,
+    browser: Browser,
+    on_step_end=None,
+) -> Dict:
+    """Replay one WAP replay list in *browser* and save its history and usage
+    under *results_dir*/<task_id>.  The browser is left open, so a caller can
+    run the next task in it (the agent only closes its own context)."""
+    task_dir = results_dir / f"{replay_list['task_id']}"
+    task_dir.mkdir(parents=True, exist_ok=True)
+    subgoal_list, exact_replay_list = load_replay_list(replay_list)
+
+    usage = Usage()                     # every LLM call of the task, page extraction included
+    agent = Agent(
+        task=replay_list["ultimate_goal"],
+        llm=client,
+        browser=browser,
+        controller=Controller(token_counter=count_tokens, usage_recorder=usage),
+        token_counter=count_tokens,
+        usage_recorder=usage,
+        validate_output=True,
+        generate_gif=False,
+        use_vision=False,
+        subgoal_list=subgoal_list,
+        exact_replay_list=exact_replay_list,
+        replay_mode=replay_list["type"]
+    )
+    history = await agent.run(max_steps=20, on_step_end=on_step_end)
+    history.save_to_file(task_dir / "history.json")
+    write_usage(task_dir / "usage.json", replay_list["task_id"], history, agent.usage)
+    return {
+        "task_id": replay_list["task_id"],
+        "is_done": history.is_done(),
+        "is_successful": history.is_successful(),
+        "final_result": history.final_result(),
+        "errors": [e for e in history.errors() if e],
+        "steps": history.number_of_steps(),
+        "usage": agent.usage.as_dict(),
+        "history_path": str(task_dir / "history.json"),
+    }
+
 async def process_single_task(
     replay_list: Dict,
     client: AzureChatOpenAI | ChatAnthropic | ChatOpenAI,
@@ -122,39 +206,12 @@ async def process_single_task(
     browser: Browser,
 ) -> None:
     """Process a single task asynchronously."""
-    # task_str = f"{task['ques']} on {task['web']}"
-    task_str = replay_list["ultimate_goal"]
     task_dir = results_dir / f"{replay_list['task_id']}"
-    replay_mode = replay_list["type"]
-    task_dir.mkdir(exist_ok=True)
-    subgoal_list: list[dict] = []
-    exact_replay_list: list[dict] = []
 
     try:
         if not (task_dir / "task_result.json").exists():
             logging.getLogger("browser_use").setLevel(logging.INFO)
-            
-            ### Load WAP files ###
-            if replay_mode == "smart_replay":
-                    subgoal_list = replay_list["subgoal_list"]
-            elif replay_mode == "exact_replay":
-                    exact_replay_list = replay_list["action_list"]
-            else:
-                raise Exception("Error setting WAP replay mode, no mode type: ", replay_mode)
-
-            agent = Agent(
-                task=task_str,
-                llm=client,
-                browser=browser,
-                validate_output=True,
-                generate_gif=False,
-                use_vision=False,
-                subgoal_list=subgoal_list,
-                exact_replay_list=exact_replay_list,
-                replay_mode=replay_mode
-            )
-            history = await agent.run(max_steps=20)
-            history.save_to_file(task_dir / "history.json")
+            await replay_task(replay_list, client, results_dir, browser)
 
     except Exception as e:
         logging.error(f"Error processing task {replay_list['task_id']}: {str(e)}")
@@ -190,23 +247,7 @@ async def main(max_concurrent_tasks: int,
                 print(f"\n=== Now at task {replay_list['task_id']} ===")
 
                 # Create browser instance inside the semaphore block
-                browser = Browser(
-                    config=BrowserConfig(
-                        # headless=True,
-                        headless=False,
-                        disable_security=True,
-                        new_context_config=BrowserContextConfig(
-                            disable_security=True,
-                            wait_for_network_idle_page_load_time=5,
-                            maximum_wait_page_load_time=20,
-                            # no_viewport=True,
-                            browser_window_size={
-                                "width": 1280,
-                                "height": 1100,
-                            },
-                        ),
-                    )
-                )
+                browser = make_browser()
                 await process_single_task(
                     replay_list,
                     client,
@@ -232,6 +273,7 @@ async def main(max_concurrent_tasks: int,
         logging.error(f"Main loop error: {e}")
     finally:
         # Cleanup code here
+        await aclose_chat_models()
         logging.info("Shutting down...")
 
 
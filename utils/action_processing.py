@@ -1,11 +1,23 @@
-import json, re, sys
-from typing import Any, Dict
+import json, mmap, re, sys
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from utils.html_cleaner import run_html_sanitizer
-from jinja2 import Template
+from utils.page_pruning import DEFAULT_TOKEN_BUDGET, prune_page
+from utils.tokenizer import count_tokens
+from utils.snapshot_store import SnapshotStore, resolve_page_html, resolve_event_snapshot
+from utils.event_catalog import EventCatalog
+from utils.event_log import iter_task_events, iter_task_headers, read_task_event
+from utils.event_schema import decode_event_header, decode_event_json
+from jinja2 import Environment, FileSystemLoader, Template
 from pathlib import Path
 
 TEMPLATE_DIR = Path("prompts/subgoal_generation")
 
+# prune/sanitize rounds to bring page_content under the token budget
+PRUNE_ATTEMPTS = 3
+
+# templates are compiled on first use and kept for the life of the process
+_TEMPLATE_ENV = Environment(loader=FileSystemLoader(str(TEMPLATE_DIR)), auto_reload=False)
+
 def choose_template(action_type: str) -> Path:
     """Return the correct template file for a given action_type."""
     match action_type:
@@ -21,13 +33,22 @@ def choose_template(action_type: str) -> Path:
             return TEMPLATE_DIR / "common.md"
 
 
-def extract_action_bundle(raw: Dict[str, Any], sanitize: bool = False) -> Dict[str, Any]:
+def extract_action_bundle(raw: Dict[str, Any], sanitize: bool = False,
+                          snapshots: Optional[SnapshotStore] = None,
+                          token_budget: int = DEFAULT_TOKEN_BUDGET) -> Dict[str, Any]:
     """
     Split the incoming JSON dict into:
         action         {type, eventTarget}
         change_events  list from `allEvents`
         page_content   sanitized or raw HTML
 
+    Events whose snapshot lives in the blob store (`pageHTMLRef`) are
+    resolved through *snapshots*.  With a positive *token_budget*
+    (``OTA_PAGE_TOKEN_BUDGET``; default 0, the whole page is kept) the page
+    is pruned to the region around the event target and changed elements,
+    then pruned harder while the result exceeds *token_budget* tokens by
+    `utils.tokenizer.count_tokens`.
+
     Returns a dict with those keys.
     """
     # 1. Top‑level type + eventTarget
@@ -43,14 +64,28 @@ def extract_action_bundle(raw: Dict[str, Any], sanitize: bool = False) -> Dict[s
         change_events = "[changes not available]"
 
     # 3. Page HTML
-    page_html = raw.get("pageHTMLContent", "")
+    def clean(page_html: str) -> str:
+        # Use prettify to format the HTML.
+        if sanitize:
+            # Use the top‑level type to decide how to sanitize, if desired.
+            page_html = run_html_sanitizer(page_html, action["type"] or "")
+        return re.sub(r'[\n\r\t\\]+', '', page_html)
 
-    # Use prettify to format the HTML.
-    if sanitize:
-        # Use the top‑level type to decide how to sanitize, if desired.
-        page_html = run_html_sanitizer(page_html, action["type"] or "")
-
-    page_html = re.sub(r'[\n\r\t\\]+', '', page_html)
+    full_page = resolve_page_html(raw, snapshots)
+    if token_budget <= 0:                       # pruning off: one pass, nothing to count
+        page_html = clean(full_page)
+    else:
+        budget, best = token_budget, None
+        for _ in range(PRUNE_ATTEMPTS):
+            page_html = clean(prune_page(full_page, raw, budget))
+            # pruning estimates; the tokenizer decides whether the result fits
+            tokens = count_tokens(page_html)
+            if best is None or tokens < best[0]:
+                best = (tokens, page_html)
+            if tokens <= token_budget:
+                break
+            budget = max(1, int(budget * token_budget / tokens * 0.95))     # 0 would mean "keep everything"
+        page_html = best[1]
     return {
         "action_type": raw.get("type"),
         "action": action,
@@ -59,9 +94,25 @@ def extract_action_bundle(raw: Dict[str, Any], sanitize: bool = False) -> Dict[s
     }
 
 
-def generate_subgoal_speculate_prompt(summary_event: Dict[str, Any], ultimate_goal: str, subtask_name: str, output_path: str) -> None:
+def load_template(action_type: str) -> Template:
+    """Compiled template of *action_type* (see `choose_template`)."""
+    return _TEMPLATE_ENV.get_template(choose_template(action_type).name)
+
+
+def render_batch_prompt(prompts: List[str]) -> str:
+    """Pack several sub-goal prompts into one request asking for a JSON array (batch.md)."""
+    return _TEMPLATE_ENV.get_template("batch.md").render(prompts=prompts)
+
+
+def prompt_file_name(subtask_name: str, action_type: Optional[str]) -> str:
+    return f"subgoal_{subtask_name}_{action_type}.md"
+
+
+def render_subgoal_prompt(summary_event: Dict[str, Any], ultimate_goal: str,
+                          snapshots: Optional[SnapshotStore] = None) -> Tuple[Optional[str], str]:
+    """Return (action_type, prompt) of the sub-goal prompt of *summary_event*."""
     # 1) bundle relevant pieces
-    grouped_items = extract_action_bundle(summary_event, True)
+    grouped_items = extract_action_bundle(summary_event, True, snapshots)
     # 2) prepare the data that the template expects
     context = {
         "ultimate_goal": ultimate_goal,
@@ -69,15 +120,42 @@ def generate_subgoal_speculate_prompt(summary_event: Dict[str, Any], ultimate_go
         "change_events":  grouped_items["change_events"],
         "page_content": grouped_items["page_content"],
     }
+    # 3) render with the compiled template
+    prompt = load_template(grouped_items["action_type"]).render(**context)
+    return grouped_items["action_type"], prompt
 
-    template = choose_template(grouped_items["action_type"])
-    template_text = template.read_text(encoding="utf-8")
-    filled_markdown = Template(template_text).render(**context)
 
-    # 4) save to  subgoals/subgoal_<YYYYMMDD_HHMMSS>.md
+def iter_subgoal_prompts(data_dir: str | Path, ultimate_goal: str,
+                         dump_dir: Optional[str | Path] = None,
+                         skip: Optional[Callable[[str, Dict[str, Any]], bool]] = None,
+                         ) -> Iterator[Tuple[str, str]]:
+    """Yield (prompt_name, prompt) for every recorded event of *data_dir*, in order.
+
+    *prompt_name* is the file name the prompt has on disk; the prompts are
+    only written (to *dump_dir*) when one is given, as a debug artifact.
+    Events for which ``skip(prompt_name, event)`` is true are not rendered
+    (see `utils.rule_subgoals.RuleSubgoals`).
+    """
+    if dump_dir is not None:
+        dump_dir = Path(dump_dir)
+        dump_dir.mkdir(parents=True, exist_ok=True)
+    for name, summary_event in iter_task_events(Path(data_dir)):
+        if skip is not None and skip(prompt_file_name(name, summary_event.get("type")), summary_event):
+            continue
+        action_type, prompt = render_subgoal_prompt(summary_event, ultimate_goal)
+        prompt_name = prompt_file_name(name, action_type)
+        if dump_dir is not None:
+            (dump_dir / prompt_name).write_text(prompt, encoding="utf-8")
+        yield prompt_name, prompt
+
+
+def generate_subgoal_speculate_prompt(summary_event: Dict[str, Any], ultimate_goal: str, subtask_name: str, output_path: str) -> Path:
+    action_type, filled_markdown = render_subgoal_prompt(summary_event, ultimate_goal)
+
+    # 4) save to  subgoals/subgoal_<event name>_<action type>.md
     output_dir = Path(output_path)
     output_dir.mkdir(parents=True, exist_ok=True)
-    out_path = output_dir / f"subgoal_{subtask_name}_{grouped_items['action_type']}.md"
+    out_path = output_dir / prompt_file_name(subtask_name, action_type)
     out_path.write_text(filled_markdown, encoding="utf-8")
 
     return out_path
@@ -85,7 +163,24 @@ def generate_subgoal_speculate_prompt(summary_event: Dict[str, Any], ultimate_go
 # ---------------------------------------------------------------------------
 # helper: locate exactly one task-start file and return its taskDescription
 # ---------------------------------------------------------------------------
-def find_task_prompt(data_dir: str | Path) -> str:
+def _task_prompt_from_catalog(data_dir: Path, catalog: EventCatalog):
+    """Indexed lookup of (taskDescription, taskId); None if the folder is not cataloged."""
+    rows = catalog.task_start_rows(data_dir)
+    if not rows:
+        return None
+    if rows[0]["type"] != "task-start":
+        sys.exit("[OTA error] first recorded event is not a task-start record")
+    task_starts = [r for r in rows if r["type"] == "task-start"]
+    if len(task_starts) > 1:
+        names = ", ".join(f"seq {r['seq']}" for r in task_starts)
+        sys.exit(f"[OTA error] multiple task-start files detected: {names}")
+    row = task_starts[0]
+    if not row["task_description"] or not row["task_id"]:
+        return None
+    return row["task_description"], row["task_id"]
+
+
+def find_task_prompt(data_dir: str | Path, catalog: Optional[EventCatalog] = None) -> str:
     data_dir = Path(data_dir)
 
     # 0️⃣  Does the path exist?
@@ -96,42 +191,135 @@ def find_task_prompt(data_dir: str | Path) -> str:
     if not data_dir.is_dir():
         sys.exit(f"[OTA error] path is not a directory: {data_dir}")
 
-    # 1️⃣  Gather every *.json recursively (sub-folders included)
-    json_paths = sorted(data_dir.rglob("*.json"))
-    if not json_paths:
-        sys.exit(f"[OTA error] no *.json files found under {data_dir}")
-
-    # 2️⃣  First file (by name) must be task-start
-    first = json.loads(json_paths[0].read_text(encoding="utf-8"))
-    if first.get("type") != "task-start":
-        sys.exit("[OTA error] first JSON file is not a task-start record")
-
-    # 3️⃣  Collect *all* task-start files
-    task_start_files = [
-        p for p in json_paths
-        if json.loads(p.read_text(encoding="utf-8")).get("type") == "task-start"
-    ]
-    if len(task_start_files) == 0:
+    # 0️⃣c Indexed lookup when the data tree has a catalog
+    catalog = catalog or EventCatalog.locate(data_dir)
+    if catalog is not None:
+        found = _task_prompt_from_catalog(data_dir, catalog)
+        if found is not None:
+            return found
+
+    # 1️⃣  Gather every event header (index of the event log, or *.json files)
+    headers = list(iter_task_headers(data_dir))
+    if not headers:
+        sys.exit(f"[OTA error] no recorded events found under {data_dir}")
+
+    # 2️⃣  First event must be task-start
+    if headers[0].get("type") != "task-start":
+        sys.exit("[OTA error] first recorded event is not a task-start record")
+
+    # 3️⃣  Collect *all* task-start events
+    task_start_headers = [h for h in headers if h.get("type") == "task-start"]
+    if len(task_start_headers) == 0:
         sys.exit("[OTA error] no task-start file found")
-    if len(task_start_files) > 1:
-        names = ", ".join(p.name for p in task_start_files)
+    if len(task_start_headers) > 1:
+        names = ", ".join(h["name"] for h in task_start_headers)
         sys.exit(f"[OTA error] multiple task-start files detected: {names}")
 
-    # 4️⃣  Extract taskDescription
-    task_json = json.loads(task_start_files[0].read_text(encoding="utf-8"))
+    # 4️⃣  Extract taskDescription (header-only read, the page is never decoded)
+    start = task_start_headers[0]
+    if "path" in start:
+        task_json = read_event_header(start["path"], ("taskId", "taskDescription"))
+    else:
+        task_json = read_task_event(data_dir, start, resolve_snapshot=False)
     task_id   = task_json.get("taskId")
     task_desc = task_json.get("taskDescription")
     if not task_desc or not task_id:
-        sys.exit(f"[OTA error] task-start file {task_start_files[0].name} "
+        sys.exit(f"[OTA error] task-start file {task_start_headers[0]['name']} "
                  "has no taskDescription or taskId")
 
     return task_desc, task_id
 
 
-def load_event_json(path: str | Path) -> Dict[str, Any]:
-    """Read the given JSON file and return it as a Python dict."""
+def load_event_json(path: str | Path, resolve_snapshot: bool = True) -> Dict[str, Any]:
+    """Read the given JSON file, validate it against the event schema and
+    return it as a Python dict.
+
+    If the event only holds a `pageHTMLRef`, the snapshot is read back from
+    the blob store next to the data tree and put under `pageHTMLContent`.
+    """
     path = Path(path)
     if not path.is_file():
         raise FileNotFoundError(f"Cannot find JSON file: {path}")
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
\ No newline at end of file
+    event = decode_event_json(path.read_bytes())
+    return resolve_event_snapshot(event, path) if resolve_snapshot else event
+
+# ---------------------------------------------------------------------------
+# header-only reader: pull small top-level fields without decoding the page
+# ---------------------------------------------------------------------------
+HEADER_FIELDS = ("taskId", "eventHash", "taskDescription", "type", "actionTimestamp")
+
+_WS_RX     = re.compile(rb"[ \t\n\r]*")
+_STRING_RX = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_SCALAR_RX = re.compile(rb"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+_NESTED_RX = re.compile(rb'["{}\[\]]')
+
+
+def _skip_ws(buf, pos: int) -> int:
+    return _WS_RX.match(buf, pos).end()
+
+
+def _value_end(buf, pos: int) -> int:
+    """Return the offset just past the JSON value starting at *pos*."""
+    first = buf[pos:pos + 1]
+    if first == b'"':
+        return _STRING_RX.match(buf, pos).end()
+    if first in (b"{", b"["):
+        depth = 0
+        while True:
+            m = _NESTED_RX.search(buf, pos)
+            if m is None:
+                raise ValueError("unterminated JSON container")
+            tok = m.group()
+            if tok == b'"':
+                pos = _STRING_RX.match(buf, m.start()).end()
+                continue
+            pos = m.end()
+            depth += 1 if tok in (b"{", b"[") else -1
+            if depth == 0:
+                return pos
+    m = _SCALAR_RX.match(buf, pos)
+    if m is None:
+        raise ValueError(f"invalid JSON value at offset {pos}")
+    return m.end()
+
+
+def scan_event_header(buf, fields=HEADER_FIELDS) -> Dict[str, Any]:
+    """Decode only *fields* of the top-level JSON object held in *buf*.
+
+    *buf* is any bytes-like object (bytes, mmap).  Other values — notably the
+    100–200 KB `pageHTMLContent` string — are skipped without being decoded,
+    and the scan stops as soon as every requested field has been found.
+    """
+    wanted = set(fields)
+    header: Dict[str, Any] = {}
+    pos = _skip_ws(buf, 0)
+    if buf[pos:pos + 1] != b"{":
+        raise ValueError("event JSON must be an object")
+    pos = _skip_ws(buf, pos + 1)
+
+    while wanted and buf[pos:pos + 1] == b'"':
+        key_end = _STRING_RX.match(buf, pos).end()
+        key = json.loads(buf[pos:key_end])
+        pos = _skip_ws(buf, key_end)
+        if buf[pos:pos + 1] != b":":
+            raise ValueError(f"expected ':' at offset {pos}")
+        pos = _skip_ws(buf, pos + 1)
+        end = _value_end(buf, pos)
+        if key in wanted:
+            header[key] = json.loads(buf[pos:end])
+            wanted.discard(key)
+        pos = _skip_ws(buf, end)
+        if buf[pos:pos + 1] == b",":
+            pos = _skip_ws(buf, pos + 1)
+    return header
+
+
+def read_event_header(path: str | Path, fields=HEADER_FIELDS) -> Dict[str, Any]:
+    """Read *fields* of an event file through a memory map (see `scan_event_header`)
+    and validate them against the event schema; the snapshot is never decoded."""
+    path = Path(path)
+    with path.open("rb") as fh:
+        if path.stat().st_size == 0:
+            raise ValueError(f"empty event file: {path}")
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return decode_event_header(scan_event_header(buf, fields))
@@ -0,0 +1,315 @@
+"""SQLite catalog of recorded events.
+
+One row per event (taskId, seq, type, url, host, selector, timestamps, blob
+ref, location on disk) with indexes on taskId, type and URL host, so
+questions like "which tasks touched amazon.ca with a submit event" do not
+have to parse every recording.  The collector fills it at ingest time
+(``--catalog``); existing data trees are loaded with the backfill command.
+
+Usage
+-----
+python utils/event_catalog.py backfill --data_root_path data
+python utils/event_catalog.py query --data_root_path data --host amazon.ca --type submit
+python utils/event_catalog.py tasks --data_root_path data --host amazon.ca --type submit
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+__all__ = ["EventCatalog", "event_row", "CATALOG_NAME"]
+
+CATALOG_NAME = "catalog.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    task_id          TEXT    NOT NULL,
+    seq              INTEGER NOT NULL,
+    type             TEXT,
+    url              TEXT,
+    host             TEXT,
+    selector         TEXT,
+    action_ts        INTEGER,
+    ingest_ts        REAL,
+    blob_ref         TEXT,
+    task_description TEXT,
+    folder           TEXT,
+    segment          INTEGER,
+    offset           INTEGER,
+    length           INTEGER,
+    path             TEXT,
+    PRIMARY KEY (task_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_events_type   ON events(type);
+CREATE INDEX IF NOT EXISTS idx_events_host   ON events(host);
+CREATE INDEX IF NOT EXISTS idx_events_folder ON events(folder);
+"""
+
+_COLUMNS = ("task_id", "seq", "type", "url", "host", "selector", "action_ts", "ingest_ts",
+            "blob_ref", "task_description", "folder", "segment", "offset", "length", "path")
+
+# every top-level field `event_row` looks at (all but the page snapshot)
+_ROW_FIELDS = ("taskId", "type", "actionTimestamp", "taskDescription", "eventTarget",
+               "allEvents", "pageURL", "pageHTMLRef")
+
+_HREF_RX = re.compile(r'href\s*=\s*"([^"]+)"', re.I)
+
+
+# ---------------------------------------------------------------------------
+# event → row
+# ---------------------------------------------------------------------------
+def event_url(event: Dict[str, Any]) -> Optional[str]:
+    """Best-effort page URL of a recorder event."""
+    if event.get("pageURL"):
+        return event["pageURL"]
+    all_events = event.get("allEvents")
+    if isinstance(all_events, list) and all_events and isinstance(all_events[0], dict):
+        if all_events[0].get("current_url"):
+            return all_events[0]["current_url"]
+    target = event.get("eventTarget") or {}
+    if event.get("type") == "go-back-or-forward":
+        return target.get("target")
+    return None
+
+
+def event_selector(event: Dict[str, Any]) -> Optional[str]:
+    target = event.get("eventTarget") or {}
+    if target.get("selector"):
+        return target["selector"]
+    if target.get("targetId"):
+        return f"#{target['targetId']}"
+    match = _HREF_RX.search(target.get("target") or "")
+    return f'a[href="{match.group(1)}"]' if match else None
+
+
+def event_row(event: Dict[str, Any], *, seq: int, folder: str | None = None,
+              entry: Optional[Dict[str, Any]] = None, path: str | None = None,
+              url: str | None = None) -> Dict[str, Any]:
+    """Build the catalog row of one event.
+
+    *url* is the fallback page URL (usually the last one seen for the task)
+    for events whose payload carries none.
+    """
+    url = event_url(event) or url
+    entry = entry or {}
+    return {
+        "task_id": event.get("taskId"),
+        "seq": seq,
+        "type": event.get("type"),
+        "url": url,
+        "host": (urlsplit(url).hostname or "").removeprefix("www.") if url else None,
+        "selector": event_selector(event),
+        "action_ts": event.get("actionTimestamp"),
+        "ingest_ts": time.time(),
+        "blob_ref": event.get("pageHTMLRef"),
+        "task_description": event.get("taskDescription"),
+        "folder": folder,
+        "segment": entry.get("segment"),
+        "offset": entry.get("offset"),
+        "length": entry.get("length"),
+        "path": path,
+    }
+
+
+# ---------------------------------------------------------------------------
+# catalog
+# ---------------------------------------------------------------------------
+class EventCatalog:
+    """Thin wrapper around the SQLite catalog file.
+
+    Folders are stored relative to the catalog's directory (the data root),
+    so a data tree can be moved together with its catalog.
+    """
+
+    def __init__(self, db_path: str | Path, *, read_only: bool = False) -> None:
+        self.db_path = Path(db_path)
+        self.root = self.db_path.parent.resolve()
+        if read_only:                           # lookups: no schema writes next to the collector's
+            self._conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True,
+                                         check_same_thread=False)
+        else:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._last_url: Dict[str, str] = {}
+
+    @classmethod
+    def for_data_root(cls, data_root: str | Path) -> "EventCatalog":
+        return cls(Path(data_root) / CATALOG_NAME)
+
+    @classmethod
+    def locate(cls, path: str | Path) -> Optional["EventCatalog"]:
+        """The read-only catalog of the data tree containing *path*, if there is one.
+
+        One connection is opened per catalog file and kept for the process.
+        """
+        for parent in Path(path).resolve().parents:
+            if (parent / CATALOG_NAME).is_file():
+                return _reader_for(parent / CATALOG_NAME)
+        return None
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def relative(self, folder: str | Path) -> str:
+        folder = Path(folder).resolve()
+        try:
+            return folder.relative_to(self.root).as_posix()
+        except ValueError:
+            return folder.as_posix()
+
+    # -- write ---------------------------------------------------------------
+    def add_events(self, events: Iterable[Dict[str, Any]], entries: Iterable[Dict[str, Any]]) -> None:
+        """Catalog events freshly appended to their task logs (collector path)."""
+        rows = []
+        for event, entry in zip(events, entries):
+            task_id = event.get("taskId")
+            row = event_row(event, seq=entry["seq"], folder=self.relative(entry["folder"]),
+                            entry=entry, url=self._last_url.get(task_id))
+            if row["url"]:
+                self._last_url[task_id] = row["url"]
+            rows.append(row)
+        self.insert_rows(rows)
+
+    def insert_rows(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO events ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+                [tuple(row[c] for c in _COLUMNS) for row in rows],
+            )
+
+    def backfill(self, data_root: str | Path) -> int:
+        """(Re)catalog every task folder under *data_root*; return the event count."""
+        from utils.action_processing import read_event_header, scan_event_header
+        from utils.event_schema import decode_event_header
+        from utils.event_log import TaskEventLog, has_event_log, iter_task_headers
+
+        data_root = Path(data_root)
+        folders = {p.parent for p in data_root.rglob("events.idx")}
+        folders |= {p.parent for p in data_root.rglob("summary_event_*.json")}
+        total = 0
+        for folder in sorted(folders):
+            rows: List[Dict[str, Any]] = []
+            last_url = None
+            rel = self.relative(folder)
+            if has_event_log(folder):
+                for entry, raw in TaskEventLog(folder).iter_records():
+                    event = decode_event_header(scan_event_header(raw, _ROW_FIELDS))
+                    row = event_row(event, seq=entry["seq"], folder=rel, entry=entry, url=last_url)
+                    last_url = row["url"] or last_url
+                    rows.append(row)
+            else:
+                for seq, header in enumerate(iter_task_headers(folder)):
+                    event = read_event_header(header["path"], _ROW_FIELDS)
+                    row = event_row(event, seq=seq, folder=rel, path=header["path"].as_posix(), url=last_url)
+                    last_url = row["url"] or last_url
+                    rows.append(row)
+            self.insert_rows(rows)
+            total += len(rows)
+            print(f"[OTA Info] cataloged {len(rows):4d} events from {rel}")
+        return total
+
+    # -- read ----------------------------------------------------------------
+    def query(self, *, task_id: str | None = None, event_type: str | None = None,
+              host: str | None = None, limit: int | None = None) -> List[Dict[str, Any]]:
+        """Return matching event rows; *host* also matches its subdomains."""
+        where, params = self._filters(task_id=task_id, event_type=event_type, host=host)
+        sql = f"SELECT * FROM events {where} ORDER BY task_id, seq"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(r) for r in self._conn.execute(sql, params)]
+
+    def tasks(self, *, event_type: str | None = None, host: str | None = None) -> List[Dict[str, Any]]:
+        """Return the distinct tasks having at least one matching event."""
+        where, params = self._filters(event_type=event_type, host=host)
+        sql = (f"SELECT task_id, MIN(folder) AS folder, COUNT(*) AS matches FROM events {where} "
+               "GROUP BY task_id ORDER BY task_id")
+        return [dict(r) for r in self._conn.execute(sql, params)]
+
+    def task_start_rows(self, folder: str | Path) -> List[Dict[str, Any]]:
+        """Return the first event and every task-start event cataloged for *folder*."""
+        sql = ("SELECT * FROM events WHERE folder = ? AND "
+               "(type = 'task-start' OR seq = (SELECT MIN(seq) FROM events WHERE folder = ?)) "
+               "ORDER BY seq")
+        rel = self.relative(folder)
+        return [dict(r) for r in self._conn.execute(sql, (rel, rel))]
+
+    @staticmethod
+    def _filters(**filters: Any):
+        clauses, params = [], []
+        if filters.get("task_id"):
+            clauses.append("task_id = ?")
+            params.append(filters["task_id"])
+        if filters.get("event_type"):
+            clauses.append("type = ?")
+            params.append(filters["event_type"])
+        if filters.get("host"):
+            host = filters["host"].lower().removeprefix("www.")
+            clauses.append("(host = ? OR host LIKE ?)")
+            params.extend([host, f"%.{host}"])
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+_READERS: Dict[Path, EventCatalog] = {}
+_READERS_LOCK = threading.Lock()
+
+
+def _reader_for(db_path: Path) -> EventCatalog:
+    with _READERS_LOCK:
+        catalog = _READERS.get(db_path)
+        if catalog is None:
+            catalog = _READERS[db_path] = EventCatalog(db_path, read_only=True)
+        return catalog
+
+
+# ---------------------------------------------------------------------------
+# command-line interface
+# ---------------------------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build and query the SQLite catalog of recorded events.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_backfill = sub.add_parser("backfill", help="catalog every recording under the data root")
+    p_backfill.add_argument("--data_root_path", default="data")
+
+    for name, help_text in (("query", "list matching events"), ("tasks", "list tasks with matching events")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--data_root_path", default="data")
+        p.add_argument("--host", help="URL host, subdomains included (e.g. amazon.ca)")
+        p.add_argument("--type", dest="event_type", help="event type (click, submit, task-start …)")
+        if name == "query":
+            p.add_argument("--task_id")
+            p.add_argument("--limit", type=int, default=100)
+
+    args = parser.parse_args()
+    catalog = EventCatalog.for_data_root(args.data_root_path)
+
+    if args.command == "backfill":
+        total = catalog.backfill(args.data_root_path)
+        print(f"[OTA Info] catalog {catalog.db_path} now holds {total} backfilled events")
+    elif args.command == "query":
+        for row in catalog.query(task_id=args.task_id, event_type=args.event_type,
+                                 host=args.host, limit=args.limit):
+            print(json.dumps({k: row[k] for k in ("task_id", "seq", "type", "host", "selector", "url")},
+                             ensure_ascii=False))
+    else:
+        for row in catalog.tasks(event_type=args.event_type, host=args.host):
+            print(f"{row['task_id']}\t{row['matches']}\t{row['folder']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Server-side eventHash coalescing.
+
+The extension already debounces by `eventHash` (`enqueueByHash` in
+background.js), but duplicates still reach the collector after extension
+reloads, devtools reconnects or when several tabs record.  `EventCoalescer`
+holds each (taskId, eventHash) for a short window and applies the same
+precedence as the extension:
+
+    submit   → submit      newer one replaces the pending one
+    submit   → other       newcomer dropped
+    other    → submit      submit wins and is released immediately
+    other    → other type  newer one replaces the pending one
+    same type              newcomer dropped
+
+Events are released per task in arrival order, so the seq assigned by the
+event log still follows the recording.  Events without an eventHash
+(e.g. go-back-or-forward) are never coalesced but keep their place in line.
+"""
+from __future__ import annotations
+
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.metrics import REGISTRY
+
+__all__ = ["EventCoalescer"]
+
+DUPLICATES_DROPPED = REGISTRY.counter(
+    "collector_duplicates_dropped_total", "Duplicate eventHash deliveries dropped by the coalescer.")
+HELD_EVENTS = REGISTRY.gauge(
+    "collector_coalescer_held_events", "Events held in the coalescing window.")
+
+Key = Tuple[str, str]
+
+
+class _Slot:
+    __slots__ = ("key", "event", "deadline")
+
+    def __init__(self, key: Optional[Key], event: Dict[str, Any], deadline: Optional[float]) -> None:
+        self.key = key
+        self.event = event
+        self.deadline = deadline            # None → ready to be written
+
+
+class EventCoalescer:
+    """Per-task coalescing window keyed on eventHash.
+
+    Parameters
+    ----------
+    window : float
+        Seconds an event is held waiting for duplicates.
+    remember : int
+        Number of already released keys remembered, so late duplicates are
+        dropped too (a late submit still gets through over a non-submit).
+    on_drop : callable | None
+        Called with every event dropped as a duplicate (the writer uses it
+        to acknowledge the event's clientSeq, as it will never be written).
+    """
+
+    def __init__(self, window: float = 2.0, *, remember: int = 4096,
+                 clock: Callable[[], float] = time.monotonic,
+                 on_drop: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        self.window = window
+        self.remember = remember
+        self.clock = clock
+        self.on_drop = on_drop
+        self._queues: Dict[str, Deque[_Slot]] = {}
+        self._pending: Dict[Key, _Slot] = {}
+        self._released: "OrderedDict[Key, str]" = OrderedDict()
+        self.dropped = 0
+        self.dropped_by_task: Counter = Counter()
+        HELD_EVENTS.set_function(lambda: self.pending)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _drop(self, task_id: str, why: str, event: Dict[str, Any]) -> None:
+        self.dropped += 1
+        self.dropped_by_task[task_id] += 1
+        DUPLICATES_DROPPED.inc()
+        print(f"[OTA Info] dropped duplicate {event.get('type')} event {event.get('eventHash')} "
+              f"of task {task_id} ({why}); {self.dropped} duplicates dropped so far")
+        if self.on_drop is not None:
+            self.on_drop(event)
+
+    def offer(self, event: Dict[str, Any], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Add *event*; return the events that are now ready to be written."""
+        now = self.clock() if now is None else now
+        task_id = event["taskId"]
+        queue = self._queues.setdefault(task_id, deque())
+        ev_hash = event.get("eventHash")
+
+        if not ev_hash:
+            queue.append(_Slot(None, event, None))
+        else:
+            key = (task_id, ev_hash)
+            new_type = event.get("type")
+            slot = self._pending.get(key)
+            if slot is None and key in self._released:
+                old_type = self._released[key]
+                if new_type == "submit" and old_type != "submit":
+                    queue.append(_Slot(key, event, None))      # late submit still wins
+                    self._released[key] = "submit"
+                else:
+                    self._drop(task_id, "already written", event)
+            elif slot is None:
+                slot = _Slot(key, event, now + self.window)
+                self._pending[key] = slot
+                queue.append(slot)
+            else:
+                old_type = slot.event.get("type")
+                if old_type == "submit":
+                    if new_type == "submit":
+                        self._drop(task_id, "replaced by newer submit", slot.event)
+                        slot.event, slot.deadline = event, now + self.window
+                    else:
+                        self._drop(task_id, "pending submit wins", event)
+                elif new_type == "submit":
+                    self._drop(task_id, "promoted to submit", slot.event)
+                    slot.event, slot.deadline = event, None
+                    del self._pending[key]
+                elif old_type != new_type:
+                    self._drop(task_id, f"replaced by {new_type}", slot.event)
+                    slot.event, slot.deadline = event, now + self.window
+                else:
+                    self._drop(task_id, "same type pending", event)
+
+        if event.get("type") == "task-finish":
+            # nothing more is coming for this task: release everything it holds
+            for slot in queue:
+                slot.deadline = None
+            if self.dropped_by_task[task_id]:
+                print(f"[OTA Info] task {task_id} finished; "
+                      f"{self.dropped_by_task[task_id]} duplicate event(s) dropped")
+        return self.drain(now)
+
+    def drain(self, now: Optional[float] = None, *, force: bool = False) -> List[Dict[str, Any]]:
+        """Release, per task and in arrival order, every event whose window is over."""
+        now = self.clock() if now is None else now
+        ready: List[Dict[str, Any]] = []
+        for task_id in list(self._queues):
+            queue = self._queues[task_id]
+            while queue and (force or queue[0].deadline is None or queue[0].deadline <= now):
+                slot = queue.popleft()
+                if slot.key is not None:
+                    self._pending.pop(slot.key, None)
+                    self._released[slot.key] = slot.event.get("type")
+                    self._released.move_to_end(slot.key)
+                ready.append(slot.event)
+            if not queue:
+                del self._queues[task_id]
+        while len(self._released) > self.remember:
+            self._released.popitem(last=False)
+        return ready
@@ -0,0 +1,309 @@
+"""Append-only per-task event log.
+
+Every task folder holds JSONL segments plus a small sidecar index:
+
+    data/YYYYMMDD/<taskId>/events-000000.jsonl     one compact record per line
+    data/YYYYMMDD/<taskId>/events.idx              one JSON line per record:
+        {"seq", "type", "actionTimestamp", "segment", "offset", "length"[, "clientSeq"]}
+
+The collector assigns a monotonic `seq` per taskId, so two events recorded
+in the same second no longer collide, and readers walk the index and seek
+straight to the records they need instead of globbing and parsing every file.
+Folders recorded before the log existed (one ``summary_event_*.json`` per
+event) are still read through the same helpers.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.event_schema import EventSchemaError, decode_event_json
+from utils.snapshot_store import resolve_event_snapshot
+
+__all__ = [
+    "TaskEventLog",
+    "has_event_log",
+    "iter_task_events",
+    "iter_task_headers",
+    "read_task_event",
+]
+
+INDEX_NAME = "events.idx"
+SEGMENT_PATTERN = "events-{:06d}.jsonl"
+LEGACY_PATTERN = "*.json"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+def has_event_log(folder: str | Path) -> bool:
+    return (Path(folder) / INDEX_NAME).is_file()
+
+
+def _complete_record(line: bytes, seq: int) -> Optional[Dict[str, Any]]:
+    """The record of a segment line if it was fully written with *seq*, else None."""
+    if not line.endswith(b"\n"):
+        return None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    return record if isinstance(record, dict) and record.get("seq") == seq else None
+
+
+def _index_entry(record: Dict[str, Any], seq: int, segment: int, offset: int, length: int) -> Dict[str, Any]:
+    entry = {"seq": seq, "type": record.get("type"), "actionTimestamp": record.get("actionTimestamp"),
+             "segment": segment, "offset": offset, "length": length}
+    if record.get("clientSeq") is not None:     # lets the collector spot re-uploads from the index
+        entry["clientSeq"] = record["clientSeq"]
+    return entry
+
+
+def event_name(entry: Dict[str, Any]) -> str:
+    """Stable, sortable name of a logged event (used for prompt/output files)."""
+    return f"event_{entry['seq']:06d}"
+
+
+class TaskEventLog:
+    """Segment log + index of one task folder.
+
+    Parameters
+    ----------
+    folder : str | Path
+        Task folder; created on first append.
+    segment_bytes : int
+        Size after which appends roll over to a new segment file.
+    durable : bool
+        fsync segment and index once per `append_many` call.
+    """
+
+    def __init__(self, folder: str | Path, *, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 durable: bool = True) -> None:
+        self.folder = Path(folder)
+        self.segment_bytes = segment_bytes
+        self.durable = durable
+        self._entries: Optional[List[Dict[str, Any]]] = None
+        self._index_bytes = 0                    # bytes of the index holding `_entries`
+        self._repaired = False
+
+    # -- index ---------------------------------------------------------------
+    @property
+    def index_path(self) -> Path:
+        return self.folder / INDEX_NAME
+
+    def segment_path(self, segment: int) -> Path:
+        return self.folder / SEGMENT_PATTERN.format(segment)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Return all index entries in seq order."""
+        if self._entries is None:
+            self._entries = []
+            self._index_bytes = 0
+            if self.index_path.is_file():
+                with self.index_path.open("rb") as fh:
+                    for line in fh:
+                        try:
+                            entry = json.loads(line) if line.endswith(b"\n") else None
+                        except json.JSONDecodeError:
+                            entry = None
+                        if entry is None:
+                            break                # torn tail of an interrupted append
+                        self._entries.append(entry)
+                        self._index_bytes += len(line)
+        return self._entries
+
+    def _repair_tail(self) -> None:
+        """Make the index and the segments agree again after an interrupted append.
+
+        A torn index line is cut, complete records written after the last
+        index entry (a crash between the segment and the index write) are
+        indexed, and torn segment bytes are dropped.  Only the writer calls
+        this (before appending): a reader of a live log would otherwise cut
+        records that are written but not indexed yet.
+        """
+        entries = self.entries()
+        if self.index_path.is_file() and self.index_path.stat().st_size > self._index_bytes:
+            with self.index_path.open("r+b") as fh:
+                fh.truncate(self._index_bytes)
+
+        last = entries[-1] if entries else None
+        segment, offset = (last["segment"], last["offset"] + last["length"]) if last else (0, 0)
+        seq = self.next_seq
+        recovered: List[Dict[str, Any]] = []
+        while self.segment_path(segment).is_file():
+            with self.segment_path(segment).open("r+b") as fh:
+                fh.seek(offset)
+                for line in fh:
+                    record = _complete_record(line, seq)
+                    if record is None:
+                        fh.truncate(offset)
+                        break
+                    recovered.append(_index_entry(record, seq, segment, offset, len(line)))
+                    offset += len(line)
+                    seq += 1
+                else:
+                    segment, offset = segment + 1, 0
+                    continue
+            break
+
+        if recovered:
+            print(f"[OTA warning] {self.folder}: indexed {len(recovered)} record(s) written after the last index entry")
+            with self.index_path.open("a", encoding="utf-8") as idx_fh:
+                for entry in recovered:
+                    idx_fh.write(json.dumps(entry) + "\n")
+                self._sync(idx_fh)
+            entries.extend(recovered)
+
+    @property
+    def next_seq(self) -> int:
+        entries = self.entries()
+        return entries[-1]["seq"] + 1 if entries else 0
+
+    # -- write ---------------------------------------------------------------
+    def append_many(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Append *events*, assigning consecutive `seq` values; return their entries."""
+        entries = self.entries()
+        if not self._repaired:
+            self._repair_tail()
+            self._repaired = True
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+        segment = entries[-1]["segment"] if entries else 0
+        seq = self.next_seq
+        new_entries: List[Dict[str, Any]] = []
+        seg_fh = self.segment_path(segment).open("ab")
+        try:
+            for event in events:
+                record = dict(event, seq=seq)
+                line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+                if seg_fh.tell() >= self.segment_bytes:      # roll over
+                    self._sync(seg_fh)
+                    seg_fh.close()
+                    segment += 1
+                    seg_fh = self.segment_path(segment).open("ab")
+
+                offset = seg_fh.tell()
+                seg_fh.write(line)
+                new_entries.append(_index_entry(event, seq, segment, offset, len(line)))
+                seq += 1
+            self._sync(seg_fh)
+        finally:
+            seg_fh.close()
+
+        # index after the data: a crash in between only leaves an unindexed tail
+        with self.index_path.open("a", encoding="utf-8") as idx_fh:
+            for entry in new_entries:
+                idx_fh.write(json.dumps(entry) + "\n")
+            self._sync(idx_fh)
+
+        entries.extend(new_entries)
+        return new_entries
+
+    def _sync(self, fh) -> None:
+        fh.flush()
+        if self.durable:
+            os.fsync(fh.fileno())
+
+    # -- read ----------------------------------------------------------------
+    def read_bytes(self, entry: Dict[str, Any]) -> bytes:
+        with self.segment_path(entry["segment"]).open("rb") as fh:
+            fh.seek(entry["offset"])
+            return fh.read(entry["length"])
+
+    def read(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return decode_event_json(self.read_bytes(entry))
+
+    def iter_records(self) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+        """Yield (entry, raw record) pairs in seq order, one open file per segment."""
+        handles: Dict[int, Any] = {}
+        try:
+            for entry in self.entries():
+                fh = handles.get(entry["segment"])
+                if fh is None:
+                    fh = handles[entry["segment"]] = self.segment_path(entry["segment"]).open("rb")
+                fh.seek(entry["offset"])
+                yield entry, fh.read(entry["length"])
+        finally:
+            for fh in handles.values():
+                fh.close()
+
+    def iter_events(self) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Yield (entry, event) pairs in seq order.
+
+        Records are decoded and validated against `utils.event_schema`.
+        """
+        for entry, raw in self.iter_records():
+            yield entry, decode_event_json(raw)
+
+
+# ---------------------------------------------------------------------------
+# reader helpers shared by the replay generators
+# ---------------------------------------------------------------------------
+def _legacy_paths(folder: Path) -> List[Path]:
+    return sorted(folder.rglob(LEGACY_PATTERN))
+
+
+def _load_legacy(path: Path, resolve_snapshot: bool) -> Dict[str, Any]:
+    event = decode_event_json(path.read_bytes())
+    return resolve_event_snapshot(event, path) if resolve_snapshot else event
+
+
+def iter_task_headers(folder: str | Path) -> Iterator[Dict[str, Any]]:
+    """Yield {"name", "type", "actionTimestamp", ...} for every event of *folder*.
+
+    For logged tasks this only reads the index; legacy folders fall back to
+    a header-only scan of each ``*.json`` file, skipping (and reporting)
+    files whose header does not match the schema.
+    """
+    from utils.action_processing import read_event_header   # avoid an import cycle
+
+    folder = Path(folder)
+    if has_event_log(folder):
+        for entry in TaskEventLog(folder).entries():
+            yield dict(entry, name=event_name(entry))
+        return
+    for path in _legacy_paths(folder):
+        try:
+            header = read_event_header(path, ("type", "actionTimestamp"))
+        except EventSchemaError as exc:
+            print(f"[warn] skipping malformed event {path.name}: {exc}")
+            continue
+        yield {"name": path.stem, "path": path, "type": header.get("type"),
+               "actionTimestamp": header.get("actionTimestamp")}
+
+
+def read_task_event(folder: str | Path, header: Dict[str, Any],
+                    resolve_snapshot: bool = True) -> Dict[str, Any]:
+    """Load the full event behind a header yielded by `iter_task_headers`."""
+    if "path" in header:
+        return _load_legacy(header["path"], resolve_snapshot)
+    event = TaskEventLog(folder).read(header)
+    return resolve_event_snapshot(event, folder) if resolve_snapshot else event
+
+
+def iter_task_events(folder: str | Path,
+                     resolve_snapshot: bool = True) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (name, event) for every event of *folder* in recording order.
+
+    Events that do not match the schema are reported and skipped.
+    """
+    folder = Path(folder)
+    if has_event_log(folder):
+        for entry, raw in TaskEventLog(folder).iter_records():
+            try:
+                event = decode_event_json(raw)
+            except EventSchemaError as exc:
+                print(f"[warn] skipping malformed event {event_name(entry)}: {exc}")
+                continue
+            if resolve_snapshot:
+                resolve_event_snapshot(event, folder)
+            yield event_name(entry), event
+        return
+    for path in _legacy_paths(folder):
+        try:
+            event = _load_legacy(path, resolve_snapshot)
+        except EventSchemaError as exc:
+            print(f"[warn] skipping malformed event {path.name}: {exc}")
+            continue
+        yield path.stem, event
@@ -0,0 +1,183 @@
+"""Typed schema of recorder events.
+
+The recorder payload is described once as TypedDicts and compiled into a
+pydantic-core validator, so JSON bytes are decoded and validated in a single
+pass and the result is still a plain dict: everything downstream
+(`record_metadata_to_actions`, `extract_action_bundle`, the event log) keeps
+working on dicts.  The collector runs the same decoder at ingest, so malformed
+events are rejected with a 400 instead of failing later in replay compilation.
+
+The validator only checks that the page snapshot is a string; it does not
+parse it.  Events stored with a `pageHTMLRef` carry no page at all, and the
+readers fill it in from the blob store (`iter_task_events` does so by
+default, see `utils.snapshot_store.resolve_page_html`).  Readers that only
+need the header (`utils.action_processing.read_event_header`) skip the
+snapshot without decoding it and validate the fields they read with
+`decode_event_header`.
+
+A taskId names the task's folder under the data root, so it is limited to
+letters, digits, ``_`` and ``-`` (the extension generates 16 alphanumerics).
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Literal, Union
+
+from pydantic import ConfigDict, TypeAdapter, ValidationError, with_config
+from typing_extensions import NotRequired, TypedDict
+
+__all__ = [
+    "EventHeader",
+    "EventSchemaError",
+    "EventTarget",
+    "RecordedEvent",
+    "RecorderStats",
+    "SnapshotDelta",
+    "decode_event",
+    "decode_event_header",
+    "decode_event_json",
+    "validate_event",
+]
+
+EventType = Literal[
+    "task-start", "task-finish", "click", "dblclick", "submit",
+    "input-change", "go-back-or-forward",
+]
+
+
+TASK_ID_RX = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+
+class EventSchemaError(ValueError):
+    """Raised when a recorder payload does not match the event schema."""
+
+
+@with_config(ConfigDict(extra="allow"))
+class EventTarget(TypedDict, total=False):
+    type: str
+    target: str
+    targetId: str
+    targetClass: Any          # `className` is an object for SVG elements
+    value: Union[str, bool, None]
+    selector: str
+
+
+class SnapshotDelta(TypedDict):
+    """`pageHTMLContent` sent as a splice of an earlier snapshot of the task:
+    ``base[:start] + text + base[end:]`` in UTF-16 code units (JS string
+    indices), whose SHA-256 must be `hash`."""
+    base: str
+    hash: str
+    start: int
+    end: int
+    text: str
+
+
+@with_config(ConfigDict(extra="allow"))
+class RecorderStats(TypedDict, total=False):
+    """Main-thread cost of one event in the recorder, in milliseconds."""
+    cpuMs: float              # mutationMs + snapshotMs
+    mutationMs: float
+    snapshotMs: float
+    snapshotWallMs: float
+    snapshotSlices: int
+    snapshotCached: bool
+    budgetMs: float
+
+
+@with_config(ConfigDict(extra="allow"))
+class RecordedEvent(TypedDict):
+    taskId: str
+    type: EventType
+    eventHash: NotRequired[str]
+    taskDescription: NotRequired[str]
+    actionTimestamp: NotRequired[int]
+    eventTarget: NotRequired[EventTarget]
+    # list for task-start/finish, {name: control} for submit, {} or "" when empty
+    allEvents: NotRequired[Union[List[Dict[str, Any]], Dict[str, Any], str]]
+    pageURL: NotRequired[str]
+    pageHTMLContent: NotRequired[str]
+    pageHTMLRef: NotRequired[str]
+    pageHTMLDelta: NotRequired[SnapshotDelta]
+    recorderStats: NotRequired[RecorderStats]
+    seq: NotRequired[int]
+    clientSeq: NotRequired[int]   # per-task counter of the extension's upload buffer
+
+
+@with_config(ConfigDict(extra="allow"))
+class EventHeader(TypedDict, total=False):
+    """Any subset of the `RecordedEvent` fields but the page snapshot."""
+    taskId: str
+    type: EventType
+    eventHash: str
+    taskDescription: str
+    actionTimestamp: int
+    eventTarget: EventTarget
+    allEvents: Union[List[Dict[str, Any]], Dict[str, Any], str]
+    pageURL: str
+    pageHTMLRef: str
+    recorderStats: RecorderStats
+    seq: int
+    clientSeq: int
+
+
+_EVENT_ADAPTER = TypeAdapter(RecordedEvent)
+_HEADER_ADAPTER = TypeAdapter(EventHeader)
+
+
+def _check(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Cross-field rules the replay compiler relies on."""
+    if not TASK_ID_RX.fullmatch(event["taskId"]):
+        raise EventSchemaError("taskId must be 1-128 letters, digits, '_' or '-'")
+    if event["type"] == "task-start":
+        all_events = event.get("allEvents")
+        if not (isinstance(all_events, list) and all_events
+                and isinstance(all_events[0], dict) and all_events[0].get("current_url")):
+            raise EventSchemaError("task-start event needs allEvents[0].current_url")
+    if event["type"] == "go-back-or-forward" and not (event.get("eventTarget") or {}).get("target"):
+        raise EventSchemaError("go-back-or-forward event needs eventTarget.target (the URL)")
+    return event
+
+
+def _raise(exc: ValidationError) -> None:
+    first = exc.errors()[0]
+    loc = ".".join(str(p) for p in first["loc"]) or "event"
+    raise EventSchemaError(f"{loc}: {first['msg']}") from None
+
+
+def decode_event_json(data: bytes | str) -> RecordedEvent:
+    """Decode and validate one event from raw JSON in a single pass."""
+    try:
+        event = _EVENT_ADAPTER.validate_json(data)
+    except ValidationError as exc:
+        _raise(exc)
+    return _check(event)
+
+
+def decode_event_header(header: Dict[str, Any]) -> EventHeader:
+    """Validate the fields of a header-only read (see `EventHeader`)."""
+    try:
+        header = _HEADER_ADAPTER.validate_python(header)
+    except ValidationError as exc:
+        _raise(exc)
+    if "taskId" in header and not TASK_ID_RX.fullmatch(header["taskId"]):
+        raise EventSchemaError("taskId must be 1-128 letters, digits, '_' or '-'")
+    return header
+
+
+def decode_event(raw: Any) -> RecordedEvent:
+    """Validate an already-decoded event (e.g. one element of a batch)."""
+    try:
+        event = _EVENT_ADAPTER.validate_python(raw)
+    except ValidationError as exc:
+        _raise(exc)
+    return _check(event)
+
+
+def validate_event(raw: Any) -> str | None:
+    """Return None if *raw* is a valid event, else a short error message."""
+    try:
+        decode_event(raw)
+    except EventSchemaError as exc:
+        return str(exc)
+    return None
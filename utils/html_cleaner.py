@@ -1,47 +1,140 @@
+"""HTML sanitization of page snapshots for sub-goal prompts.
+
+One sanitizer profile per action type is built once and reused; the engine
+is either the reference `html_sanitizer.Sanitizer` or the equivalent but
+faster `utils.lxml_sanitizer.LxmlSanitizer`.  Pick it per deployment with
+``OTA_SANITIZER_ENGINE=lxml`` (default ``html_sanitizer``) after comparing
+both on your data:
+
+    python utils/html_cleaner.py --data_dir_path data_samples --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
 from html_sanitizer import Sanitizer
 
+__all__ = ["ENGINES", "get_sanitizer", "profile_for", "run_html_sanitizer"]
+
+ENGINES = ("html_sanitizer", "lxml")
+DEFAULT_ENGINE = os.getenv("OTA_SANITIZER_ENGINE", "html_sanitizer")
+
+
+def _task_finish_config() -> Dict[str, Any]:
+    allowed_tags = [
+        'a', 'address', 'article', 'aside', 'b', 'blockquote', 'button', 'caption', 'cite', 'code', 'col', 'colgroup',
+        'data', 'datalist', 'dd', 'del', 'details', 'div', 'dl', 'dt', 'em',
+        'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4',
+        'h5', 'h6', 'header', 'hr', 'i', 'img', 'input', 'label', 'legend',
+        'li', 'main', 'menu', 'nav', 'ol', 'option', 'output', 'p', 'pre',
+        'q', 's', 'section', 'select', 'small', 'span', 'strong', 'sub', 'summary',
+        'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'textarea', 'time', 'tr', 'ul', 'video',
+        'title'
+    ]
+
+    common_attrs = ["id", "aria-label", "role"]
+    wildcard_data_attrs = "data-*"
+
+    # Start with tag-specific attributes
+    attributes = {
+        "a": ["rel", "target"] + common_attrs,
+        "img": ["alt"] + common_attrs,
+        "button": ["aria-label"] + common_attrs,
+    }
+
+    # Add the common attributes to all other tags
+    for tag in allowed_tags:
+        if tag not in attributes:
+            attributes[tag] = common_attrs.copy()
+        # Add wildcard attributes for data-* only if supported by your sanitizer config
+        attributes[tag].append(wildcard_data_attrs)
+
+    return {
+        "tags": allowed_tags,
+        "attributes": attributes,
+        "empty": ["a", "img"],
+        "separate": ["p", "div", "h1", "h2", "h3", "article", "main"],
+        "keep_typographic_whitespace": True
+    }
+
+
+# profile name → Sanitizer settings ({} is html_sanitizer's default profile)
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "task-finish": _task_finish_config(),
+    "default": {},
+}
+
+
+def profile_for(action_type: str) -> str:
+    return "task-finish" if action_type == "task-finish" else "default"
+
+
+@lru_cache(maxsize=None)
+def get_sanitizer(profile: str, engine: str = DEFAULT_ENGINE) -> Sanitizer:
+    """Return the shared sanitizer of *profile*; instances hold no per-call state."""
+    if engine == "lxml":
+        from utils.lxml_sanitizer import LxmlSanitizer
+        return LxmlSanitizer(PROFILES[profile])
+    if engine != "html_sanitizer":
+        raise ValueError(f"unknown sanitizer engine {engine!r}, expected one of {ENGINES}")
+    return Sanitizer(PROFILES[profile])
+
+
+def run_html_sanitizer(html: str, action_type: str, engine: str | None = None):
+    return get_sanitizer(profile_for(action_type), engine or DEFAULT_ENGINE).sanitize(html)
+
+
+# ---------------------------------------------------------------------------
+# command-line interface: compare the engines on recorded pages
+# ---------------------------------------------------------------------------
+def _load_pages(data_dir: Path) -> List[Tuple[str, str]]:
+    from utils.event_log import iter_task_events
+
+    folders = {p.parent for p in data_dir.rglob("events.idx")}
+    folders |= {p.parent for p in data_dir.rglob("summary_event_*.json")}
+    pages = []
+    for folder in sorted(folders):
+        for _, event in iter_task_events(folder):
+            if event.get("pageHTMLContent"):
+                pages.append((event.get("type") or "", event["pageHTMLContent"]))
+    return pages
+
+
+def benchmark(pages: List[Tuple[str, str]], repeat: int = 3) -> None:
+    total_bytes = sum(len(html.encode("utf-8")) for _, html in pages)
+    reference: List[str] = []
+    for engine in ENGINES:
+        outputs: List[str] = []
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs = [run_html_sanitizer(html, action_type, engine) for action_type, html in pages]
+            best = min(best, time.perf_counter() - start)
+        if not reference:
+            reference = outputs
+        same = sum(a == b for a, b in zip(outputs, reference))
+        print(f"{engine:<15} {best * 1000 / len(pages):8.2f} ms/page  "
+              f"{total_bytes / best / 1e6:7.2f} MB/s  identical output: {same}/{len(pages)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the HTML sanitizer engines on recorded pages.")
+    parser.add_argument("--data_dir_path", default="data_samples",
+                        help="data root or task folder holding recorded events")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per engine; the best one is reported")
+    args = parser.parse_args()
+
+    pages = _load_pages(Path(args.data_dir_path))
+    if not pages:
+        raise SystemExit(f"[OTA error] no recorded pages found under {args.data_dir_path}")
+    print(f"[OTA Info] {len(pages)} pages, best of {args.repeat} runs")
+    benchmark(pages, args.repeat)
+
 
-def run_html_sanitizer(html: str, action_type: str):
-    def sanitize_html(html: str, config: dict) -> str:
-        sanitizer = Sanitizer(config)
-        return sanitizer.sanitize(html)
-
-    config = {}
-    if action_type == "task-finish":
-        allowed_tags = [
-            'a', 'address', 'article', 'aside', 'b', 'blockquote', 'button', 'caption', 'cite', 'code', 'col', 'colgroup', 
-			'data', 'datalist', 'dd', 'del', 'details', 'div', 'dl', 'dt', 'em', 
-			'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 
-			'h5', 'h6', 'header', 'hr', 'i', 'img', 'input', 'label', 'legend', 
-			'li', 'main', 'menu', 'nav', 'ol', 'option', 'output', 'p', 'pre', 
-			'q', 's', 'section', 'select', 'small', 'span', 'strong', 'sub', 'summary',
-			'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'textarea', 'time', 'tr', 'ul', 'video',
-			'title'
-        ]
-
-        common_attrs = ["id", "aria-label", "role"]
-        wildcard_data_attrs = "data-*"
-
-        # Start with tag-specific attributes
-        attributes = {
-            "a": ["rel", "target"] + common_attrs,
-            "img": ["alt"] + common_attrs,
-            "button": ["aria-label"] + common_attrs,
-        }
-
-        # Add the common attributes to all other tags
-        for tag in allowed_tags:
-            if tag not in attributes:
-                attributes[tag] = common_attrs.copy()
-            # Add wildcard attributes for data-* only if supported by your sanitizer config
-            attributes[tag].append(wildcard_data_attrs)
-
-        config = {
-            "tags": allowed_tags,
-            "attributes": attributes,
-            "empty": ["a", "img"],
-            "separate": ["p", "div", "h1", "h2", "h3", "article", "main"],
-            "keep_typographic_whitespace": True
-        }
-
-    return sanitize_html(html, config)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,625 @@
+"""Event ingest helpers for the collector server.
+
+`EventWriter` appends recorder payloads to the per-task event log under the
+data root, and `IngestQueue` decouples request handlers from disk I/O:
+handlers push the decoded event into a bounded in-memory queue and return
+immediately while a single background task drains the queue in batches.
+Either can sit behind an `EventCoalescer` that drops duplicate eventHash
+deliveries before they reach the log.
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import glob
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from utils.event_catalog import EventCatalog
+from utils.event_coalescer import EventCoalescer
+from utils.event_log import DEFAULT_SEGMENT_BYTES, INDEX_NAME, TaskEventLog
+from utils.event_schema import EventSchemaError, decode_event, decode_event_json
+from utils.live_compile import LiveCompiler
+from utils.metrics import REGISTRY
+from utils.snapshot_store import SnapshotStore, apply_snapshot_delta, snapshot_hash
+
+__all__ = ["EventCoalescer", "EventWriter", "IngestQueue", "RecorderTimings", "ack_map", "client_seqs",
+           "decode_event_batch"]
+
+ClientSeq = Tuple[str, int]                 # (taskId, clientSeq)
+
+# upper bound of a decompressed batch body, against compression bombs
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+# snapshots remembered per task as bases of uploaded deltas
+RECENT_SNAPSHOTS = 4
+
+EVENTS_WRITTEN = REGISTRY.counter(
+    "collector_events_written_total", "Events appended to task logs, per task (most recent tasks only).",
+    ("task",), max_series=1000)
+BYTES_WRITTEN = REGISTRY.counter(
+    "collector_bytes_written_total", "Bytes appended to task logs (kind=log) and snapshot blobs (kind=blob).",
+    ("kind",))
+WRITE_SECONDS = REGISTRY.histogram(
+    "collector_write_seconds", "Time to persist one batch: snapshot blobs, task logs, fsync and catalog.")
+RETRIES_SKIPPED = REGISTRY.counter(
+    "collector_retried_events_skipped_total", "Re-uploaded events skipped because their clientSeq was stored.")
+SNAPSHOT_RESYNCS = REGISTRY.counter(
+    "collector_snapshot_resyncs_total", "Delta snapshots that could not be rebuilt.")
+WRITE_ERRORS = REGISTRY.counter(
+    "collector_write_errors_total", "Batches the background writer failed to persist.")
+QUEUE_DEPTH = REGISTRY.gauge(
+    "collector_queue_depth", "Events waiting in the ASGI ingest queue.")
+
+
+def _fsync_dir(path: str | Path) -> None:
+    """Flush directory metadata (new file entries) where the OS supports it."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# ---------------------------------------------------------------------------
+# batch bodies
+# ---------------------------------------------------------------------------
+def _inflate(body: bytes, encoding: str) -> bytes:
+    if encoding in ("", "identity"):
+        return body
+    if encoding in ("gzip", "x-gzip"):
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == "deflate":
+        # CompressionStream("deflate") emits zlib-wrapped data; some clients send raw deflate
+        wbits = zlib.MAX_WBITS if body[:1] == b"\x78" else -zlib.MAX_WBITS
+        inflater = zlib.decompressobj(wbits)
+    else:
+        raise EventSchemaError(f"unsupported Content-Encoding {encoding!r}")
+    try:
+        data = inflater.decompress(body, MAX_BATCH_BYTES)
+    except zlib.error as exc:
+        raise EventSchemaError(f"cannot decompress {encoding} body: {exc}") from None
+    if inflater.unconsumed_tail:
+        raise EventSchemaError(f"decompressed batch exceeds {MAX_BATCH_BYTES} bytes")
+    return data
+
+
+def decode_event_batch(body: bytes, content_encoding: str | None = None
+                       ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Decode a (gzip/deflate compressed) NDJSON or JSON-array batch of events.
+
+    Returns ``(events, rejected)``: the valid events in `clientSeq` order per
+    task (arrival order otherwise), and one ``{"index", "clientSeq", "error"}``
+    per invalid event.  Raises `EventSchemaError` if the body itself cannot be
+    read.
+    """
+    data = _inflate(body, (content_encoding or "").strip().lower())
+    events: List[Tuple[int, Dict[str, Any]]] = []
+    rejected: List[Dict[str, Any]] = []
+
+    def add(index: int, decode, raw) -> None:
+        try:
+            events.append((index, decode(raw)))
+        except EventSchemaError as exc:
+            if isinstance(raw, bytes):
+                try:
+                    raw = json.loads(raw)
+                except ValueError:
+                    pass
+            client_seq = raw.get("clientSeq") if isinstance(raw, dict) else None
+            rejected.append({"index": index, "clientSeq": client_seq, "error": str(exc)})
+
+    if data.lstrip()[:1] == b"[":
+        try:
+            items = json.loads(data)
+        except json.JSONDecodeError as exc:
+            raise EventSchemaError(f"invalid JSON batch: {exc}") from None
+        for index, raw in enumerate(items):
+            add(index, decode_event, raw)
+    else:
+        for index, line in enumerate(line for line in data.splitlines() if line.strip()):
+            add(index, decode_event_json, line)
+
+    # the slots of each task are refilled in clientSeq order; other tasks keep their place
+    by_task: Dict[str, List[Dict[str, Any]]] = {}
+    for _, event in events:
+        by_task.setdefault(event["taskId"], []).append(event)
+    for task_events in by_task.values():
+        if all("clientSeq" in e for e in task_events):
+            task_events.sort(key=lambda e: e["clientSeq"])
+    cursors = {task_id: iter(task_events) for task_id, task_events in by_task.items()}
+    ordered = [next(cursors[event["taskId"]]) for _, event in events]
+    return ordered, rejected
+
+
+def client_seqs(events: List[Dict[str, Any]]) -> Set[ClientSeq]:
+    """(taskId, clientSeq) of every event of *events* that has a clientSeq."""
+    return {(e["taskId"], e["clientSeq"]) for e in events if e.get("clientSeq") is not None}
+
+
+def ack_map(settled: Set[ClientSeq]) -> Dict[str, List[int]]:
+    """{taskId: sorted clientSeqs}, the `acked` field of a batch response."""
+    acked: Dict[str, List[int]] = {}
+    for task_id, client_seq in sorted(settled):
+        acked.setdefault(task_id, []).append(client_seq)
+    return acked
+
+
+# ---------------------------------------------------------------------------
+# recorder timings
+# ---------------------------------------------------------------------------
+class RecorderTimings:
+    """Aggregate the `recorderStats` the extension attaches to each event.
+
+    Keeps, per event type, the count, total and maximum main-thread time and
+    how many events went over the recorder's CPU budget, so the collector can
+    show whether recording stays cheap on heavy pages.
+    """
+
+    FIELDS = ("cpuMs", "mutationMs", "snapshotMs", "snapshotWallMs")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_type: Dict[str, Dict[str, float]] = {}
+
+    def observe(self, events: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for event in events:
+                stats = event.get("recorderStats")
+                if not isinstance(stats, dict):
+                    continue
+                agg = self._by_type.setdefault(event.get("type") or "unknown",
+                                               {"events": 0, "overBudget": 0, "cached": 0})
+                agg["events"] += 1
+                agg["cached"] += bool(stats.get("snapshotCached"))
+                for field in self.FIELDS:
+                    value = float(stats.get(field) or 0.0)
+                    agg[f"{field}Total"] = agg.get(f"{field}Total", 0.0) + value
+                    agg[f"{field}Max"] = max(agg.get(f"{field}Max", 0.0), value)
+                budget = stats.get("budgetMs")
+                if budget is not None and float(stats.get("cpuMs") or 0.0) > float(budget):
+                    agg["overBudget"] += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per event type: events, overBudget, cached, and <field>Mean / <field>Max."""
+        with self._lock:
+            out = {}
+            for event_type, agg in sorted(self._by_type.items()):
+                row = {"events": agg["events"], "overBudget": agg["overBudget"], "cached": agg["cached"]}
+                for field in self.FIELDS:
+                    row[f"{field}Mean"] = round(agg.get(f"{field}Total", 0.0) / agg["events"], 2)
+                    row[f"{field}Max"] = round(agg.get(f"{field}Max", 0.0), 2)
+                out[event_type] = row
+            return out
+
+
+# ---------------------------------------------------------------------------
+# disk writer
+# ---------------------------------------------------------------------------
+class _ClientSeqs:
+    """The clientSeqs of one task, as a contiguous floor plus the ones above it."""
+
+    def __init__(self) -> None:
+        self.floor = -1                     # every clientSeq <= floor is in the set
+        self._above: Set[int] = set()
+
+    def add(self, client_seq: int) -> None:
+        if client_seq > self.floor:
+            self._above.add(client_seq)
+            while self.floor + 1 in self._above:
+                self.floor += 1
+                self._above.discard(self.floor)
+
+    def __contains__(self, client_seq: int) -> bool:
+        return client_seq <= self.floor or client_seq in self._above
+
+
+class EventWriter:
+    """Append recorder events to ``<data_root>/<YYYYMMDD>/<taskId>/`` logs.
+
+    A task keeps the date folder of its first event, and the server assigns
+    a monotonic `seq` per taskId (see `utils.event_log`).  Events uploaded
+    in batches carry the extension's own per-task `clientSeq`.  A clientSeq
+    is settled once its event is in the log or was dropped as a duplicate;
+    an upload of a settled clientSeq, or of one still on its way (queued or
+    held by the coalescer), is a retry and is skipped.
+
+    Parameters
+    ----------
+    data_root : str | Path
+        Root folder of the recordings (default: ``data``).
+    durable : bool
+        If True, fsync each task log once per batch (segment, then index)
+        and the folders created for new tasks.
+    snapshots : SnapshotStore | None
+        If given, `pageHTMLContent` is moved into this blob store (delta
+        encoded against the previous snapshot of the same task) and the
+        written record only keeps `pageHTMLRef`.
+    segment_bytes : int
+        Segment size at which a task log rolls over to a new file.
+    catalog : EventCatalog | None
+        If given, every appended event also gets a row in this catalog.
+    coalescer : EventCoalescer | None
+        If given, events are held for its window and duplicates of the same
+        (taskId, eventHash) are dropped before anything is written; call
+        `flush_due` periodically to release held events.
+    compiler : LiveCompiler | None
+        If given, every appended event is compiled into exact-replay actions
+        and the task's plan is finalized on task-finish.
+    """
+
+    def __init__(self,
+                 data_root: str | Path = "data",
+                 *,
+                 durable: bool = True,
+                 snapshots: Optional[SnapshotStore] = None,
+                 segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 catalog: Optional[EventCatalog] = None,
+                 coalescer: Optional[EventCoalescer] = None,
+                 compiler: Optional[LiveCompiler] = None) -> None:
+        self.data_root = str(data_root)
+        self.durable = durable
+        self.snapshots = snapshots
+        self.segment_bytes = segment_bytes
+        self.catalog = catalog
+        self.coalescer = coalescer
+        self.compiler = compiler
+        self._logs: Dict[str, TaskEventLog] = {}
+        self._last_snapshot: Dict[str, str] = {}   # taskId -> last blob ref
+        self._settled: Dict[str, _ClientSeqs] = {}  # taskId -> clientSeqs written or dropped as duplicates
+        self._in_flight: Dict[str, Set[int]] = {}   # taskId -> clientSeqs accepted but not settled yet
+        self._recent_html: Dict[str, "OrderedDict[str, str]"] = {}   # taskId -> {hash: html}
+        self._delta_lock = threading.Lock()
+        self.recorder_timings = RecorderTimings()
+        self._lock = threading.Lock()               # Flask serves requests on threads
+        self._settled_changed = threading.Condition(self._lock)
+        if coalescer is not None:
+            coalescer.on_drop = self._settle        # called under _lock, from write_batch
+
+    def task_log(self, task_id: str) -> TaskEventLog:
+        """Return the log of *task_id*, reopening an existing one after a restart."""
+        log = self._logs.get(task_id)
+        if log is None:
+            existing = sorted(Path(self.data_root).glob(f"*/{glob.escape(task_id)}/{INDEX_NAME}"))
+            if existing:
+                folder = existing[-1].parent
+            else:
+                date_folder = datetime.datetime.now().strftime("%Y%m%d")
+                folder = Path(self.data_root) / date_folder / task_id
+            log = self._logs[task_id] = TaskEventLog(
+                folder, segment_bytes=self.segment_bytes, durable=self.durable)
+        return log
+
+    def _externalize_snapshot(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        html = event.get("pageHTMLContent")
+        if self.snapshots is None or not isinstance(html, str):
+            return event
+        task_id = event["taskId"]
+        ref = self.snapshots.put(html, base=self._last_snapshot.get(task_id))
+        self._last_snapshot[task_id] = ref
+        record = {k: v for k, v in event.items() if k != "pageHTMLContent"}
+        record["pageHTMLRef"] = ref
+        return record
+
+    def _snapshot_base(self, task_id: str, ref: str) -> Optional[str]:
+        html = self._recent_html.get(task_id, {}).get(ref)
+        if html is None and self.snapshots is not None and self.snapshots.has(ref):
+            html = self.snapshots.get(ref)
+        return html
+
+    def _remember_html(self, task_id: str, ref: str, html: str) -> None:
+        recent = self._recent_html.setdefault(task_id, OrderedDict())
+        recent[ref] = html
+        recent.move_to_end(ref)
+        while len(recent) > RECENT_SNAPSHOTS:
+            recent.popitem(last=False)
+
+    def prepare(self, events: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Request-side work before *events* are written or queued: record the
+        recorder timings and rebuild delta snapshots (see `expand_snapshot_deltas`)."""
+        self.recorder_timings.observe(events)
+        return self.expand_snapshot_deltas(events)
+
+    def expand_snapshot_deltas(self, events: List[Dict[str, Any]]
+                               ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Turn every `pageHTMLDelta` of *events* back into `pageHTMLContent`, in place.
+
+        Must see a task's events in upload order, before coalescing drops any
+        of them.  Returns ``(events, resync)``: the events to write, and the
+        taskIds whose delta base was unknown (e.g. after a collector restart)
+        or whose result did not match its hash.  From that event on, the
+        task's events are left out; they are neither written nor settled, so
+        the recorder keeps them and uploads them again with whole snapshots.
+        """
+        kept: List[Dict[str, Any]] = []
+        resync: List[str] = []
+        with self._delta_lock:
+            for event in events:
+                task_id = event["taskId"]
+                if task_id in resync:
+                    continue
+                delta = event.get("pageHTMLDelta")
+                if delta is not None:
+                    base = self._snapshot_base(task_id, delta["base"])
+                    html = apply_snapshot_delta(base, delta) if base is not None else None
+                    if html is None or snapshot_hash(html) != delta["hash"]:
+                        SNAPSHOT_RESYNCS.inc()
+                        print(f"[OTA warning] cannot rebuild snapshot of task {task_id} "
+                              f"from base {delta['base'][:12]}; asking the recorder to resend it whole")
+                        resync.append(task_id)
+                        continue
+                    del event["pageHTMLDelta"]
+                    event["pageHTMLContent"] = html
+                    self._remember_html(task_id, delta["hash"], html)
+                elif isinstance(event.get("pageHTMLContent"), str):
+                    html = event["pageHTMLContent"]
+                    self._remember_html(task_id, snapshot_hash(html), html)
+                if event.get("type") == "task-finish":
+                    self._recent_html.pop(task_id, None)
+                kept.append(event)
+        return kept, resync
+
+    def _settled_seqs(self, task_id: str) -> "_ClientSeqs":
+        seqs = self._settled.get(task_id)
+        if seqs is None:
+            seqs = self._settled[task_id] = _ClientSeqs()
+            log = self.task_log(task_id)
+            entries = log.entries()
+            indexed = [entry["clientSeq"] for entry in entries if "clientSeq" in entry]
+            for client_seq in indexed:
+                seqs.add(client_seq)
+            if entries and not indexed:          # index written before clientSeqs were indexed
+                try:
+                    seqs.floor = log.read(entries[-1]).get("clientSeq", -1)
+                except (OSError, EventSchemaError):
+                    pass
+        return seqs
+
+    def _settle(self, event: Dict[str, Any]) -> None:
+        client_seq = event.get("clientSeq")
+        if client_seq is not None:
+            self._settled_seqs(event["taskId"]).add(client_seq)
+            self._in_flight.get(event["taskId"], set()).discard(client_seq)
+            self._settled_changed.notify_all()
+
+    def settled(self, wanted: Set[ClientSeq]) -> Set[ClientSeq]:
+        """The (taskId, clientSeq) pairs of *wanted* that are settled: written
+        to the log or dropped as duplicates.  Only those may be acknowledged."""
+        with self._lock:
+            return {(task_id, seq) for task_id, seq in wanted if seq in self._settled_seqs(task_id)}
+
+    def wait_settled(self, wanted: Set[ClientSeq], timeout: float) -> Set[ClientSeq]:
+        """`settled` once all of *wanted* is settled, or after *timeout* seconds.
+
+        Held events are settled when the coalescer releases them, so the
+        writer's `flush_due` must be running (`start_flush_thread`).
+        """
+        with self._settled_changed:
+            self._settled_changed.wait_for(
+                lambda: all(seq in self._settled_seqs(task_id) for task_id, seq in wanted), timeout)
+            return {(task_id, seq) for task_id, seq in wanted if seq in self._settled_seqs(task_id)}
+
+    def _unsettle(self, events: List[Dict[str, Any]]) -> None:
+        """Forget *events* that failed to be written, so their retries are accepted."""
+        for event in events:
+            if event.get("clientSeq") is not None:
+                self._in_flight.get(event["taskId"], set()).discard(event["clientSeq"])
+
+    def _drop_replayed(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        fresh = []
+        for event in events:
+            client_seq = event.get("clientSeq")
+            if client_seq is not None:
+                task_id = event["taskId"]
+                in_flight = self._in_flight.setdefault(task_id, set())
+                if client_seq in in_flight or client_seq in self._settled_seqs(task_id):
+                    print(f"[OTA Info] skipped retried event {client_seq} of task {task_id}")
+                    RETRIES_SKIPPED.inc()
+                    continue
+                in_flight.add(client_seq)
+            fresh.append(event)
+        return fresh
+
+    def write_batch(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Persist *events* in order; return the index entries (+ taskId, folder)
+        of everything written by this call.
+
+        With a coalescer, the written events are the ones released by it,
+        which may include earlier held events and exclude the new ones.
+        """
+        with self._lock:
+            events = self._drop_replayed(events)
+            if self.coalescer is not None:
+                ready: List[Dict[str, Any]] = []
+                for event in events:
+                    ready.extend(self.coalescer.offer(event))
+                events = ready
+            return self._persist(events)
+
+    def flush_due(self, force: bool = False) -> List[Dict[str, Any]]:
+        """Write the held events whose coalescing window is over (all if *force*)."""
+        if self.coalescer is None:
+            return []
+        with self._lock:
+            return self._persist(self.coalescer.drain(force=force))
+
+    def _persist(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        try:
+            return self._append(events)
+        except BaseException:
+            self._unsettle(events)
+            raise
+
+    def _append(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not events:
+            return []
+        started = time.perf_counter()
+        blob_bytes = self.snapshots.bytes_written if self.snapshots is not None else 0
+        by_task: Dict[str, List[Dict[str, Any]]] = {}
+        for event in events:
+            by_task.setdefault(event["taskId"], []).append(self._externalize_snapshot(event))
+        if self.snapshots is not None:
+            BYTES_WRITTEN.labels(kind="blob").inc(self.snapshots.bytes_written - blob_bytes)
+
+        written: List[Dict[str, Any]] = []
+        for task_id, records in by_task.items():
+            log = self.task_log(task_id)
+            is_new = not log.folder.exists()
+            entries = [dict(entry, taskId=task_id, folder=str(log.folder))
+                       for entry in log.append_many(records)]
+            for record in records:
+                self._settle(record)
+            if self.durable and is_new:
+                _fsync_dir(log.folder)
+                _fsync_dir(log.folder.parent)
+            if self.catalog is not None:
+                try:
+                    self.catalog.add_events(records, entries)
+                except Exception as exc:          # the log stays the source of truth
+                    print(f"[OTA warning] could not catalog events of {task_id}: {exc}")
+            if self.compiler is not None:
+                try:
+                    self.compiler.add(log.folder, records, entries)
+                except Exception as exc:          # the plan can be rebuilt from the log
+                    print(f"[OTA warning] could not compile events of {task_id}: {exc}")
+            EVENTS_WRITTEN.labels(task=task_id).inc(len(entries))
+            BYTES_WRITTEN.labels(kind="log").inc(sum(entry["length"] for entry in entries))
+            written.extend(entries)
+        WRITE_SECONDS.observe(time.perf_counter() - started)
+        return written
+
+
+# ---------------------------------------------------------------------------
+# bounded async queue + background writer task
+# ---------------------------------------------------------------------------
+_STOP = object()
+
+
+class IngestQueue:
+    """Bounded queue between the ASGI handlers and an `EventWriter`.
+
+    Parameters
+    ----------
+    writer : EventWriter
+        Sink used by the background task; it runs in a worker thread so the
+        event loop never blocks on disk I/O.
+    maxsize : int
+        Maximum number of queued events.  `offer` returns False once full so
+        the handler can answer with 429/503 instead of stalling.
+    batch_size : int
+        Maximum number of events handed to the writer at once.
+    flush_interval : float
+        How often held events are released when the writer has a coalescer
+        and no new event arrives.
+    """
+
+    def __init__(self, writer: EventWriter, *, maxsize: int = 1024, batch_size: int = 64,
+                 flush_interval: float = 0.5) -> None:
+        self.writer = writer
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+        self._task: Optional[asyncio.Task] = None
+        self._waiters: List[Tuple[Set[ClientSeq], asyncio.Future]] = []
+        QUEUE_DEPTH.set_function(lambda: self.depth)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Enqueue *event* without waiting; return False if the queue is full."""
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def offer_many(self, events: List[Dict[str, Any]]) -> bool:
+        """Enqueue all of *events* or none of them; return False if they do not fit."""
+        if self._queue.maxsize - self._queue.qsize() < len(events):
+            return False
+        for event in events:
+            self._queue.put_nowait(event)
+        return True
+
+    async def acknowledge(self, wanted: Set[ClientSeq], timeout: float) -> Set[ClientSeq]:
+        """Wait until the queued events *wanted* are settled, at most *timeout*
+        seconds; return the settled ones (see `EventWriter.settled`)."""
+        if not wanted:
+            return set()
+        waiter = (wanted, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return await asyncio.to_thread(self.writer.settled, wanted)
+        finally:
+            self._waiters.remove(waiter)
+
+    async def _answer_waiters(self) -> None:
+        waiting = [(wanted, future) for wanted, future in self._waiters if not future.done()]
+        if not waiting:
+            return
+        settled = await asyncio.to_thread(self.writer.settled, set().union(*(w for w, _ in waiting)))
+        for wanted, future in waiting:
+            if wanted <= settled and not future.done():
+                future.set_result(wanted)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Drain everything still queued, then stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        tick = self.flush_interval if self.writer.coalescer is not None else None
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=tick)
+            except asyncio.TimeoutError:
+                await self._flush(force=False)
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                try:
+                    await asyncio.to_thread(self.writer.write_batch, batch)
+                except Exception as exc:
+                    WRITE_ERRORS.inc()
+                    print(f"[OTA error] failed to write {len(batch)} event(s): {exc}")
+                await self._answer_waiters()
+            if stop:
+                await self._flush(force=True)
+                return
+
+    async def _flush(self, force: bool) -> None:
+        """Write the events whose coalescing window is over (everything if *force*)."""
+        try:
+            written = await asyncio.to_thread(self.writer.flush_due, force)
+        except Exception as exc:
+            print(f"[OTA error] failed to flush held events: {exc}")
+            return
+        if written:
+            await self._answer_waiters()
@@ -0,0 +1,149 @@
+"""Incremental exact-replay compilation at ingest time.
+
+`record_metadata_to_actions` is a pure per-event function, so the collector
+can compile every event as soon as it is written instead of re-reading the
+whole task after recording.  Each task folder of the event log gets
+
+    exact_replay.partial.jsonl      one {"seq", "actions"} line per compiled event
+    exact_replay.json               the finished bundle, written on task-finish
+
+`compiled_actions` rebuilds the plan from the partial file and compiles any
+logged event that is missing from it (e.g. after a collector restart), so
+`wap_replay/generate_exact_replay_list.py` is reduced to an export step.
+
+browser_use is imported on first use only: the collector does not need it
+unless live compilation is switched on (``--live_compile``).
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.event_log import TaskEventLog, has_event_log
+from utils.metrics import REGISTRY
+
+__all__ = ["LiveCompiler", "PARTIAL_NAME", "PLAN_NAME", "compiled_actions", "write_plan"]
+
+PARTIAL_NAME = "exact_replay.partial.jsonl"
+PLAN_NAME = "exact_replay.json"
+
+EVENTS_COMPILED = REGISTRY.counter(
+    "collector_events_compiled_total", "Events compiled into exact-replay actions at ingest.")
+PLANS_FINALIZED = REGISTRY.counter(
+    "collector_plans_finalized_total", "Exact-replay plans finalized on task-finish.")
+
+_compile_fn: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None
+
+
+def _compiler() -> Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    global _compile_fn
+    if _compile_fn is None:
+        from browser_use.wap.exact_replay import record_metadata_to_actions
+        _compile_fn = record_metadata_to_actions
+    return _compile_fn
+
+
+def compile_event(event: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Replay actions of one event ([] if it cannot be compiled)."""
+    try:
+        return _compiler()([event])
+    except ImportError:
+        raise
+    except Exception as exc:
+        print(f"[warn] could not compile {event.get('type')} event of {event.get('taskId')}: {exc}")
+        return []
+
+
+def _read_partial(folder: Path) -> Dict[int, List[Dict[str, Any]]]:
+    compiled: Dict[int, List[Dict[str, Any]]] = {}
+    path = folder / PARTIAL_NAME
+    if path.is_file():
+        with path.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break                        # torn tail of an interrupted append
+                compiled[record["seq"]] = record["actions"]
+    return compiled
+
+
+def compiled_actions(folder: str | Path) -> Optional[List[Dict[str, Any]]]:
+    """Exact-replay actions of a logged task folder, in seq order.
+
+    Uses the partial plan written at ingest and compiles only the events it
+    lacks.  Returns None for folders without an event log.
+    """
+    folder = Path(folder)
+    if not has_event_log(folder):
+        return None
+    compiled = _read_partial(folder)
+    log = TaskEventLog(folder)
+    actions: List[Dict[str, Any]] = []
+    for entry in log.entries():
+        seq_actions = compiled.get(entry["seq"])
+        if seq_actions is None:
+            seq_actions = compile_event(log.read(entry))
+        actions.extend(seq_actions)
+    return actions
+
+
+def write_plan(path: str | Path, *, ultimate_goal: str, task_id: str,
+               actions: List[Dict[str, Any]]) -> None:
+    """Atomically write an exact-replay bundle."""
+    path = Path(path)
+    bundle = {
+        "ultimate_goal": ultimate_goal,
+        "task_id": task_id,
+        "type": "exact_replay",
+        "action_list": actions,
+    }
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(bundle, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class LiveCompiler:
+    """Compile events as `EventWriter` appends them; finalize on task-finish."""
+
+    def __init__(self) -> None:
+        self.enabled = True
+
+    def add(self, folder: str | Path, records: List[Dict[str, Any]],
+            entries: List[Dict[str, Any]]) -> None:
+        """Compile freshly logged *records* (with their index *entries*) of one task."""
+        if not self.enabled:
+            return
+        folder = Path(folder)
+        try:
+            lines = [json.dumps({"seq": entry["seq"], "actions": compile_event(record)}, ensure_ascii=False)
+                     for record, entry in zip(records, entries)]
+        except ImportError as exc:
+            print(f"[OTA warning] live compilation disabled, browser_use is not importable: {exc}")
+            self.enabled = False
+            return
+        with (folder / PARTIAL_NAME).open("a", encoding="utf-8") as fh:
+            fh.write("\n".join(lines) + "\n")
+        EVENTS_COMPILED.inc(len(lines))
+
+        if any(record.get("type") == "task-finish" for record in records):
+            self.finalize(folder)
+
+    def finalize(self, folder: str | Path) -> Path:
+        """Write ``exact_replay.json`` for *folder* and return its path."""
+        from utils.action_processing import find_task_prompt   # avoid an import cycle
+
+        folder = Path(folder)
+        try:
+            task_prompt, task_id = find_task_prompt(folder)
+        except SystemExit as exc:             # the CLI helper exits on malformed tasks
+            print(f"[OTA warning] {exc}; writing the plan of {folder.name} without a goal")
+            task_prompt, task_id = "", folder.name
+        path = folder / PLAN_NAME
+        write_plan(path, ultimate_goal=task_prompt, task_id=task_id,
+                   actions=compiled_actions(folder) or [])
+        PLANS_FINALIZED.inc()
+        print(f"[OTA Info] exact-replay plan of {task_id} ready: {path}")
+        return path
@@ -1,23 +1,45 @@
 """Sub-goal generator helper
 
 This tiny helper takes a text prompt, sends it to OpenAI via LangChain,
-and returns the assistant's plain-text reply.
+and returns the assistant's plain-text reply.  Replies are cached on disk
+(see `utils.llm_cache`), so repeated prompts cost no API call.  Each API
+call's tokens and cost are recorded with `utils.llm_usage.record_reply`.
+
+Clients come from a process-wide registry (`get_chat_model`), one per
+(model, temperature), sharing keep-alive HTTP connection pools: a sync pool
+for the process and an async pool per event loop, since asyncio connections
+cannot outlive their loop.  Code that runs a loop awaits `aclose_chat_models`
+before the loop finishes, so the loop's pool is closed instead of leaked.
 """
 from __future__ import annotations
 
+import asyncio
+import atexit
 import os
-from typing import Optional
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
 
+import httpx
 from langchain_openai import ChatOpenAI
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
 
-__all__ = ["ask_llm"]
+from utils.llm_cache import cache_bypassed, cacheable, get_llm_cache
+from utils.llm_usage import record_reply
+
+__all__ = ["aclose_chat_models", "ask_llm", "ask_llm_async", "cached_reply", "get_chat_model"]
+
+# keep-alive pools shared by every client of the process (or event loop)
+HTTP_LIMITS = httpx.Limits(max_connections=int(os.getenv("OTA_LLM_MAX_CONNECTIONS", "32")),
+                           max_keepalive_connections=int(os.getenv("OTA_LLM_MAX_CONNECTIONS", "32")),
+                           keepalive_expiry=60)
+HTTP_TIMEOUT = httpx.Timeout(120, connect=10)
 
 # ---------------------------------------------------------------------------
 # Basic LLM wrapper
 # ---------------------------------------------------------------------------
 
-def _build_llm(model: str = "gpt-4o", temperature: float = 0) -> ChatOpenAI:  # type: ignore
+def _build_llm(model: str = "gpt-4o", temperature: float = 0, **kwargs) -> ChatOpenAI:  # type: ignore
     """Create a LangChain ChatOpenAI client with sane defaults.
 
     Parameters
@@ -27,18 +49,89 @@ def _build_llm(model: str = "gpt-4o", temperature: float = 0) -> ChatOpenAI:  #
         "gpt-4o" or "gpt-4-turbo" if you want higher quality.
     temperature : float
         Sampling temperature.
+    **kwargs
+        Passed on to ChatOpenAI (e.g. ``max_retries``).
     """
     # The key must be available in the environment.  (Raise a clear error if not.)
     if "OPENAI_API_KEY" not in os.environ:
         raise RuntimeError("OPENAI_API_KEY environment variable is not set.")
 
-    return ChatOpenAI(model_name=model, temperature=temperature)
+    return ChatOpenAI(model_name=model, temperature=temperature, **kwargs)
+
+
+class _ClientRegistry:
+    """ChatOpenAI clients by (model, temperature, options), built once."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._http: Optional[httpx.Client] = None
+        self._clients: Dict[Tuple[Any, ...], ChatOpenAI] = {}
+        # event loop → (its async pool, its clients); dropped with the loop
+        self._per_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, Dict]]" = \
+            weakref.WeakKeyDictionary()
+
+    def get(self, model: str, temperature: float, **options: Any) -> ChatOpenAI:
+        key = (model, float(temperature), tuple(sorted(options.items())))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+            if loop is None:
+                clients, async_http = self._clients, None
+            else:
+                if loop not in self._per_loop:
+                    self._per_loop[loop] = (httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT), {})
+                async_http, clients = self._per_loop[loop]
+            client = clients.get(key)
+            if client is None:
+                extra = {"http_async_client": async_http} if async_http is not None else {}
+                client = clients[key] = _build_llm(model, temperature, http_client=self._http,
+                                                   **extra, **options)
+            return client
+
+    async def aclose_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._per_loop.pop(loop, None)
+        if entry is not None:
+            await entry[0].aclose()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._http is not None:
+                self._http.close()
+                self._http = None
+            self._clients.clear()
+
+
+_REGISTRY = _ClientRegistry()
+atexit.register(_REGISTRY.close)
+
+
+def get_chat_model(model: str = "gpt-4o", temperature: float = 0, **options: Any) -> ChatOpenAI:
+    """Shared ChatOpenAI client of (*model*, *temperature*).
+
+    Inside a running event loop the client is bound to that loop's async
+    pool, so call this from the loop that will await it.  *options* (e.g.
+    ``max_retries``) are passed to ChatOpenAI and are part of the key.
+    """
+    return _REGISTRY.get(model, temperature, **options)
+
+
+async def aclose_chat_models() -> None:
+    """Close the running loop's async pool; its clients are dropped and the
+    next `get_chat_model` in this loop builds new ones."""
+    await _REGISTRY.aclose_loop()
 
 
 def ask_llm(prompt: str,
             system_prompt: Optional[str] = None,
             model: str = "gpt-4o",
-            temperature: float = 0) -> str:
+            temperature: float = 0,
+            bypass_cache: bool = False) -> str:
     """Send *prompt* to OpenAI and return the assistant text.
 
     Parameters
@@ -50,24 +143,80 @@ def ask_llm(prompt: str,
     model : str
         OpenAI model name (default: gpt-4o-mini).
     temperature : float
-        Sampling temperature (default 0.2).
+        Sampling temperature (default 0).  Only temperature-0 replies are
+        cached unless ``OTA_LLM_CACHE_ALL_TEMPERATURES=1``.
+    bypass_cache : bool
+        Skip the reply cache lookup (the fresh reply is still stored).
 
     Returns
     -------
     str
         Assistant's plain-text reply.
     """
-    llm = _build_llm(model=model, temperature=temperature)
+    if not bypass_cache:
+        reply = cached_reply(prompt, system_prompt, model, temperature)
+        if reply is not None:
+            return reply
+
+    llm = get_chat_model(model=model, temperature=temperature)
+
+    # Call the chat model.
+    messages = _messages(prompt, system_prompt)
+    response = llm.invoke(messages)  # -> AIMessage
+
+    if not isinstance(response, AIMessage):
+        raise RuntimeError("Unexpected response type from LLM")
+    record_reply(model, response, (system_prompt or "") + prompt)
 
+    return _store(prompt, system_prompt, model, temperature, response.content.strip())
+
+
+def _messages(prompt: str, system_prompt: Optional[str]) -> list:
     messages = []
     if system_prompt:
         messages.append(SystemMessage(content=system_prompt))
     messages.append(HumanMessage(content=prompt))
+    return messages
 
-    # Call the chat model.
-    response = llm(messages)  # -> AIMessage
+
+async def ask_llm_async(prompt: str,
+                        system_prompt: Optional[str] = None,
+                        model: str = "gpt-4o",
+                        temperature: float = 0,
+                        bypass_cache: bool = False) -> str:
+    """Async `ask_llm` for concurrent callers.
+
+    The client does not retry by itself: rate limiting and retries are left to
+    the caller (see `utils.llm_concurrency.call_with_retries`), which sees
+    every 429 of the batch.
+    """
+    if not bypass_cache:
+        reply = cached_reply(prompt, system_prompt, model, temperature)
+        if reply is not None:
+            return reply
+
+    llm = get_chat_model(model=model, temperature=temperature, max_retries=0)
+    response = await llm.ainvoke(_messages(prompt, system_prompt))
 
     if not isinstance(response, AIMessage):
         raise RuntimeError("Unexpected response type from LLM")
+    record_reply(model, response, (system_prompt or "") + prompt)
+
+    return _store(prompt, system_prompt, model, temperature, response.content.strip())
+
+
+def cached_reply(prompt: str, system_prompt: Optional[str] = None,
+                 model: str = "gpt-4o", temperature: float = 0) -> Optional[str]:
+    """The cached reply to this exact query, or None (also when the cache is
+    off or bypassed, or *temperature* is not `cacheable`)."""
+    cache = get_llm_cache()
+    if cache is None or cache_bypassed() or not cacheable(temperature):
+        return None
+    return cache.get(model, temperature, system_prompt, prompt)
+
 
-    return response.content.strip()
+def _store(prompt: str, system_prompt: Optional[str], model: str, temperature: float, reply: str) -> str:
+    cache = get_llm_cache()
+    if cache is not None and reply and cacheable(temperature):
+        cache.put(model, temperature, system_prompt, prompt, reply)
+    return reply
@@ -0,0 +1,215 @@
+"""Disk-backed cache of LLM replies.
+
+`utils.llm.ask_llm` / `ask_llm_async` look a reply up here before calling
+the API and store it afterwards, keyed by the SHA-256 of (model, temperature,
+system prompt, prompt), so rebuilding unchanged recordings at temperature 0
+makes no LLM call at all.  Only temperature-0 queries are cached by default:
+a sampled reply is one draw among many, and replaying it would make every
+rerun return the same draw.  Entries older than ``max_age_days`` are dropped,
+and the least recently used ones go when the replies exceed ``max_mb``.
+
+Configuration (environment):
+
+    OTA_LLM_CACHE                  cache file (default data_processed/llm_cache.sqlite3), "off" disables it
+    OTA_LLM_CACHE_BYPASS=1         skip lookups; fresh replies still replace the cached ones
+    OTA_LLM_CACHE_ALL_TEMPERATURES=1   also cache queries at temperature > 0
+    OTA_LLM_CACHE_MAX_MB           default 256
+    OTA_LLM_CACHE_MAX_AGE_DAYS     default 90, 0 keeps entries forever
+
+Usage
+-----
+python utils/llm_cache.py stats [--cache_path data_processed/llm_cache.sqlite3]
+python utils/llm_cache.py evict [--max_mb 256] [--max_age_days 90]
+python utils/llm_cache.py clear
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from utils.metrics import REGISTRY
+
+__all__ = ["LLMCache", "cache_bypassed", "cache_key", "cacheable", "get_llm_cache"]
+
+DEFAULT_CACHE_PATH = "data_processed/llm_cache.sqlite3"
+EVICT_EVERY = 100                   # puts between two eviction passes
+
+LOOKUPS = REGISTRY.counter("llm_cache_lookups_total", "LLM reply cache lookups.", ("result",))
+EVICTIONS = REGISTRY.counter("llm_cache_evictions_total", "LLM replies evicted from the cache.")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replies (
+    key         TEXT PRIMARY KEY,
+    model       TEXT,
+    temperature REAL,
+    reply       TEXT    NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL    NOT NULL,
+    last_used   REAL    NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_replies_last_used  ON replies(last_used);
+CREATE INDEX IF NOT EXISTS idx_replies_created_at ON replies(created_at);
+"""
+
+
+def cache_key(model: str, temperature: float, system_prompt: Optional[str], prompt: str) -> str:
+    payload = json.dumps([model, float(temperature), system_prompt or "", prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_bypassed() -> bool:
+    return os.getenv("OTA_LLM_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+
+def cacheable(temperature: float) -> bool:
+    """Whether queries at *temperature* use the cache (temperature 0 only, by default)."""
+    return float(temperature) == 0 or \
+        os.getenv("OTA_LLM_CACHE_ALL_TEMPERATURES", "").lower() in ("1", "true", "yes")
+
+
+class LLMCache:
+    """SQLite file of replies; safe to share between threads and processes."""
+
+    def __init__(self, db_path: str | Path, *, max_mb: float = 256, max_age_days: float = 90) -> None:
+        self.db_path = Path(db_path)
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else 0
+        self.max_age = max_age_days * 86400 if max_age_days else 0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self.evict()
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMCache"]:
+        path = os.getenv("OTA_LLM_CACHE", DEFAULT_CACHE_PATH)
+        if path.lower() in ("", "0", "off", "none"):
+            return None
+        return cls(path, max_mb=float(os.getenv("OTA_LLM_CACHE_MAX_MB", "256")),
+                   max_age_days=float(os.getenv("OTA_LLM_CACHE_MAX_AGE_DAYS", "90")))
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def get(self, model: str, temperature: float, system_prompt: Optional[str], prompt: str) -> Optional[str]:
+        key = cache_key(model, temperature, system_prompt, prompt)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT reply, created_at FROM replies WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age and row[1] < now - self.max_age:
+                row = None                      # expired; replaced by the next put
+            if row is not None:
+                self._conn.execute("UPDATE replies SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        result = "hit" if row is not None else "miss"
+        self.counters["hits" if row is not None else "misses"] += 1
+        LOOKUPS.labels(result=result).inc()
+        return row[0] if row is not None else None
+
+    def put(self, model: str, temperature: float, system_prompt: Optional[str], prompt: str,
+            reply: str) -> None:
+        key = cache_key(model, temperature, system_prompt, prompt)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO replies (key, model, temperature, reply, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, float(temperature), reply, len(reply.encode("utf-8")), now, now),
+            )
+            self._puts += 1
+            self.counters["writes"] += 1
+        if self._puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones down to 90 % of the size limit."""
+        removed = 0
+        with self._lock, self._conn:
+            if self.max_age:
+                removed += self._conn.execute("DELETE FROM replies WHERE created_at < ?",
+                                              (time.time() - self.max_age,)).rowcount
+            if self.max_bytes:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM replies").fetchone()[0]
+                if total > self.max_bytes:
+                    excess, victims = total - int(self.max_bytes * 0.9), []
+                    for key, size in self._conn.execute("SELECT key, size FROM replies ORDER BY last_used"):
+                        if excess <= 0:
+                            break
+                        victims.append((key,))
+                        excess -= size
+                    self._conn.executemany("DELETE FROM replies WHERE key = ?", victims)
+                    removed += len(victims)
+        if removed:
+            self.counters["evictions"] += removed
+            EVICTIONS.inc(removed)
+        return removed
+
+    def clear(self) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM replies").rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        entries, size, hits = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM replies").fetchone()
+        return {**self.counters, "entries": entries, "bytes": size, "lifetime_hits": hits}
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+_cache_loaded = False
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """The process-wide cache configured by the environment (None when disabled)."""
+    global _cache, _cache_loaded
+    with _cache_lock:
+        if not _cache_loaded:
+            _cache = LLMCache.from_env()
+            _cache_loaded = True
+    return _cache
+
+
+# ---------------------------------------------------------------------------
+# command-line interface
+# ---------------------------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect and trim the LLM reply cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("stats", "print entry count and size"),
+                            ("evict", "apply the age and size limits now"),
+                            ("clear", "delete every cached reply")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--cache_path", default=os.getenv("OTA_LLM_CACHE", DEFAULT_CACHE_PATH))
+        if name == "evict":
+            p.add_argument("--max_mb", type=float, default=float(os.getenv("OTA_LLM_CACHE_MAX_MB", "256")))
+            p.add_argument("--max_age_days", type=float,
+                           default=float(os.getenv("OTA_LLM_CACHE_MAX_AGE_DAYS", "90")))
+    args = parser.parse_args()
+
+    if args.command == "evict":
+        cache = LLMCache(args.cache_path, max_mb=args.max_mb, max_age_days=args.max_age_days)
+    else:
+        cache = LLMCache(args.cache_path, max_mb=0, max_age_days=0)
+
+    if args.command == "clear":
+        print(f"[OTA Info] removed {cache.clear()} cached replies from {cache.db_path}")
+    elif args.command == "evict":
+        print(f"[OTA Info] evicted {cache.counters['evictions']} cached replies from {cache.db_path}")
+    stats = cache.stats()
+    print(f"[OTA Info] {cache.db_path}: {stats['entries']} replies, {stats['bytes'] / 1e6:.1f} MB, "
+          f"{stats['lifetime_hits']} hits served")
+
+
+if __name__ == "__main__":
+    main()
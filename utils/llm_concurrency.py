@@ -0,0 +1,184 @@
+"""Bounded, rate-limited concurrency for batches of LLM calls.
+
+    RateLimiter        requests- and tokens-per-minute budget shared by the calls
+    call_with_retries  one call, retried with jittered backoff on 429/5xx
+    ordered_fan_out    run calls concurrently, hand results over in input order
+
+`utils.subgoal_generator.generate_subgoals_async` puts the three together;
+nothing here depends on a particular LLM client.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+__all__ = ["RateLimiter", "call_with_retries", "is_retryable", "ordered_fan_out"]
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+RETRY_STATUSES = frozenset({408, 409, 429})         # plus every 5xx
+RETRY_ERRORS = ("APIConnectionError", "APITimeoutError", "TimeoutError", "ConnectionError")
+
+
+class _Bucket:
+    """Token bucket refilled continuously at *per_minute* / 60 per second."""
+
+    def __init__(self, per_minute: float, now: float) -> None:
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.rate = self.capacity / 60
+        self.stamp = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+        amount = min(amount, self.capacity)        # a request larger than a minute's budget waits for a full one
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits; ``None`` disables one.
+
+    Callers are served first come, first served.  `pause` holds every caller
+    back, e.g. for the ``Retry-After`` of a 429.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, *,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep) -> None:
+        now = clock()
+        self._requests = _Bucket(rpm, now) if rpm else None
+        self._tokens = _Bucket(tpm, now) if tpm else None
+        self._clock = clock
+        self._sleep = sleep
+        self._resume_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None  # created in the running loop
+
+    def pause(self, seconds: float) -> None:
+        self._resume_at = max(self._resume_at, self._clock() + seconds)
+
+    async def acquire(self, tokens: int = 0) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = self._clock()
+                wait = self._resume_at - now
+                if self._requests is not None:
+                    wait = max(wait, self._requests.wait_time(1, now))
+                if self._tokens is not None and tokens:
+                    wait = max(wait, self._tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    break
+                await self._sleep(wait)
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None and tokens:
+                self._tokens.take(tokens)
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for rate limiting, server errors, timeouts and dropped connections."""
+    status = _status(exc)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    return any(cls.__name__ in RETRY_ERRORS for cls in type(exc).__mro__)
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, exc: Optional[BaseException] = None, *, base: float = 1.0,
+                  cap: float = 60.0, rng: Callable[[], float] = random.random) -> float:
+    """The server's ``Retry-After`` if it sent one, else full-jitter exponential backoff."""
+    retry_after = _retry_after(exc) if exc is not None else None
+    if retry_after is not None:
+        return min(cap, retry_after)
+    return rng() * min(cap, base * 2 ** attempt)
+
+
+async def call_with_retries(fn: Callable[[], Awaitable[R]], *, limiter: Optional[RateLimiter] = None,
+                            tokens: int = 0, max_retries: int = 5, base_delay: float = 1.0,
+                            max_delay: float = 60.0,
+                            sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep) -> R:
+    """Await ``fn()`` within *limiter*, retrying retryable errors up to *max_retries* times."""
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire(tokens)
+        try:
+            return await fn()
+        except Exception as exc:
+            if attempt >= max_retries or not is_retryable(exc):
+                raise
+            delay = backoff_delay(attempt, exc, base=base_delay, cap=max_delay)
+            if limiter is not None and _status(exc) == 429:
+                limiter.pause(delay)            # the whole batch is over the limit, not just this call
+            attempt += 1
+            print(f"[OTA warning] LLM call failed ({type(exc).__name__}); "
+                  f"retry {attempt}/{max_retries} in {delay:.1f}s")
+            await sleep(delay)
+
+
+async def ordered_fan_out(items: Iterable[T], call: Callable[[T], Awaitable[R]], *, concurrency: int = 8,
+                          emit: Optional[Callable[[int, T, R], None]] = None) -> List[R]:
+    """Run ``call(item)`` for every item, at most *concurrency* at a time.
+
+    *items* is consumed lazily, one item per free slot.  *emit* receives
+    ``(index, item, result)`` in input order as soon as every earlier result
+    is in, and the results are returned in input order.  If a call fails, no
+    new calls are started, the ones in flight finish, and the first error is
+    raised; results before the failed item have been emitted by then.
+    """
+    slots = asyncio.Semaphore(max(1, concurrency))
+    inputs: Dict[int, T] = {}
+    done: Dict[int, R] = {}
+    ordered: List[R] = []
+    failures: List[BaseException] = []
+
+    async def run(index: int, item: T) -> None:
+        try:
+            done[index] = await call(item)
+        except Exception as exc:
+            failures.append(exc)
+            return
+        finally:
+            slots.release()
+        while len(ordered) in done:             # hand over the contiguous prefix
+            i = len(ordered)
+            ordered.append(done.pop(i))
+            if emit is not None:
+                emit(i, inputs.pop(i), ordered[i])
+
+    tasks: List[asyncio.Task] = []
+    for index, item in enumerate(items):
+        await slots.acquire()
+        if failures:
+            slots.release()
+            break
+        inputs[index] = item
+        tasks.append(asyncio.create_task(run(index, item)))
+    await asyncio.gather(*tasks)
+    if failures:
+        raise failures[0]
+    return ordered
@@ -0,0 +1,153 @@
+"""Token and cost accounting of LLM calls.
+
+Every LLM call of the pipeline reports its input and output tokens with
+`record_usage`.  The counts come from the provider's usage metadata when the
+reply carries it (`usage_of`), and from `utils.tokenizer.count_tokens`
+otherwise.  Each call is added to the process totals (`TOTAL`, the
+``llm_tokens_total`` / ``llm_cost_usd_total`` metrics) and to every
+`track_usage` scope open in the calling context.  An agent run opens one
+scope for the task and reads its step deltas from it.
+
+Prices are USD per million input / output tokens, matched by the longest
+model-name prefix (``gpt-4o-2024-08-06`` is priced as ``gpt-4o``).
+``OTA_LLM_PRICES='{"my-model": [1.0, 2.0]}'`` adds or overrides entries;
+models without a price are counted but cost None.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from utils.metrics import REGISTRY
+from utils.tokenizer import count_tokens
+
+__all__ = ["PRICES", "TOTAL", "Usage", "record_reply", "record_usage", "token_cost", "track_usage", "usage_of"]
+
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "o3-mini": (1.10, 4.40),
+    "o4-mini": (1.10, 4.40),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+}
+PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("OTA_LLM_PRICES", "{}")).items()})
+
+TOKENS = REGISTRY.counter("llm_tokens_total", "LLM tokens sent and received.", ("model", "direction"))
+COST = REGISTRY.counter("llm_cost_usd_total", "Estimated LLM cost in USD.", ("model",))
+
+
+def token_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """USD cost of a call, or None when *model* has no known price."""
+    prefix = max((p for p in PRICES if model.startswith(p)), key=len, default=None)
+    if prefix is None:
+        return None
+    price_in, price_out = PRICES[prefix]
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+class Usage:
+    """Input/output tokens and cost of a set of LLM calls, per model and in total."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.unpriced_calls = 0             # calls to models without a price, not in ``cost``
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, model: str, input_tokens: int, output_tokens: int, cost: Optional[float]) -> None:
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            entry = self.by_model.setdefault(model, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0})
+            entry["calls"] += 1
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            if cost is None:
+                self.unpriced_calls += 1
+                entry["cost"] = None
+            else:
+                self.cost += cost
+                if entry["cost"] is not None:
+                    entry["cost"] += cost
+
+    def record_reply(self, model: str, reply: Any, prompt_text: str = "",
+                     input_tokens: Optional[int] = None) -> Optional[float]:
+        """`record_reply` into this usage as well as the process totals and open scopes
+        (the recorder the browser_use agent and controller are given)."""
+        with track_usage(self):
+            return record_reply(model, reply, prompt_text, input_tokens)
+
+    def totals(self) -> Tuple[int, int, float]:
+        """(input tokens, output tokens, cost), e.g. to diff before and after a step."""
+        with self._lock:
+            return self.input_tokens, self.output_tokens, self.cost
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": self.calls, "input_tokens": self.input_tokens, "output_tokens": self.output_tokens,
+                    "cost_usd": round(self.cost, 6), "unpriced_calls": self.unpriced_calls,
+                    "by_model": {m: dict(e) for m, e in self.by_model.items()}}
+
+
+TOTAL = Usage()
+_SCOPES: ContextVar[Tuple[Usage, ...]] = ContextVar("ota_llm_usage_scopes", default=())
+
+
+@contextmanager
+def track_usage(usage: Optional[Usage] = None) -> Iterator[Usage]:
+    """Collect the calls made in this context (and the tasks it starts) into *usage*."""
+    usage = usage if usage is not None else Usage()
+    token = _SCOPES.set(_SCOPES.get() + (usage,))
+    try:
+        yield usage
+    finally:
+        _SCOPES.reset(token)
+
+
+def usage_of(message: Any) -> Optional[Tuple[int, int]]:
+    """(input, output) tokens reported with a chat reply, or None if it carries no usage."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage and usage.get("input_tokens") is not None:
+        return int(usage["input_tokens"]), int(usage.get("output_tokens") or 0)
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage")
+    if usage and usage.get("prompt_tokens") is not None:
+        return int(usage["prompt_tokens"]), int(usage.get("completion_tokens") or 0)
+    return None
+
+
+def record_usage(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """Account one LLM call; return its cost (None when the model has no price)."""
+    cost = token_cost(model, input_tokens, output_tokens)
+    TOTAL.add(model, input_tokens, output_tokens, cost)
+    for usage in _SCOPES.get():
+        usage.add(model, input_tokens, output_tokens, cost)
+    TOKENS.labels(model=model, direction="input").inc(input_tokens)
+    TOKENS.labels(model=model, direction="output").inc(output_tokens)
+    if cost is not None:
+        COST.labels(model=model).inc(cost)
+    return cost
+
+
+def record_reply(model: str, reply: Any, prompt_text: str = "",
+                 input_tokens: Optional[int] = None) -> Optional[float]:
+    """`record_usage` of a chat reply, counting tokens when the provider reports none
+    (the input as *input_tokens* if given, else the tokens of *prompt_text*)."""
+    usage = usage_of(reply)
+    if usage is None:
+        content = reply.content if isinstance(getattr(reply, "content", None), str) else str(reply)
+        if input_tokens is None:
+            input_tokens = count_tokens(prompt_text, model)
+        usage = (input_tokens, count_tokens(content, model))
+    return record_usage(model, *usage)
@@ -0,0 +1,254 @@
+"""Minimal in-process metrics in the Prometheus text format.
+
+Counters, gauges and histograms with optional labels, rendered by
+`MetricsRegistry.render` for a ``/metrics`` endpoint.  Kept in-repo (rather
+than depending on prometheus_client) because the collector only needs these
+three types; every update is a dict lookup plus a lock, so it is cheap enough
+to leave on while recording.
+
+    REQUESTS = REGISTRY.counter("collector_requests_total", "Requests served.", ("route",))
+    REQUESTS.labels(route="/action-data").inc()
+"""
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+__all__ = ["CONTENT_TYPE", "REGISTRY", "Counter", "Gauge", "Histogram", "MetricsRegistry"]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; from sub-millisecond handler work to multi-second fsync stalls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 max_series: Optional[int] = None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._series: "OrderedDict[LabelValues, object]" = OrderedDict()
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def _child(self, values: LabelValues):
+        """Return the state of one label set; least recently used sets are
+        evicted beyond *max_series* (for per-task labels)."""
+        state = self._series.get(values)
+        if state is None:
+            state = self._series[values] = self._new_value()
+            if self.max_series is not None and len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+        elif self.max_series is not None:
+            self._series.move_to_end(values)
+        return state
+
+    def labels(self, *values: str, **kwargs: str) -> "_Bound":
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return _Bound(self, tuple(str(v) for v in values))
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Bound:
+    """A metric with its label values filled in."""
+
+    __slots__ = ("_metric", "_values")
+
+    def __init__(self, metric: _Metric, values: LabelValues) -> None:
+        self._metric = metric
+        self._values = values
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._metric._inc(self._values, amount)
+
+    def set(self, value: float) -> None:
+        self._metric._set(self._values, value)
+
+    def observe(self, value: float) -> None:
+        self._metric._observe(self._values, value)
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_value(self):
+        return [0.0]
+
+    def _inc(self, values: LabelValues, amount: float) -> None:
+        if amount < 0:
+            raise ValueError("counters can only increase")
+        with self._lock:
+            self._child(values)[0] += amount
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._inc((), amount)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_label_str(self.labelnames, values)} {_format_value(state[0])}"
+                for values, state in self._series.items()]
+
+
+class Gauge(_Metric):
+    """Gauge set directly, or read from *fn* at render time (e.g. a queue depth)."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, fn: Optional[Callable[[], float]] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._fn = fn
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        self._fn = fn
+
+    def _new_value(self):
+        return [0.0]
+
+    def _set(self, values: LabelValues, value: float) -> None:
+        with self._lock:
+            self._child(values)[0] = value
+
+    def _inc(self, values: LabelValues, amount: float) -> None:
+        with self._lock:
+            self._child(values)[0] += amount
+
+    def set(self, value: float) -> None:
+        self._set((), value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._inc((), amount)
+
+    def _samples(self) -> List[str]:
+        if self._fn is not None and not self.labelnames:
+            try:
+                value = float(self._fn())
+            except Exception:                 # a dead callback must not break /metrics
+                return []
+            return [f"{self.name} {_format_value(value)}"]
+        return [f"{self.name}{_label_str(self.labelnames, values)} {_format_value(state[0])}"
+                for values, state in self._series.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        # per-bucket (non-cumulative) counts + the +Inf bucket, then sum
+        return [[0] * (len(self.buckets) + 1), 0.0]
+
+    def _observe(self, values: LabelValues, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._child(values)
+            state[0][index] += 1
+            state[1] += value
+
+    def observe(self, value: float) -> None:
+        self._observe((), value)
+
+    def time(self):
+        return _Bound(self, ()).time()
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, values, le)} {cumulative}")
+            labels = _label_str(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named collection of metrics; registering a name twice returns the first one."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                max_series: Optional[int] = None) -> Counter:
+        return self._register(Counter, name, documentation, labelnames, max_series)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames, fn=fn)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,253 @@
+"""Event-anchored pruning of page snapshots for sub-goal prompts.
+
+A sub-goal depends on the region of the page around the recorded target and
+on the elements the action changed, not on the whole 100–200 KB snapshot.
+`prune_page` locates those anchors in the snapshot:
+
+    eventTarget.targetId / eventTarget.target    the element the user acted on
+    every "selector" inside allEvents             changed nodes, submitted fields
+    eventTarget.target of a navigation            links to the new URL
+
+and fills a token budget by relevance: each anchor subtree first, then its
+siblings (nearest first) and those of its ancestors, with the ancestor
+chain kept as a skeleton.  Subtrees that do not fit are opened and their
+children ranked in turn; whatever is left out is marked ``#rme`` — the same
+marker the extension uses for hidden children, which the prompts explain.
+Without anchors (task-finish) the page is kept top-down from its landmarks
+(h1, main, forms).
+
+Pruning runs on the raw snapshot, before sanitization, because ids and
+classes are needed to resolve anchors (and sanitizing less is cheaper).
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import math
+import os
+import re
+from copy import deepcopy
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import lxml.html
+from lxml import etree
+
+__all__ = ["DEFAULT_TOKEN_BUDGET", "estimate_tokens", "find_anchors", "prune_page"]
+
+# ≈ tokens of page_content in a prompt; 0 (the default) keeps the whole page.
+# Pruning changes what the LLM sees, so it is opt-in: e.g. OTA_PAGE_TOKEN_BUDGET=3000
+DEFAULT_TOKEN_BUDGET = int(os.getenv("OTA_PAGE_TOKEN_BUDGET", "0"))
+
+TAG_TOKENS = 2              # a sanitized tag pair costs about this much
+ANCESTOR_DECAY = 0.6        # relevance lost per level above an anchor
+SIBLING_DECAY = 0.85        # ... and per sibling away from the anchor's branch
+CHILD_DECAY = 0.9           # ... and per level when a subtree has to be opened
+MAX_SIBLINGS = 25           # per side and level
+HIDDEN = "#rme"
+
+_DROP_TAGS = ("script", "style", "noscript", "template", "svg", "link", "meta")
+_WS = re.compile(r"\s+")
+# attributes the sanitizer profiles keep (utils/html_cleaner.py), counted in the budget
+_KEPT_ATTRS = ("href", "id", "name", "aria-label", "role", "alt", "title")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (≈ 4 characters per token)."""
+    return math.ceil(len(text) / 4)
+
+
+def _norm(text: str) -> str:
+    return _WS.sub(" ", text.replace(HIDDEN, " ")).strip()
+
+
+# ---------------------------------------------------------------------------
+# anchors
+# ---------------------------------------------------------------------------
+def _class_test(classes: List[str]) -> str:
+    return " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {c} ')"
+                        for c in classes if "'" not in c)
+
+
+def _select(root, selector: str) -> List[Any]:
+    """Resolve a selector recorded by the extension (``nodeToSelector``):
+    ``#id``, ``TAG.cls.cls`` or ``TAG``, joined by `` > ``."""
+    steps = [s.strip() for s in selector.split(" > ")]
+    steps = [s for s in steps if s and not s.startswith("(")]     # (text), (comment)
+    matches: Optional[List[Any]] = None
+    for i, step in enumerate(steps):
+        if step.startswith("#"):
+            if "'" in step:
+                return []
+            path = f"//*[@id='{step[1:]}']"
+        else:
+            tag, *classes = step.split(".")
+            if not re.fullmatch(r"[A-Za-z][A-Za-z0-9-]*", tag):
+                return []
+            test = _class_test(classes)
+            path = tag.lower() + (f"[{test}]" if test else "")
+            path = ("//" if i == 0 else "") + path
+        if matches is None or step.startswith("#"):
+            matches = root.xpath(path)
+        else:
+            matches = [child for parent in matches for child in parent.xpath(path)]
+        if not matches:
+            return []
+    return matches or []
+
+
+def _iter_selectors(value: Any) -> Iterator[str]:
+    if isinstance(value, dict):
+        selector = value.get("selector")
+        if isinstance(selector, str):
+            yield selector
+        for item in value.values():
+            if isinstance(item, (dict, list)):
+                yield from _iter_selectors(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_selectors(item)
+
+
+def _by_snippet(root, snippet: str) -> List[Any]:
+    """Elements matching the outerHTML excerpt recorded as eventTarget.target."""
+    try:
+        el = lxml.html.fragment_fromstring(snippet, create_parent="div")
+    except (etree.ParserError, ValueError):
+        return []
+    el = next(iter(el), None)
+    if el is None or not isinstance(el.tag, str):
+        return []
+    if el.get("id"):
+        found = root.xpath("//*[@id=$id]", id=el.get("id"))
+        if found:
+            return found
+    test = _class_test((el.get("class") or "").split())
+    candidates = root.xpath(f"//{el.tag}" + (f"[{test}]" if test else ""))
+    text = _norm(el.text_content())[:200]
+    if text:
+        candidates = [c for c in candidates if _norm(c.text_content())[:200] == text]
+    return candidates if len(candidates) <= 3 else []
+
+
+def find_anchors(root, event: Dict[str, Any]) -> List[Tuple[Any, float]]:
+    """(element, weight) pairs the event points at, strongest first."""
+    anchors: List[Tuple[Any, float]] = []
+    target = event.get("eventTarget") or {}
+    if isinstance(target, dict):
+        if target.get("type") == "navigation" and isinstance(target.get("target"), str):
+            url = target["target"]
+            anchors += [(a, 0.7) for a in root.xpath("//a[@href=$url]", url=url)]
+        else:
+            if target.get("targetId"):
+                anchors += [(el, 1.0) for el in root.xpath("//*[@id=$id]", id=str(target["targetId"]))]
+            if not anchors and isinstance(target.get("target"), str):
+                anchors += [(el, 1.0) for el in _by_snippet(root, target["target"])]
+    for selector in dict.fromkeys(_iter_selectors(event.get("allEvents"))):
+        anchors += [(el, 0.8) for el in _select(root, selector)[:3]]
+    if not anchors:
+        for path, weight in (("//h1", 0.5), ("//main | //*[@role='main']", 0.45), ("//form", 0.4)):
+            anchors += [(el, weight) for el in root.xpath(path)[:3]]
+    return anchors
+
+
+# ---------------------------------------------------------------------------
+# budgeted selection
+# ---------------------------------------------------------------------------
+def _own_tokens(el) -> int:
+    text = " ".join(filter(None, (el.text, el.tail, *(el.get(a) for a in _KEPT_ATTRS))))
+    return TAG_TOKENS + estimate_tokens(_norm(text))
+
+
+def _emit(el, full: Set[Any], shells: Set[Any]):
+    if el in full:
+        return deepcopy(el)
+    copy = etree.Element(el.tag, attrib=dict(el.attrib))
+    copy.text, copy.tail = el.text, el.tail
+    hidden = False
+    for child in el:
+        if child in full or child in shells:
+            copy.append(_emit(child, full, shells))
+            hidden = False
+        elif not hidden:
+            last = copy[-1] if len(copy) else None
+            if last is None:
+                copy.text = (copy.text or "") + HIDDEN
+            else:
+                last.tail = (last.tail or "") + HIDDEN
+            hidden = True
+    return copy
+
+
+def prune_page(html: str, event: Dict[str, Any], token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """Keep the part of *html* most relevant to *event* within *token_budget*.
+
+    Pages that already fit are returned unchanged; so is everything when the
+    budget is 0 or the snapshot cannot be parsed.
+    """
+    if not html or token_budget <= 0 or estimate_tokens(html) <= token_budget:
+        return html
+    try:
+        root = lxml.html.fragment_fromstring(html, create_parent="div")
+    except (etree.ParserError, ValueError):
+        return html
+    etree.strip_elements(root, *_DROP_TAGS, etree.Comment, etree.ProcessingInstruction, with_tail=False)
+
+    nodes = list(root.iter(etree.Element))      # keeps the proxies (set/dict keys) alive
+    cost: Dict[Any, int] = {}
+    for el in reversed(nodes):                  # children before parents
+        cost[el] = _own_tokens(el) + sum(cost[c] for c in el if c in cost)
+    if cost[root] <= token_budget:
+        return html
+
+    order = itertools.count()
+    heap: List[Tuple[float, int, Any]] = []
+
+    def push(el, score: float) -> None:
+        heapq.heappush(heap, (-score, next(order), el))
+
+    for anchor, weight in find_anchors(root, event) or [(root, 0.5)]:
+        push(anchor, weight)
+        child, level = anchor, 1
+        for parent in anchor.iterancestors():
+            siblings = list(parent)
+            index = siblings.index(child)
+            for distance in range(1, MAX_SIBLINGS + 1):
+                score = weight * ANCESTOR_DECAY ** level * SIBLING_DECAY ** distance
+                for i in (index - distance, index + distance):
+                    if 0 <= i < len(siblings):
+                        push(siblings[i], score)
+            if parent is root:
+                break
+            child, level = parent, level + 1
+
+    full: Set[Any] = set()
+    shells: Set[Any] = set()
+    opened: Set[Any] = set()
+    remaining = token_budget
+    while heap and remaining > TAG_TOKENS:
+        neg_score, _, el = heapq.heappop(heap)
+        if el in full or any(a in full for a in el.iterancestors()):
+            continue
+        chain = [a for a in el.iterancestors() if a not in shells]
+        chain_cost = sum(_own_tokens(a) for a in chain)
+        if cost[el] + chain_cost <= remaining:
+            full.add(el)
+            remaining -= cost[el] + chain_cost
+        elif len(el) and el not in opened:
+            # too big: keep the tag, rank its children instead
+            shell_cost = chain_cost + (0 if el in shells else _own_tokens(el))
+            if shell_cost > remaining:
+                continue
+            shells.add(el)
+            opened.add(el)
+            remaining -= shell_cost
+            for child in el:
+                push(child, -neg_score * CHILD_DECAY)
+        else:
+            continue
+        shells.update(chain)
+
+    if not full and not shells:
+        return ""
+    pruned = _emit(root, full, shells) if root not in full else root
+    return (pruned.text or "") + "".join(etree.tostring(c, encoding="unicode", method="html") for c in pruned)
@@ -0,0 +1,224 @@
+"""In-process job queue for replays served over HTTP (wap_service.py).
+
+A replay takes minutes, so the service does not run it inside the request:
+`JobQueue.submit` queues a `Job` and returns at once, and a fixed pool of
+worker tasks on the service's event loop runs the jobs.  Each worker builds
+its resources once with ``setup()`` (a browser, kept warm across jobs) and
+passes them to every ``runner(job, resources, progress)`` call.  A job that
+fails has its worker's resources rebuilt before the next one, in case the
+failure left them broken.
+
+Progress is a list of events per job (queued, started, every ``progress``
+call, finished), which `JobQueue.events` streams to server-sent-event
+clients and `JobQueue.wait` long-polls on.  Finished jobs are kept in memory
+up to ``keep_finished``, oldest dropped first.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from utils.metrics import REGISTRY
+
+__all__ = ["Job", "JobQueue", "QueueFull"]
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+JOBS = REGISTRY.counter("replay_jobs_total", "Replay jobs by final status.", ("status",))
+JOB_SECONDS = REGISTRY.histogram("replay_job_seconds", "Replay job run time.",
+                                 buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200))
+JOBS_QUEUED = REGISTRY.gauge("replay_jobs_queued", "Replay jobs waiting for a worker.")
+JOBS_RUNNING = REGISTRY.gauge("replay_jobs_running", "Replay jobs being run.")
+
+
+class QueueFull(Exception):
+    """More jobs are waiting than the queue accepts."""
+
+
+class Job:
+    def __init__(self, params: Dict[str, Any]) -> None:
+        self.id = uuid.uuid4().hex[:16]
+        self.params = params
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    async def publish(self, kind: str, **data: Any) -> None:
+        async with self._changed:
+            self.events.append({"seq": len(self.events), "type": kind, "time": time.time(), **data})
+            self._changed.notify_all()
+
+    def to_dict(self, events: bool = False) -> Dict[str, Any]:
+        out = {"id": self.id, "status": self.status, "params": self.params, "created_at": self.created_at,
+               "started_at": self.started_at, "finished_at": self.finished_at,
+               "result": self.result, "error": self.error}
+        if events:
+            out["events"] = self.events
+        return out
+
+
+Runner = Callable[[Job, Any, Callable[..., Awaitable[None]]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueue:
+    """Run jobs with ``workers`` concurrent workers; at most ``max_queued`` wait."""
+
+    def __init__(self, runner: Runner, *, workers: int = 2, max_queued: int = 100, keep_finished: int = 500,
+                 setup: Optional[Callable[[], Awaitable[Any]]] = None,
+                 teardown: Optional[Callable[[Any], Awaitable[None]]] = None) -> None:
+        self.runner = runner
+        self.workers = workers
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self.setup = setup
+        self.teardown = teardown
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        JOBS_QUEUED.set_function(lambda: self._queue.qsize() if self._queue is not None else 0)
+        JOBS_RUNNING.set_function(lambda: self._running)
+
+    # -- lifecycle -------------------------------------------------------------
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(n), name=f"replay-worker-{n}") for n in range(self.workers)]
+
+    async def close(self) -> None:
+        for job in self._jobs.values():
+            if not job.finished:
+                await self._finish(job, CANCELLED, error="service shutting down")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # -- API -------------------------------------------------------------------
+    async def submit(self, **params: Any) -> Job:
+        if self._queue is None:
+            raise RuntimeError("job queue is not started")
+        if self._queue.qsize() >= self.max_queued:
+            raise QueueFull(f"{self._queue.qsize()} jobs are already waiting")
+        job = Job(params)
+        self._jobs[job.id] = job
+        self._prune()
+        await job.publish(QUEUED, position=self._queue.qsize() + 1)
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    async def cancel(self, job: Job) -> None:
+        if job.finished:
+            return
+        if job.task is not None:
+            job.task.cancel()                   # the worker records the cancellation
+        else:
+            await self._finish(job, CANCELLED)  # still queued: the worker skips it
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Return once *job* has finished, or after *timeout* seconds."""
+        async with job._changed:
+            try:
+                await asyncio.wait_for(job._changed.wait_for(lambda: job.finished), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def events(self, job: Job, after: int = -1) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the events of *job* with seq > *after*, live, until it has finished."""
+        seen = after + 1
+        while True:
+            async with job._changed:
+                await job._changed.wait_for(lambda: len(job.events) > seen or job.finished)
+                new, done = job.events[seen:], job.finished
+            for event in new:
+                yield event
+            seen += len(new)
+            if done and seen >= len(job.events):
+                return
+
+    # -- workers ---------------------------------------------------------------
+    async def _worker(self, n: int) -> None:
+        resources = None
+        try:
+            while True:
+                job = await self._queue.get()
+                if job.finished:                # cancelled while queued
+                    continue
+                if resources is None and self.setup is not None:
+                    try:
+                        resources = await self.setup()
+                    except Exception as exc:
+                        await self._finish(job, FAILED, error=f"worker setup failed: {exc}")
+                        continue
+                ok = await self._run(job, resources, n)
+                if not ok and resources is not None and self.teardown is not None:
+                    await self._teardown(resources)
+                    resources = None
+        finally:
+            if resources is not None and self.teardown is not None:
+                await self._teardown(resources)
+
+    async def _run(self, job: Job, resources: Any, worker: int) -> bool:
+        async def progress(kind: str = "progress", **data: Any) -> None:
+            await job.publish(kind, **data)
+
+        job.status, job.started_at = RUNNING, time.time()
+        self._running += 1
+        await job.publish(RUNNING, worker=worker)
+        job.task = asyncio.create_task(self.runner(job, resources, progress))
+        try:
+            result = await job.task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise                           # the worker itself is being stopped
+            await self._finish(job, CANCELLED)
+            return False
+        except Exception as exc:
+            await self._finish(job, FAILED, error=f"{type(exc).__name__}: {exc}")
+            return False
+        finally:
+            self._running -= 1
+            JOB_SECONDS.observe(time.time() - job.started_at)
+        await self._finish(job, SUCCEEDED, result=result)
+        return True
+
+    async def _finish(self, job: Job, status: str, result: Optional[Dict[str, Any]] = None,
+                      error: Optional[str] = None) -> None:
+        if job.finished:
+            return
+        job.result, job.error, job.finished_at = result, error, time.time()
+        job.status = status
+        JOBS.labels(status=status).inc()
+        await job.publish(status, **({"error": error} if error else {}))
+
+    async def _teardown(self, resources: Any) -> None:
+        try:
+            await self.teardown(resources)
+        except Exception as exc:
+            print(f"[OTA warning] failed to release replay worker resources: {exc}")
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in itertools.islice(finished, max(0, len(finished) - self.keep_finished)):
+            del self._jobs[job_id]
@@ -0,0 +1,208 @@
+"""Deterministic sub-goals for events whose intent is plain from the recording.
+
+A click on an element with short visible text, a value typed into a
+labelled field, a one-field search form, a navigation or the opening page of
+a task all read the same whatever the page around them looks like, so they
+do not need the LLM.  `synthesize_subgoal` returns the templated next_goal of
+such an event with a confidence score (the phrasing follows the examples in
+prompts/subgoal_generation/); `RuleSubgoals` plugs into
+`utils.action_processing.iter_subgoal_prompts` so that only the events below
+the confidence threshold are rendered and sent to the LLM.
+
+The element parsing is the exact-replay compiler's (`_selector_from_click`,
+`_extract_inner_text_tag_type` in browser_use/wap/exact_replay.py), imported
+on first use.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from utils.event_catalog import event_url
+
+__all__ = ["DEFAULT_MIN_CONFIDENCE", "RuleSubgoals", "synthesize_subgoal"]
+
+# events scored at least this are not sent to the LLM
+DEFAULT_MIN_CONFIDENCE = float(os.getenv("OTA_RULE_MIN_CONFIDENCE", "0.8"))
+
+MAX_TEXT = 40                   # longer visible text is likely a content item, better generalized by the LLM
+TEXT_INPUT_TYPES = {"text", "search", "password", "email", "number", "tel", "url", "date", "datetime-local", ""}
+IGNORE_TYPES = {"hidden", "file", "reset"}
+LABEL_ATTRS = ("aria-label", "placeholder", "title", "alt")
+
+_KIND = {"a": "link", "button": "button", "option": "option", "li": "item", "img": "image",
+         "label": "label", "select": "dropdown", "input": "button"}
+_TAG_RX = re.compile(r"<\s*\w+[^>]*>", re.I)
+_ATTR_RX = re.compile(r'([\w:-]+)\s*=\s*"([^"]*?)"', re.I)
+
+
+def _exact_replay():
+    from browser_use.wap import exact_replay
+    return exact_replay
+
+
+def _attrs(tag_html: str) -> Dict[str, str]:
+    return {k.lower(): v for k, v in _ATTR_RX.findall(tag_html)}
+
+
+def _label(attrs: Dict[str, str]) -> Optional[str]:
+    for name in LABEL_ATTRS:
+        if attrs.get(name, "").strip():
+            return attrs[name].strip()
+    return None
+
+
+def _plain(text: str) -> bool:
+    return 2 <= len(text) <= MAX_TEXT and "#rme" not in text and any(c.isalnum() for c in text)
+
+
+def _goal(next_goal: str, confidence: float, rule: str) -> Dict[str, Any]:
+    return {"next_goal": next_goal, "confidence": confidence, "rule": rule}
+
+
+# ---------------------------------------------------------------------------
+# rules per event type
+# ---------------------------------------------------------------------------
+def _task_start(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    url = event_url(event)
+    host = (urlsplit(url).hostname or "").removeprefix("www.") if url else ""
+    if not host:
+        return None
+    return _goal(f"Open {host} in a new tab.", 0.9, "task-start-url")
+
+
+def _navigation(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    url = (event.get("eventTarget") or {}).get("target")
+    if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+        return None
+    return _goal(f"Navigate to {url}.", 0.9, "navigation-url")
+
+
+def _click(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    xr = _exact_replay()
+    if xr._selector_from_click(event) is None:
+        return None
+    raw_html = (event.get("eventTarget") or {}).get("target") or ""
+    text, tag, itype = xr._extract_inner_text_tag_type(raw_html)
+    first = _TAG_RX.search(raw_html)
+    attrs = _attrs(first.group(0)) if first else {}
+    kind = _KIND.get(tag or "", "element")
+    if tag == "input" and itype not in ("submit", "button", "image"):
+        return None                             # focusing a field: the typing that follows is the sub-goal
+    if tag == "input" and attrs.get("value"):
+        text = attrs["value"]
+    if text and _plain(text):
+        return _goal(f"Click on the {kind} with text '{text}'", 0.9, "click-text")
+    label = _label(attrs)
+    if label and _plain(label):
+        return _goal(f"Click on the '{label}' {kind}", 0.85, "click-label")
+    if text:
+        return _goal(f"Click on the {kind} with text '{text[:MAX_TEXT]}'", 0.6, "click-long-text")
+    return None
+
+
+def _input_change(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    target = event.get("eventTarget") or {}
+    value = target.get("value")
+    if value is None:
+        return None
+    _, tag, itype = _exact_replay()._extract_inner_text_tag_type(target.get("target") or "")
+    first = _TAG_RX.search(target.get("target") or "")
+    attrs = _attrs(first.group(0)) if first else {}
+    if tag == "input" and itype in IGNORE_TYPES:
+        return None
+    label = _label(attrs)
+    confidence = 0.9 if label else 0.65        # a bare name or id says little about the field
+    label = label or attrs.get("name") or attrs.get("id") or "input"
+    if tag == "select":
+        return _goal(f"Select '{value}' in the '{label}' dropdown.", confidence, "select-labelled")
+    if tag == "input" and itype in ("checkbox", "radio"):
+        return _goal(f"Click on the '{label}' {itype}.", confidence, "check-labelled")
+    if tag == "textarea" or (tag == "input" and itype in TEXT_INPUT_TYPES):
+        return _goal(f"Enter '{value}' in the '{label}' field.", confidence, "input-labelled")
+    return None
+
+
+def _submit(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    controls = event.get("allEvents")
+    if not isinstance(controls, dict):
+        return None
+    typed = [c for c in controls.values()
+             if isinstance(c, dict) and c.get("value") and c.get("selector")
+             and ((c.get("tag") or "").lower() == "textarea"
+                  or ((c.get("tag") or "").lower() == "input" and (c.get("type") or "").lower() in TEXT_INPUT_TYPES))]
+    if len(typed) != 1:
+        return None                             # several fields or none: leave the summary to the LLM
+    control = typed[0]
+    form_html = (event.get("eventTarget") or {}).get("target") or ""
+    attrs: Dict[str, str] = {}
+    selector = control["selector"]
+    if selector.startswith("#"):
+        for tag_html in _TAG_RX.findall(form_html):
+            found = _attrs(tag_html)
+            if found.get("id") == selector[1:]:
+                attrs = found
+                break
+    label = _label(attrs)
+    searchish = attrs.get("role") == "searchbox" or (control.get("type") or "").lower() == "search" \
+        or "search" in selector.lower() or "search" in (label or "").lower()
+    if label:
+        return _goal(f"Enter '{control['value']}' in the '{label}' field and press enter key.",
+                     0.85, "submit-single-field")
+    if searchish:
+        return _goal(f"Enter '{control['value']}' in the search input field and press enter key.",
+                     0.8, "submit-search")
+    return _goal(f"Enter '{control['value']}' in the input field and press enter key.", 0.6, "submit-unlabelled")
+
+
+_RULES = {
+    "task-start": _task_start,
+    "go-back-or-forward": _navigation,
+    "click": _click,
+    "input-change": _input_change,
+    "submit": _submit,
+}
+
+
+def synthesize_subgoal(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """{"next_goal", "confidence", "rule"} for *event*, or None when no rule applies."""
+    rule = _RULES.get(event.get("type") or "")
+    return rule(event) if rule is not None else None
+
+
+class RuleSubgoals:
+    """Answer confident events without the LLM; use ``skip`` with `iter_subgoal_prompts`.
+
+    ``records`` collects one JSONL record per answered event, in the format of
+    `utils.subgoal_generator` results (``prompt`` is None), ready to be
+    appended to the sub-goal JSONL.
+    """
+
+    def __init__(self, min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> None:
+        self.min_confidence = min_confidence
+        self.records: List[Dict[str, Any]] = []
+        self.enabled = min_confidence <= 1
+        if self.enabled:
+            try:
+                _exact_replay()
+            except ImportError as exc:
+                print(f"[OTA warning] rule-based sub-goals disabled, browser_use is not importable: {exc}")
+                self.enabled = False
+
+    def skip(self, prompt_name: str, event: Dict[str, Any]) -> bool:
+        if not self.enabled:
+            return False
+        subgoal = synthesize_subgoal(event)
+        if subgoal is None or subgoal["confidence"] < self.min_confidence:
+            return False
+        self.records.append({
+            "file": prompt_name,
+            "prompt": None,
+            "rule": subgoal["rule"],
+            "confidence": subgoal["confidence"],
+            "reply": json.dumps({"next_goal": subgoal["next_goal"]}, ensure_ascii=False),
+        })
+        return True
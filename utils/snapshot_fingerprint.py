@@ -0,0 +1,187 @@
+"""SimHash fingerprints of page snapshots, to spot near-duplicate events.
+
+Consecutive events often carry almost the same page (several input-changes
+in one form).  Each sanitized snapshot gets a 64-bit SimHash over word
+3-shingles.  The token hashing is done once per distinct token, and the
+shingle mixing and bit voting are numpy operations over all events of a task
+at once.  Events whose fingerprints are within ``max_distance`` bits of the
+first event of their run form a group (`group_near_duplicates`), which the
+sub-goal generator sends as one batched request.
+
+Fingerprints are keyed by the snapshot's content address (`snapshot_hash`,
+the ``pageHTMLRef`` of blob-backed events), so a stored map of them
+(the build manifest, or ``fingerprints.json`` next to the sub-goal JSONL) is
+reused as long as the snapshot is unchanged.
+
+Usage
+-----
+python utils/snapshot_fingerprint.py --data_dir_path <task folder> [--max_distance 3]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.html_cleaner import run_html_sanitizer
+from utils.snapshot_store import SnapshotStore, resolve_page_html, snapshot_hash
+
+__all__ = ["NEAR_DUPLICATE_DISTANCE", "fingerprint_task", "group_near_duplicates", "hamming_distances",
+           "load_fingerprints", "prompt_groups", "save_fingerprints", "simhash", "task_fingerprints"]
+
+# bits out of 64; re-renders of one page typically differ by 0–3
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("OTA_NEAR_DUPLICATE_DISTANCE", "3"))
+SHINGLE = 3
+
+_TOKEN_RX = re.compile(r"\w+")
+_TAG_RX = re.compile(r"<[^>]+>")
+_BITS = np.arange(64, dtype=np.uint64)
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+
+
+def _token_hashes(tokens: List[str]) -> np.ndarray:
+    """Stable 64-bit hash of each token, hashing every distinct token once."""
+    unique, inverse = np.unique(np.asarray(tokens, dtype=object), return_inverse=True)
+    hashed = np.fromiter((int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little")
+                          for t in unique), dtype=np.uint64, count=len(unique))
+    return hashed[inverse]
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, element-wise."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * _M1
+    x = x ^ (x >> np.uint64(27))
+    x = x * _M2
+    return x ^ (x >> np.uint64(31))
+
+
+def _shingles(hashes: np.ndarray) -> np.ndarray:
+    if len(hashes) < SHINGLE:
+        return _mix(hashes)
+    combined = hashes[:1 - SHINGLE].copy()
+    for k in range(1, SHINGLE):
+        stop = len(hashes) - SHINGLE + 1 + k
+        combined = _mix(combined ^ (hashes[k:stop] * np.uint64(2 * k + 1)))
+    return combined
+
+
+def simhash(texts: Sequence[str]) -> np.ndarray:
+    """64-bit SimHash of each text (uint64 array); empty texts map to 0."""
+    tokens = [_TOKEN_RX.findall(_TAG_RX.sub(" ", text).lower()) for text in texts]
+    fingerprints = np.zeros(len(texts), dtype=np.uint64)
+    filled = [i for i, t in enumerate(tokens) if t]
+    if not filled:
+        return fingerprints
+    hashes = _token_hashes([tok for i in filled for tok in tokens[i]])
+    bounds = np.cumsum([0] + [len(tokens[i]) for i in filled])
+    features = [_shingles(hashes[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+    counts = np.cumsum([0] + [len(f) for f in features])[:-1]
+    bits = ((np.concatenate(features)[:, None] >> _BITS) & np.uint64(1)).astype(np.int32)
+    votes = np.add.reduceat(bits * 2 - 1, counts, axis=0)         # one row per text
+    packed = (votes > 0).astype(np.uint64) << _BITS
+    fingerprints[filled] = np.bitwise_or.reduce(packed, axis=1)
+    return fingerprints
+
+
+def hamming_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.bitwise_count(np.bitwise_xor(a, b)).astype(np.int64)
+
+
+def group_near_duplicates(fingerprints: Sequence[int] | np.ndarray,
+                          max_distance: int = NEAR_DUPLICATE_DISTANCE) -> List[int]:
+    """Group id of each fingerprint: a run of consecutive fingerprints stays in
+    one group while each is within *max_distance* bits of the run's first."""
+    fps = np.asarray(fingerprints, dtype=np.uint64)
+    groups: List[int] = []
+    start, group = 0, -1
+    for i in range(len(fps)):
+        if i == 0 or hamming_distances(fps[i], fps[start]) > max_distance:
+            start, group = i, group + 1
+        groups.append(group)
+    return groups
+
+
+def task_fingerprints(events: Iterable[Tuple[str, dict]], known: Optional[Dict[str, str]] = None,
+                      snapshots: Optional[SnapshotStore] = None) -> Dict[str, Dict[str, str]]:
+    """{event name: {"snapshot": content hash, "simhash": hex}} for (name, event) pairs.
+
+    *known* maps content hashes to stored fingerprints; only the other
+    snapshots are sanitized and hashed.  Events without a snapshot get none.
+    """
+    known = dict(known or {})
+    keys: Dict[str, str] = {}
+    pending: Dict[str, str] = {}
+    for name, event in events:
+        ref = event.get("pageHTMLRef")
+        if ref is None and not event.get("pageHTMLContent"):
+            continue
+        key = ref or snapshot_hash(event["pageHTMLContent"])
+        keys[name] = key
+        if key not in known and key not in pending:
+            page = resolve_page_html(event, snapshots)
+            pending[key] = run_html_sanitizer(page, "default") if page else ""
+    if pending:
+        for key, fp in zip(pending, simhash(list(pending.values()))):
+            known[key] = f"{int(fp):016x}"
+    return {name: {"snapshot": key, "simhash": known[key]} for name, key in keys.items()}
+
+
+def load_fingerprints(path: str | Path) -> Dict[str, str]:
+    """Stored {content hash: simhash hex} map (empty if missing or unreadable)."""
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_fingerprints(path: str | Path, fingerprints: Dict[str, Dict[str, str]]) -> None:
+    Path(path).write_text(json.dumps({fp["snapshot"]: fp["simhash"] for fp in fingerprints.values()},
+                                     indent=1), encoding="utf-8")
+
+
+def fingerprint_task(folder: str | Path, known: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, str]]:
+    """`task_fingerprints` of the events of task *folder*, keyed by prompt file
+    name (`utils.action_processing.prompt_file_name`) in recording order."""
+    from utils.action_processing import prompt_file_name
+    from utils.event_log import iter_task_events
+
+    events = ((prompt_file_name(name, event.get("type")), event)
+              for name, event in iter_task_events(folder, resolve_snapshot=False))
+    return task_fingerprints(events, known, SnapshotStore.locate(folder))
+
+
+def prompt_groups(fingerprints: Dict[str, Dict[str, str]],
+                  max_distance: int = NEAR_DUPLICATE_DISTANCE) -> Dict[str, int]:
+    """{prompt name: near-duplicate group} for fingerprints listed in event order."""
+    names = list(fingerprints)
+    ids = group_near_duplicates([int(fingerprints[n]["simhash"], 16) for n in names], max_distance)
+    return dict(zip(names, ids))
+
+
+# ---------------------------------------------------------------------------
+# command-line interface: show the near-duplicate groups of a task
+# ---------------------------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Group the events of a task by near-identical snapshots.")
+    parser.add_argument("--data_dir_path", required=True, help="task folder of recorded events")
+    parser.add_argument("--max_distance", type=int, default=NEAR_DUPLICATE_DISTANCE,
+                        help=f"SimHash bits two snapshots of one group may differ by (default: {NEAR_DUPLICATE_DISTANCE})")
+    args = parser.parse_args()
+
+    fingerprints = fingerprint_task(args.data_dir_path)
+    groups = prompt_groups(fingerprints, args.max_distance)
+    for name, fp in fingerprints.items():
+        print(f"{groups[name]:>4}  {fp['simhash']}  {name}")
+    print(f"[OTA Info] {len(fingerprints)} snapshots in {len(set(groups.values()))} near-duplicate groups")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""Content-addressed, compressed store for recorded page snapshots.
+
+Each `pageHTMLContent` is stored once under its SHA-256 digest in
+``<data_root>/blobs/<h[:2]>/<h>`` and the event record keeps only
+``"pageHTMLRef": "<h>"``.  A blob is either a keyframe (the whole snapshot,
+compressed) or a delta: the snapshot compressed with the previous snapshot of
+the same task as dictionary, which is tiny because consecutive snapshots of
+one page are nearly identical.
+
+Blob layout: one JSON header line (codec, base, depth) followed by the
+compressed payload.
+
+Usage
+-----
+python utils/snapshot_store.py --data_root_path data      # pack an existing tree
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd is optional, zlib is always there
+    zstandard = None
+
+__all__ = ["SnapshotStore", "apply_snapshot_delta", "snapshot_hash", "resolve_page_html",
+           "resolve_event_snapshot"]
+
+BLOB_DIR_NAME = "blobs"
+DEFAULT_CODEC = "zstd" if zstandard is not None else "zlib"
+
+
+def snapshot_hash(html: str) -> str:
+    """Return the content address of *html* (hex SHA-256 of its UTF-8 bytes)."""
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+
+def apply_snapshot_delta(base: str, delta: Dict[str, Any]) -> str:
+    """Rebuild a snapshot uploaded as a splice of *base* (see `SnapshotDelta`).
+
+    Offsets count UTF-16 code units, as JS string indices do.
+    """
+    start, end, text = delta["start"], delta["end"], delta["text"]
+    if base.isascii():                           # code points == code units
+        return base[:start] + text + base[end:]
+    units = base.encode("utf-16-le", "surrogatepass")
+    spliced = units[:2 * start] + text.encode("utf-16-le", "surrogatepass") + units[2 * end:]
+    return spliced.decode("utf-16-le", "surrogatepass")
+
+
+# ---------------------------------------------------------------------------
+# codecs: (data, dictionary) -> compressed / (compressed, dictionary) -> data
+# ---------------------------------------------------------------------------
+def _compress(codec: str, data: bytes, base: Optional[bytes], level: int) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed; use codec='zlib'")
+        dict_data = None
+        if base is not None:
+            dict_data = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        return zstandard.ZstdCompressor(level=level, dict_data=dict_data).compress(data)
+    if codec == "zlib":
+        comp = zlib.compressobj(min(level, 9), zlib.DEFLATED, zdict=base[-32768:]) if base \
+            else zlib.compressobj(min(level, 9))
+        return comp.compress(data) + comp.flush()
+    raise ValueError(f"Unknown snapshot codec: {codec}")
+
+
+def _decompress(codec: str, payload: bytes, base: Optional[bytes]) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd snapshot blobs")
+        dict_data = None
+        if base is not None:
+            dict_data = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(payload)
+    if codec == "zlib":
+        decomp = zlib.decompressobj(zdict=base[-32768:]) if base else zlib.decompressobj()
+        return decomp.decompress(payload) + decomp.flush()
+    raise ValueError(f"Unknown snapshot codec: {codec}")
+
+
+# ---------------------------------------------------------------------------
+# store
+# ---------------------------------------------------------------------------
+class SnapshotStore:
+    """Hash → compressed blob store rooted at *root*.
+
+    Parameters
+    ----------
+    root : str | Path
+        Blob folder, normally ``<data_root>/blobs``.
+    codec : str
+        ``"zstd"`` (default when zstandard is installed) or ``"zlib"``.
+    keyframe_interval : int
+        Maximum delta-chain length; the next snapshot after that is stored
+        whole so a read never has to walk more than this many blobs.
+    cache_size : int
+        Number of decoded snapshots kept in memory (bases of the next delta).
+    durable : bool
+        fsync each new blob before it becomes visible under its ref.
+
+    A store may be shared by threads (the collector expands deltas on request
+    threads while its writer stores snapshots), so the cache is guarded by a lock.
+    """
+
+    def __init__(self,
+                 root: str | Path,
+                 *,
+                 codec: str = DEFAULT_CODEC,
+                 level: int = 9,
+                 keyframe_interval: int = 16,
+                 cache_size: int = 8,
+                 durable: bool = False) -> None:
+        self.root = Path(root)
+        self.durable = durable
+        self.codec = codec
+        self.level = level
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._depth: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.bytes_written = 0                   # blob bytes written by this instance
+
+    @classmethod
+    def for_data_root(cls, data_root: str | Path, **kwargs: Any) -> "SnapshotStore":
+        return cls(Path(data_root) / BLOB_DIR_NAME, **kwargs)
+
+    @classmethod
+    def locate(cls, path: str | Path) -> Optional["SnapshotStore"]:
+        """Find the store serving an event file by walking up its parents."""
+        for parent in Path(path).resolve().parents:
+            candidate = parent / BLOB_DIR_NAME
+            if candidate.is_dir():
+                return _store_for_root(candidate)
+        return None
+
+    # -- paths / cache -------------------------------------------------------
+    def _path(self, ref: str) -> Path:
+        return self.root / ref[:2] / ref
+
+    def _remember(self, ref: str, data: bytes) -> None:
+        self._cache[ref] = data
+        self._cache.move_to_end(ref)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def has(self, ref: str) -> bool:
+        with self._lock:
+            return ref in self._cache or self._path(ref).is_file()
+
+    # -- write ---------------------------------------------------------------
+    def put(self, html: str, base: Optional[str] = None) -> str:
+        """Store *html* (delta-encoded against *base* if given) and return its ref."""
+        with self._lock:
+            return self._put(html, base)
+
+    def _put(self, html: str, base: Optional[str]) -> str:
+        data = html.encode("utf-8")
+        ref = hashlib.sha256(data).hexdigest()
+        path = self._path(ref)
+        if path.is_file():                       # content-addressed: already stored
+            if ref not in self._depth:
+                with path.open("rb") as fh:
+                    self._depth[ref] = json.loads(fh.readline()).get("depth", 0)
+            self._remember(ref, data)
+            return ref
+
+        base_data = None
+        depth = 0
+        if base and base != ref:
+            try:
+                base_data = self._read(base)
+                depth = self._depth.get(base, 0) + 1
+            except FileNotFoundError:
+                base_data = None
+            if depth >= self.keyframe_interval:
+                base_data, depth = None, 0
+
+        header = {"codec": self.codec, "base": base if base_data is not None else None, "depth": depth}
+        header_line = json.dumps(header).encode("utf-8") + b"\n"
+        payload = _compress(self.codec, data, base_data, self.level)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("wb") as fh:
+            fh.write(header_line)
+            fh.write(payload)
+            if self.durable:
+                fh.flush()
+                os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        self.bytes_written += len(header_line) + len(payload)
+
+        self._depth[ref] = depth
+        self._remember(ref, data)
+        return ref
+
+    # -- read ----------------------------------------------------------------
+    def _read(self, ref: str) -> bytes:
+        with self._lock:
+            return self._read_locked(ref)
+
+    def _read_locked(self, ref: str) -> bytes:
+        cached = self._cache.get(ref)
+        if cached is not None:
+            self._cache.move_to_end(ref)
+            return cached
+
+        # walk the delta chain down to a keyframe, then decode upwards
+        chain = []
+        cur: Optional[str] = ref
+        while cur is not None and cur not in self._cache:
+            raw = self._path(cur).read_bytes()
+            header_line, _, payload = raw.partition(b"\n")
+            header = json.loads(header_line)
+            chain.append((cur, header, payload))
+            cur = header.get("base")
+
+        base_data = self._cache[cur] if cur is not None else None
+        for blob_ref, header, payload in reversed(chain):
+            base_data = _decompress(header["codec"], payload, base_data)
+            self._depth[blob_ref] = header.get("depth", 0)
+            self._remember(blob_ref, base_data)
+        return base_data
+
+    def get(self, ref: str) -> str:
+        """Return the snapshot stored under *ref*."""
+        with self._lock:
+            if not self.has(ref):
+                raise FileNotFoundError(f"Snapshot blob not found: {ref}")
+            data = self._read(ref)
+        return data.decode("utf-8")
+
+
+_STORES: Dict[Path, SnapshotStore] = {}
+
+
+def _store_for_root(root: Path) -> SnapshotStore:
+    store = _STORES.get(root)
+    if store is None:
+        store = _STORES[root] = SnapshotStore(root)
+    return store
+
+
+def resolve_page_html(event: Dict[str, Any], store: Optional[SnapshotStore]) -> str:
+    """Return the page HTML of *event*, reading the blob store for refs."""
+    if "pageHTMLContent" in event:
+        return event["pageHTMLContent"] or ""
+    ref = event.get("pageHTMLRef")
+    if not ref:
+        return ""
+    if store is None:
+        raise FileNotFoundError(f"Event references snapshot {ref} but no blob store was found")
+    return store.get(ref)
+
+
+def resolve_event_snapshot(event: Dict[str, Any], near: str | Path) -> Dict[str, Any]:
+    """Fill `pageHTMLContent` in place for an event read from *near* (file or folder)."""
+    if "pageHTMLContent" not in event and event.get("pageHTMLRef"):
+        event["pageHTMLContent"] = resolve_page_html(event, SnapshotStore.locate(near))
+    return event
+
+
+# ---------------------------------------------------------------------------
+# command-line interface: move inline snapshots of an existing tree into blobs
+# ---------------------------------------------------------------------------
+def pack_tree(data_root: str | Path) -> None:
+    data_root = Path(data_root)
+    store = SnapshotStore.for_data_root(data_root)
+    before = after = 0
+    for task_dir in sorted({p.parent for p in data_root.rglob("summary_event_*.json")}):
+        last_ref = None
+        for path in sorted(task_dir.glob("summary_event_*.json")):
+            size = path.stat().st_size
+            event = json.loads(path.read_text(encoding="utf-8"))
+            if "pageHTMLContent" not in event:
+                continue
+            html = event.pop("pageHTMLContent") or ""
+            last_ref = event["pageHTMLRef"] = store.put(html, base=last_ref)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(json.dumps(event, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+            before += size
+            after += path.stat().st_size + store._path(last_ref).stat().st_size
+    print(f"[OTA Info] packed snapshots: {before / 1e6:.2f} MB → {after / 1e6:.2f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move inline pageHTMLContent of recorded events into the blob store.")
+    parser.add_argument("--data_root_path", default="data", help="Root folder of the recordings.")
+    args = parser.parse_args()
+    pack_tree(args.data_root_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,32 @@
 """Sub‑goal batch generator.
 
-Given a directory path, this helper loads every `*.md` file (each file is
-assumed to contain a prompt) and sends the content to OpenAI (via
-`ask_llm`).  It returns a list of dicts with filename, prompt, and reply.
+`generate_subgoals` sends a stream of (name, prompt) pairs — typically
+`utils.action_processing.iter_subgoal_prompts`, rendered in memory — to
+OpenAI (via `ask_llm`).  `generate_subgoals_from_dir` does the same for the
+`*.md` prompt files of a directory.  `generate_subgoals_async` runs the
+queries concurrently under a requests/tokens-per-minute limit, optionally
+packing consecutive prompts into one request.  All return a list of dicts
+with filename, prompt, and reply, in prompt order.
 """
 from __future__ import annotations
 
-import json, re
+import asyncio, hashlib, json, os, re
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
 
-from utils.llm import ask_llm
+from utils.action_processing import render_batch_prompt
+from utils.llm import aclose_chat_models, ask_llm, ask_llm_async, cached_reply
+from utils.llm_concurrency import RateLimiter, call_with_retries, ordered_fan_out
+from utils.tokenizer import count_tokens
 
-__all__ = ["generate_subgoals_from_dir"]
+__all__ = ["append_results", "generate_subgoals", "generate_subgoals_async", "generate_subgoals_from_dir"]
+
+# reply tokens counted against the tokens-per-minute limit (a next_goal JSON object)
+REPLY_TOKENS = 200
+# prompts per batched request at most, however small they are
+MAX_BATCH_EVENTS = 10
+# token budget of a batch of near-duplicate prompts when no --batch_tokens is given
+GROUP_BATCH_TOKENS = 32000
 
 
 def _load_prompts(dir_path: str | Path) -> List[tuple[Path, str]]:
@@ -27,20 +41,23 @@ def _load_prompts(dir_path: str | Path) -> List[tuple[Path, str]]:
     return prompts
 
 
-def generate_subgoals_from_dir(
-    dir_path: str | Path,
+def generate_subgoals(
+    prompts: Iterable[Tuple[str, str]],
     *,
     system_prompt: Optional[str] = None,
     model: str = "gpt-4o-mini",
     temperature: float = 0.2,
     save_jsonl: Optional[str | Path] = None,
+    bypass_cache: bool = False,
+    resume: bool = False,
 ) -> List[Dict[str, Any]]:
-    """Load all .md files under *dir_path*, query the LLM, and return results.
+    """Query the LLM for each (name, prompt) pair of *prompts*, as they come.
 
     Parameters
     ----------
-    dir_path : str | Path
-        Directory containing `*.md` prompt files.
+    prompts : iterable of (str, str)
+        Prompt name (the file name it has, or would have, on disk) and text.
+        Consumed lazily, so a generator keeps only one prompt in memory.
     system_prompt : str | None
         Optional system message for the LLM.
     model : str
@@ -49,45 +66,307 @@ def generate_subgoals_from_dir(
         Sampling temperature.
     save_jsonl : str | Path | None
         If given, write a JSON‑lines file with each result.
+    bypass_cache : bool
+        Query the LLM even for prompts whose reply is cached.
+    resume : bool
+        Keep the replies already in *save_jsonl* for prompts whose name and
+        text are unchanged, and only query the missing ones.
 
     Returns
     -------
     list[dict]
-        Each dict contains {"file", "prompt", "reply"}.
+        Each dict contains {"file", "prompt", "prompt_sha256", "reply"}.
     """
-    prompts = _load_prompts(dir_path)
-    if not prompts:
-        raise FileNotFoundError(f"No .md files found in {dir_path}")
-
-    if save_jsonl:
-        save_path = Path(save_jsonl)
-        if save_path.exists():
-            save_path.unlink()
+    answered = _open_jsonl(save_jsonl, resume)
 
     results: List[Dict[str, Any]] = []
 
-    for idx, (path, prompt_text) in enumerate(prompts, 1):
-        print(f"[{idx}/{len(prompts)}] Querying LLM for {path.name} …")
+    for idx, (name, prompt_text) in enumerate(prompts, 1):
+        prompt_text = prompt_text.strip()
+        if not prompt_text:
+            continue
+        done = answered.get((name, prompt_sha256(prompt_text)))
+        if done is not None:
+            print(f"[{idx}] {name} already answered – skipped")
+            results.append(done)
+            continue
+        print(f"[{idx}] Querying LLM for {name} …")
         reply = ask_llm(
             prompt_text,
             system_prompt=system_prompt,
             model=model,
             temperature=temperature,
+            bypass_cache=bypass_cache,
         )
         result = {
-            "file": path.name,
+            "file": name,
             "prompt": prompt_text,
+            "prompt_sha256": prompt_sha256(prompt_text),
             "reply": reply,
         }
         results.append(result)
 
         # Optionally append to JSONL file incrementally
         if save_jsonl:
-            with Path(save_jsonl).open("a", encoding="utf-8") as f:
-                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            _append_jsonl(save_jsonl, result)
 
+    if save_jsonl and resume:
+        _write_jsonl(save_jsonl, results)
     return results
 
+
+# ---------------------------------------------------------------------------
+# JSONL checkpoint
+# ---------------------------------------------------------------------------
+def prompt_sha256(prompt_text: str) -> str:
+    return hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()
+
+
+def _read_jsonl(path: str | Path) -> List[Dict[str, Any]]:
+    """Records of *path*; malformed lines (e.g. cut short by a crash) are skipped."""
+    records: List[Dict[str, Any]] = []
+    with Path(path).open("r", encoding="utf-8") as fh:
+        for line_no, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[extract] line {line_no}: malformed JSON – skipped")
+                continue
+            if isinstance(record, dict):
+                records.append(record)
+    return records
+
+
+def _write_jsonl(path: str | Path, records: List[Dict[str, Any]]) -> None:
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def _append_jsonl(path: str | Path, result: Dict[str, Any]) -> None:
+    with Path(path).open("a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+def append_results(path: str | Path, results: Iterable[Dict[str, Any]]) -> None:
+    """Append records answered elsewhere (e.g. `utils.rule_subgoals`) to the JSONL
+    checkpoint; `wap_subgoal_list_generation` merges them in event order."""
+    for result in results:
+        _append_jsonl(path, result)
+
+
+def _open_jsonl(save_jsonl: Optional[str | Path], resume: bool) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Prepare *save_jsonl* for appending; with *resume*, return its answered
+    prompts by (file name, prompt hash), else start it afresh."""
+    if not save_jsonl:
+        return {}
+    save_path = Path(save_jsonl)
+    if not save_path.exists():
+        return {}
+    if not resume:
+        save_path.unlink()
+        return {}
+    records = _read_jsonl(save_path)
+    _write_jsonl(save_path, records)            # drop a partial last line before appending
+    answered = {}
+    for record in records:
+        if "file" in record and "reply" in record:
+            digest = record.get("prompt_sha256") or prompt_sha256(str(record.get("prompt", "")))
+            answered[(record["file"], digest)] = record
+    if answered:
+        print(f"[OTA Info] resuming: {len(answered)} prompts already answered in {save_path}")
+    return answered
+
+
+def _batches(prompts: Iterable[Tuple[str, str]], answered: Dict[Tuple[str, str], Dict[str, Any]],
+             batch_tokens: int, groups: Optional[Dict[str, int]] = None,
+             model: Optional[str] = None) -> Iterator[List[Tuple[str, str]]]:
+    """Group consecutive prompts into batches of at most *batch_tokens*
+    tokens (of *model*) and MAX_BATCH_EVENTS prompts; already answered prompts cost nothing.
+    With *batch_tokens* 0 every prompt is a batch of its own.
+
+    *groups* maps prompt names to near-duplicate groups
+    (`utils.snapshot_fingerprint`): a batch then never spans two groups, and
+    the prompts of one group are batched together even with *batch_tokens* 0,
+    up to GROUP_BATCH_TOKENS."""
+    groups = groups or {}
+    batch: List[Tuple[str, str]] = []
+    batch_group: Optional[int] = None
+    tokens = 0
+    for name, text in prompts:
+        cost = 0 if (name, prompt_sha256(text)) in answered else count_tokens(text, model)
+        group = groups.get(name)
+        budget = batch_tokens or (GROUP_BATCH_TOKENS if group is not None else 0)
+        if batch and (group != batch_group or len(batch) >= MAX_BATCH_EVENTS
+                      or not budget or tokens + cost > budget):
+            yield batch
+            batch, tokens = [], 0
+        batch.append((name, text))
+        batch_group = group
+        tokens += cost
+    if batch:
+        yield batch
+
+
+def _parse_batch_reply(raw_reply: str, count: int) -> List[str]:
+    """The *count* next_goal values of a batched reply, in action order.
+
+    Raises ValueError unless the reply is a JSON array with one next_goal
+    per action."""
+    try:
+        items = json.loads(_clean_reply(raw_reply))
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"batched reply is not JSON: {exc}") from None
+    if not isinstance(items, list) or len(items) != count:
+        raise ValueError(f"batched reply is not a JSON array of {count} items")
+    goals: List[Optional[str]] = [None] * count
+    for position, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"next_goal": item}
+        if not isinstance(item, dict) or not item.get("next_goal"):
+            raise ValueError(f"batched reply item {position + 1} has no next_goal")
+        index = item.get("index", position + 1)
+        if not isinstance(index, int) or not 1 <= index <= count or goals[index - 1] is not None:
+            raise ValueError(f"batched reply item {position + 1} has a bad index {index!r}")
+        goals[index - 1] = str(item["next_goal"])
+    return goals  # type: ignore[return-value]
+
+
+async def generate_subgoals_async(
+    prompts: Iterable[Tuple[str, str]],
+    *,
+    system_prompt: Optional[str] = None,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.2,
+    save_jsonl: Optional[str | Path] = None,
+    concurrency: int = 8,
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None,
+    max_retries: int = 5,
+    bypass_cache: bool = False,
+    resume: bool = False,
+    batch_tokens: int = 0,
+    groups: Optional[Dict[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    """`generate_subgoals` with up to *concurrency* queries in flight.
+
+    *rpm* / *tpm* cap requests and (estimated) tokens per minute; cached
+    replies are served without counting against them.  429 and 5xx replies
+    are retried up to *max_retries* times with jittered backoff.
+    Results are appended to *save_jsonl* and returned in prompt order, so the
+    output is the same as the serial version's, *resume* included.
+
+    With *batch_tokens* > 0, consecutive prompts of up to that many tokens
+    in total are sent as one request (``batch.md``) asking for a JSON array
+    of next_goal values; each result's reply is then its own
+    ``{"next_goal": ...}`` object.  A batch whose reply cannot be parsed is
+    asked again one prompt at a time.  *groups* ({prompt name: group id},
+    see `utils.snapshot_fingerprint.prompt_groups`) batches the events of
+    each run of near-identical pages together and keeps other events apart.
+    """
+    answered = _open_jsonl(save_jsonl, resume)
+    limiter = RateLimiter(rpm=rpm, tpm=tpm)
+    system_tokens = count_tokens(system_prompt or "", model)
+
+    async def ask(prompt_text: str, reply_tokens: int) -> str:
+        if not bypass_cache:
+            reply = cached_reply(prompt_text, system_prompt, model, temperature)
+            if reply is not None:
+                return reply
+        return await call_with_retries(
+            lambda: ask_llm_async(prompt_text, system_prompt=system_prompt, model=model,
+                                  temperature=temperature, bypass_cache=True),
+            limiter=limiter,
+            tokens=system_tokens + count_tokens(prompt_text, model) + reply_tokens,
+            max_retries=max_retries,
+        )
+
+    async def query(batch: List[Tuple[str, str]]) -> List[str]:
+        replies: List[Optional[str]] = []
+        pending: List[int] = []
+        for position, (name, prompt_text) in enumerate(batch):
+            done = answered.get((name, prompt_sha256(prompt_text)))
+            replies.append(done["reply"] if done is not None else None)
+            if done is None:
+                pending.append(position)
+        if len(pending) > 1:
+            print(f"Querying LLM for {len(pending)} prompts, {batch[pending[0]][0]} … {batch[pending[-1]][0]}")
+            reply = await ask(render_batch_prompt([batch[i][1] for i in pending]),
+                              REPLY_TOKENS * len(pending))
+            try:
+                goals = _parse_batch_reply(reply, len(pending))
+            except ValueError as exc:
+                print(f"[OTA warning] {exc}; asking for these prompts one at a time")
+            else:
+                for i, goal in zip(pending, goals):
+                    replies[i] = json.dumps({"next_goal": goal}, ensure_ascii=False)
+                pending = []
+        for i in pending:
+            print(f"Querying LLM for {batch[i][0]} …")
+        singles = await asyncio.gather(*(ask(batch[i][1], REPLY_TOKENS) for i in pending))
+        for i, reply in zip(pending, singles):
+            replies[i] = reply
+        return replies  # type: ignore[return-value]
+
+    results: List[Dict[str, Any]] = []
+
+    def emit(idx: int, batch: List[Tuple[str, str]], replies: List[str]) -> None:
+        for (name, prompt_text), reply in zip(batch, replies):
+            digest = prompt_sha256(prompt_text)
+            done = answered.get((name, digest))
+            if done is not None:
+                results.append(done)
+                continue
+            result = {"file": name, "prompt": prompt_text, "prompt_sha256": digest, "reply": reply}
+            results.append(result)
+            print(f"[{len(results)}] Got reply for {name}")
+            if save_jsonl:
+                _append_jsonl(save_jsonl, result)
+
+    stripped = ((name, text.strip()) for name, text in prompts)
+    try:
+        await ordered_fan_out(_batches(((name, text) for name, text in stripped if text), answered, batch_tokens, groups,
+                                       model),
+                              query, concurrency=concurrency, emit=emit)
+    finally:
+        await aclose_chat_models()              # the loop's pool would leak once asyncio.run returns
+    if save_jsonl and resume:
+        _write_jsonl(save_jsonl, results)
+    return results
+
+
+def generate_subgoals_from_dir(
+    dir_path: str | Path,
+    *,
+    system_prompt: Optional[str] = None,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.2,
+    save_jsonl: Optional[str | Path] = None,
+    bypass_cache: bool = False,
+    resume: bool = False,
+    groups: Optional[Dict[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    """Load all .md files under *dir_path*, query the LLM, and return results.
+
+    See `generate_subgoals` for the parameters and the result format.  With
+    *groups*, near-duplicate prompts share batched requests as in
+    `generate_subgoals_async`, still sent one request at a time.
+    """
+    prompts = _load_prompts(dir_path)
+    if not prompts:
+        raise FileNotFoundError(f"No .md files found in {dir_path}")
+    named = ((path.name, text) for path, text in prompts)
+    options = dict(system_prompt=system_prompt, model=model, temperature=temperature,
+                   save_jsonl=save_jsonl, bypass_cache=bypass_cache, resume=resume)
+    if groups:
+        return asyncio.run(generate_subgoals_async(named, concurrency=1, groups=groups, **options))
+    return generate_subgoals(named, **options)
+
 # ---------------------------------------------------------------------------
 # JSONL "reply" → next_goal extractor
 # ---------------------------------------------------------------------------
@@ -111,36 +390,35 @@ def wap_subgoal_list_generation(
     """Read *jsonl_path*, extract the `next_goal` from each line's `reply`,
     and write the list of next goals to *out_path* (as a JSON array).
 
+    Records are merged in event order (prompt file names sort that way)
+    whatever order they were appended in; for a file answered more than
+    once, e.g. across resumed runs, the last record wins.
+
     Returns the list for immediate use.
     """
     jsonl_path = Path(jsonl_path)
     if not jsonl_path.is_file():
         raise FileNotFoundError(jsonl_path)
 
-    goals: List[Dict[str, str]] = [{"index": 0, "subgoal": "task starts, go for the next sub-goal"}]
-    with jsonl_path.open("r", encoding="utf-8") as fh:
-        for line_no, line in enumerate(fh, 1):
-            if not line.strip():
-                continue
-            try:
-                record = json.loads(line)
-            except json.JSONDecodeError:
-                print(f"[extract] line {line_no}: malformed JSON – skipped")
-                continue
+    latest: Dict[str, Dict[str, Any]] = {}
+    for record in _read_jsonl(jsonl_path):
+        latest[str(record.get("file", ""))] = record
 
-            raw_reply = str(record.get("reply", ""))
-            cleaned = _clean_reply(raw_reply)
-            try:
-                reply_json = json.loads(cleaned)
-            except json.JSONDecodeError:
-                print(f"[extract] line {line_no}: reply not valid JSON – skipped")
-                continue
+    goals: List[Dict[str, str]] = [{"index": 0, "subgoal": "task starts, go for the next sub-goal"}]
+    for name in sorted(latest):
+        raw_reply = str(latest[name].get("reply", ""))
+        cleaned = _clean_reply(raw_reply)
+        try:
+            reply_json = json.loads(cleaned)
+        except json.JSONDecodeError:
+            print(f"[extract] {name}: reply not valid JSON – skipped")
+            continue
 
-            goal_text = reply_json.get("next_goal")
-            if goal_text:
-                goals.append({"index": len(goals), "subgoal": goal_text})
-            else:
-                print(f"[extract] line {line_no}: no 'next_goal' key – skipped")
+        goal_text = reply_json.get("next_goal") if isinstance(reply_json, dict) else None
+        if goal_text:
+            goals.append({"index": len(goals), "subgoal": goal_text})
+        else:
+            print(f"[extract] {name}: no 'next_goal' key – skipped")
 
     goals.append({"index": len(goals), "subgoal": "task done"})
     
@@ -0,0 +1,123 @@
+"""Incremental build of the replay corpus.
+
+run with: pytest utils/tests/test_build_replay_corpus.py
+"""
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from utils import live_compile
+from utils.ingest import EventWriter
+from wap_replay import build_replay_corpus as corpus
+
+TASK = Path("data_samples/action_set_y757R6w6y17LVHXl")
+
+
+def start(task_id):
+    return {"taskId": task_id, "type": "task-start", "taskDescription": "find a desk",
+            "allEvents": [{"current_url": "https://example.com/"}], "pageHTMLContent": "<p>home</p>"}
+
+
+def click(task_id, n):
+    return {"taskId": task_id, "type": "click", "actionTimestamp": n, "pageHTMLContent": f"<p>page {n}</p>",
+            "eventTarget": {"target": f"<button>go {n}</button>"}}
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """Run the stages on threads and record which folders each one touched."""
+    calls = {"exact": [], "prompts": []}
+
+    def spy(stage, fn):
+        def wrapper(folder, *args):
+            calls[stage].append((Path(folder).name, args[1] if stage == "prompts" else None))
+            return fn(folder, *args)
+        return wrapper
+
+    monkeypatch.setattr(corpus, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(corpus, "build_exact", spy("exact", corpus.build_exact))
+    monkeypatch.setattr(corpus, "render_prompts", spy("prompts", corpus.render_prompts))
+    monkeypatch.setattr(live_compile, "_compile_fn", lambda events: [{"action": e["type"]} for e in events])
+    return calls
+
+
+def build(data_root, output_dir):
+    return corpus.build(data_root, output_dir, stages=("exact", "prompts"), workers=2)
+
+
+def test_rebuilds_touch_only_changed_events(tmp_path, jobs):
+    data_root, output_dir = tmp_path / "data", tmp_path / "out"
+    shutil.copytree(TASK, data_root / "legacy" / TASK.name)
+    writer = EventWriter(data_root, durable=False)
+    writer.write_batch([start("L"), click("L", 1)])
+
+    assert build(data_root, output_dir) == 0
+    assert sorted(name for name, _ in jobs["exact"]) == sorted([TASK.name, "L"])
+    plan = json.loads((output_dir / "exact_replay" / "wap_exact_replay_list_L.json").read_text(encoding="utf-8"))
+    assert plan["ultimate_goal"] == "find a desk" and len(plan["action_list"]) == 2
+    prompts = output_dir / "smart_replay" / "subgoals_L"
+    assert len(list(prompts.glob("subgoal_*.md"))) == 2
+
+    for touched in jobs.values():
+        touched.clear()
+    assert build(data_root, output_dir) == 0                     # nothing changed: nothing is read
+    assert jobs == {"exact": [], "prompts": []}
+
+    writer.write_batch([click("L", 2)])
+    (data_root / "legacy" / TASK.name / "summary_event_20250523_011259.json").unlink()
+    assert build(data_root, output_dir) == 0
+    assert sorted(name for name, _ in jobs["exact"]) == sorted([TASK.name, "L"])
+    assert dict(jobs["prompts"])["L"] == ["event_000002"]         # only the new event is rendered
+    assert len(list(prompts.glob("subgoal_*.md"))) == 3
+    legacy_prompts = output_dir / "smart_replay" / "subgoals_y757R6w6y17LVHXl"
+    assert not list(legacy_prompts.glob("subgoal_summary_event_20250523_011259_*.md"))
+
+    manifest = json.loads((output_dir / corpus.MANIFEST_NAME).read_text(encoding="utf-8"))
+    logged = writer.task_log("L").folder.relative_to(data_root).as_posix()
+    assert set(manifest["tasks"]) == {f"legacy/{TASK.name}", logged}
+
+
+@pytest.fixture
+def rules(monkeypatch):
+    """Let the sub-goal rules answer task-start events only (browser_use is not needed)."""
+    from utils import rule_subgoals
+
+    def synthesize(event):
+        if event.get("type") != "task-start":
+            return None
+        return {"next_goal": "open the site", "confidence": 1.0, "rule": "task-start"}
+
+    monkeypatch.setattr(rule_subgoals, "_exact_replay", lambda: None)
+    monkeypatch.setattr(rule_subgoals, "synthesize_subgoal", synthesize)
+
+
+def test_rule_answered_events_skip_the_llm(tmp_path, jobs, rules, monkeypatch):
+    data_root, output_dir = tmp_path / "data", tmp_path / "out"
+    writer = EventWriter(data_root, durable=False)
+    writer.write_batch([start("L"), click("L", 1)])
+
+    assert build(data_root, output_dir) == 0
+    prompts = output_dir / "smart_replay" / "subgoals_L"
+    assert [p.name for p in prompts.glob("subgoal_*.md")] == ["subgoal_event_000001_click.md"]
+    answered = json.loads((prompts / corpus.RULES_NAME).read_text(encoding="utf-8"))
+    assert list(answered) == ["event_000000"] and answered["event_000000"]["rule"] == "task-start"
+
+    sg = pytest.importorskip("utils.subgoal_generator")
+    asked = []
+
+    def reply(prompt, **options):
+        asked.append(prompt)
+        return json.dumps({"next_goal": "press go"})
+
+    monkeypatch.setattr(sg, "ask_llm", reply)
+    monkeypatch.setattr(sg, "cached_reply", lambda *args: None)
+    for _ in range(2):                                           # the rule records are not duplicated
+        corpus.build_smart(str(writer.task_log("L").folder), str(output_dir))
+        jsonl = [json.loads(line) for line in (prompts / "subgoals_output.jsonl").read_text(encoding="utf-8").splitlines()]
+        assert [r["file"] for r in jsonl] == ["subgoal_event_000001_click.md", "subgoal_event_000000_task-start.md"]
+    assert len(asked) == 1
+    plan = json.loads((output_dir / "smart_replay" / "wap_smart_replay_list_L.json").read_text(encoding="utf-8"))
+    assert "open the site" in json.dumps(plan) and "press go" in json.dumps(plan)
@@ -0,0 +1,80 @@
+"""SQLite catalog of recorded events.
+
+run with: pytest utils/tests/test_event_catalog.py
+"""
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from utils.event_catalog import EventCatalog
+from utils.event_log import TaskEventLog
+from utils.ingest import EventWriter
+
+TASK = Path("data_samples/action_set_y757R6w6y17LVHXl")
+
+
+def start(task_id, url):
+    return {"taskId": task_id, "type": "task-start", "allEvents": [{"current_url": url}]}
+
+
+def click(task_id, selector):
+    return {"taskId": task_id, "type": "click", "eventTarget": {"selector": selector}}
+
+
+def test_collector_catalogs_appended_events(tmp_path):
+    catalog = EventCatalog.for_data_root(tmp_path)
+    writer = EventWriter(tmp_path, durable=False, catalog=catalog)
+    writer.write_batch([start("A", "https://www.amazon.ca/s?k=kb"), click("A", "#buy"),
+                        start("B", "https://example.com/"), {"taskId": "B", "type": "submit"}])
+
+    rows = catalog.query(task_id="A")
+    assert [(r["seq"], r["type"], r["host"], r["selector"]) for r in rows] == \
+        [(0, "task-start", "amazon.ca", None), (1, "click", "amazon.ca", "#buy")]
+    assert rows[1]["folder"] == catalog.relative(writer.task_log("A").folder)
+    assert [t["task_id"] for t in catalog.tasks(host="example.com", event_type="submit")] == ["B"]
+    assert [r["type"] for r in catalog.task_start_rows(writer.task_log("B").folder)] == ["task-start"]
+
+
+def test_host_filter_matches_subdomains(tmp_path):
+    catalog = EventCatalog.for_data_root(tmp_path)
+    EventWriter(tmp_path, durable=False, catalog=catalog).write_batch(
+        [start("A", "https://smile.amazon.ca/"), start("B", "https://notamazon.ca/")])
+    assert [r["task_id"] for r in catalog.query(host="amazon.ca")] == ["A"]
+
+
+def test_backfill_reads_logs_and_legacy_folders(tmp_path):
+    shutil.copytree(TASK, tmp_path / "legacy" / TASK.name)
+    EventWriter(tmp_path, durable=False).write_batch([start("L", "https://example.com/"), click("L", "#go")])
+
+    catalog = EventCatalog.for_data_root(tmp_path)
+    assert catalog.backfill(tmp_path) == 8
+    legacy = catalog.query(task_id="y757R6w6y17LVHXl")
+    assert [r["seq"] for r in legacy] == list(range(6))
+    assert {r["host"] for r in legacy} == {"amazon.ca"}
+    assert legacy[0]["path"].endswith(".json") and legacy[0]["task_description"]
+
+    assert catalog.backfill(tmp_path) == 8                       # idempotent
+    assert len(catalog.query()) == 8
+    assert catalog.query(task_id="L")[1]["selector"] == "#go"
+
+
+def test_lookups_share_one_read_only_connection(tmp_path):
+    catalog = EventCatalog.for_data_root(tmp_path)
+    writer = EventWriter(tmp_path, durable=False, catalog=catalog)
+    writer.write_batch([start("A", "https://example.com/")])
+    folder = writer.task_log("A").folder
+
+    reader = EventCatalog.locate(folder)
+    assert reader is EventCatalog.locate(folder / "events.idx") and reader is not catalog
+    writer.write_batch([click("A", "#go")])                      # seen through the WAL
+    assert [r["type"] for r in reader.query(task_id="A")] == ["task-start", "click"]
+    with pytest.raises(sqlite3.OperationalError):
+        reader.insert_rows([dict(reader.query()[0], seq=9)])
+
+
+def test_backfill_reads_only_event_headers(tmp_path, monkeypatch):
+    EventWriter(tmp_path, durable=False).write_batch([start("L", "https://example.com/"), click("L", "#go")])
+    monkeypatch.setattr(TaskEventLog, "iter_events", None)      # no full decode
+    assert EventCatalog.for_data_root(tmp_path).backfill(tmp_path) == 2
@@ -0,0 +1,56 @@
+"""Server-side eventHash coalescing.
+
+run with: pytest utils/tests/test_event_coalescer.py
+"""
+from utils.event_coalescer import EventCoalescer
+
+
+def event(n, ev_hash=None, ev_type="click", task_id="T1"):
+    return {"taskId": task_id, "type": ev_type, "eventHash": ev_hash or f"h{n}", "actionTimestamp": n}
+
+
+def stamps(events):
+    return [e["actionTimestamp"] for e in events]
+
+
+def test_events_are_held_for_the_window_in_arrival_order():
+    co = EventCoalescer(window=2.0)
+    assert co.offer(event(0), now=0.0) == []
+    assert co.offer(event(1), now=1.0) == []
+    assert co.offer({"taskId": "T1", "type": "go-back-or-forward", "actionTimestamp": 2}, now=1.5) == []
+    assert co.drain(now=1.9) == []
+    assert stamps(co.drain(now=2.0)) == [0]
+    assert stamps(co.drain(now=3.0)) == [1, 2]                 # the unhashed event keeps its place
+    assert co.pending == 0
+
+
+def test_duplicates_follow_the_submit_precedence():
+    dropped = []
+    co = EventCoalescer(window=2.0, on_drop=dropped.append)
+    co.offer(event(0, "a"), now=0.0)
+    co.offer(event(1, "a"), now=0.1)                            # same type pending: newcomer dropped
+    co.offer(event(2, "a", "input-change"), now=0.2)            # other type replaces the pending one
+    assert stamps(co.offer(event(3, "a", "submit"), now=0.3)) == [3]    # submit is released at once
+    co.offer(event(4, "b", "submit"), now=0.4)
+    co.offer(event(5, "b"), now=0.5)                            # pending submit wins
+    co.offer(event(6, "b", "submit"), now=0.6)                  # newer submit replaces it
+    assert co.drain(now=2.5) == [] and stamps(co.drain(now=2.6)) == [6]
+    assert stamps(dropped) == [1, 0, 2, 5, 4] and co.dropped == 5
+
+
+def test_late_duplicates_of_released_events():
+    co = EventCoalescer(window=1.0)
+    co.offer(event(0, "a"), now=0.0)
+    assert stamps(co.drain(now=1.0)) == [0]
+    assert co.offer(event(1, "a"), now=1.5) == []               # already written
+    assert stamps(co.offer(event(2, "a", "submit"), now=1.6)) == [2]    # a late submit still wins
+    assert co.offer(event(3, "a", "submit"), now=1.7) == [] and co.pending == 0
+
+
+def test_task_finish_and_force_release_everything():
+    co = EventCoalescer(window=10.0)
+    co.offer(event(0), now=0.0)
+    co.offer(event(0, task_id="T2"), now=0.0)
+    assert stamps(co.offer(event(1, ev_type="task-finish"), now=0.1)) == [0, 1]
+    assert stamps(co.drain(now=0.2, force=True)) == [0]
+    assert co.drain(now=0.3, force=True) == []
@@ -0,0 +1,54 @@
+"""Header-only scan of event JSON.
+
+run with: pytest utils/tests/test_event_header.py
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+from utils.action_processing import HEADER_FIELDS, read_event_header, scan_event_header
+from utils.event_schema import EventSchemaError
+
+TASK = Path("data_samples/action_set_y757R6w6y17LVHXl")
+
+EVENT = {
+    "eventTarget": {"target": '<a href="/p?q=\\"}]{[">buy</a>', "nested": [{"a": [1, {"b": "]}"}]}, []]},
+    "pageHTMLContent": '<div class="x">\\"quoted\\" {not json} [nor this] \u00e9\u4e2d</div>',
+    "allEvents": {"q": {"type": "text", "value": "a\\\"b"}},
+    "taskId": "T1",
+    "type": "submit",
+    "actionTimestamp": -1.5e3,
+    "taskDescription": "find \"quoted\" caf\u00e9 \\ items",
+    "eventHash": "abc",
+    "flags": [True, False, None],
+}
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_fields_after_escaped_and_nested_values(ensure_ascii):
+    raw = json.dumps(EVENT, ensure_ascii=ensure_ascii, indent=1).encode("utf-8")
+    assert scan_event_header(raw) == {k: EVENT[k] for k in HEADER_FIELDS}
+    assert scan_event_header(raw, ("eventTarget", "flags")) == \
+        {"eventTarget": EVENT["eventTarget"], "flags": EVENT["flags"]}
+
+
+def test_scan_stops_once_fields_are_found():
+    raw = b'{"taskId": "T1", "type": "click", "pageHTMLContent": "<html>... truncated'
+    assert scan_event_header(raw, ("taskId", "type")) == {"taskId": "T1", "type": "click"}
+    with pytest.raises(ValueError):
+        scan_event_header(b'["not", "an", "object"]')
+
+
+def test_read_event_header_matches_full_decode():
+    for path in sorted(TASK.glob("*.json")):
+        event = json.loads(path.read_text(encoding="utf-8"))
+        assert read_event_header(path) == {k: event[k] for k in HEADER_FIELDS if k in event}
+
+
+def test_read_event_header_validates_what_it_reads(tmp_path):
+    path = tmp_path / "summary_event_1.json"
+    path.write_text(json.dumps({"taskId": "T1", "type": "scroll", "pageHTMLContent": "<p>x</p>"}), encoding="utf-8")
+    assert read_event_header(path, ("taskId",)) == {"taskId": "T1"}
+    with pytest.raises(EventSchemaError):
+        read_event_header(path)
@@ -0,0 +1,64 @@
+"""Append-only per-task event log.
+
+run with: pytest utils/tests/test_event_log.py
+"""
+import json
+
+from utils.event_log import TaskEventLog, iter_task_events, iter_task_headers
+
+
+def click(n):
+    return {"taskId": "T1", "type": "click", "eventHash": f"h{n}", "actionTimestamp": n}
+
+
+def test_seq_continues_across_reopens(tmp_path):
+    entries = TaskEventLog(tmp_path, durable=False).append_many([click(0), click(1)])
+    assert [e["seq"] for e in entries] == [0, 1]
+    assert entries[1]["offset"] == entries[0]["length"]
+
+    reopened = TaskEventLog(tmp_path, durable=False)
+    assert [e["seq"] for e in reopened.append_many([click(2)])] == [2]
+    assert [event["seq"] for _, event in TaskEventLog(tmp_path).iter_events()] == [0, 1, 2]
+
+
+def test_events_iterate_in_seq_order_across_segments(tmp_path):
+    log = TaskEventLog(tmp_path, segment_bytes=200, durable=False)
+    for n in range(0, 12, 3):
+        log.append_many([click(n), click(n + 1), click(n + 2)])
+    assert len({e["segment"] for e in log.entries()}) > 1
+
+    names = [name for name, _ in iter_task_events(tmp_path)]
+    assert names == [f"event_{n:06d}" for n in range(12)]
+    assert [h["actionTimestamp"] for h in iter_task_headers(tmp_path)] == list(range(12))
+
+
+def test_torn_segment_tail_is_cut(tmp_path):
+    TaskEventLog(tmp_path, durable=False).append_many([click(0)])
+    segment = tmp_path / "events-000000.jsonl"
+    with segment.open("ab") as fh:
+        fh.write(b'{"taskId": "T1", "type": "cli')            # crash in the middle of a record
+
+    log = TaskEventLog(tmp_path, durable=False)
+    log.append_many([click(1)])
+    assert [event["actionTimestamp"] for _, event in log.iter_events()] == [0, 1]
+    assert segment.read_bytes().count(b"\n") == 2
+
+
+def test_unindexed_records_are_indexed_again(tmp_path):
+    TaskEventLog(tmp_path, durable=False).append_many([click(0), click(1), click(2)])
+    index = tmp_path / "events.idx"
+    lines = index.read_bytes().splitlines(keepends=True)
+    index.write_bytes(lines[0] + lines[1][:10])                # lost the index of 1 and 2, torn line
+
+    log = TaskEventLog(tmp_path, durable=False)
+    assert [e["seq"] for e in log.entries()] == [0]
+    assert [e["seq"] for e in log.append_many([click(3)])] == [3]
+    assert [json.loads(line)["seq"] for line in index.read_bytes().splitlines()] == [0, 1, 2, 3]
+    assert [event["actionTimestamp"] for _, event in TaskEventLog(tmp_path).iter_events()] == [0, 1, 2, 3]
+
+
+def test_malformed_records_are_skipped(tmp_path, capsys):
+    log = TaskEventLog(tmp_path, durable=False)
+    log.append_many([click(0), {"taskId": "T1", "type": "scroll"}, click(2)])
+    assert [name for name, _ in iter_task_events(tmp_path)] == ["event_000000", "event_000002"]
+    assert "skipping malformed event event_000001" in capsys.readouterr().out
@@ -0,0 +1,56 @@
+"""Typed schema of recorder events.
+
+run with: pytest utils/tests/test_event_schema.py
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+from utils.event_schema import EventSchemaError, decode_event, decode_event_header, decode_event_json, validate_event
+
+TASK = Path("data_samples/action_set_y757R6w6y17LVHXl")
+
+
+def test_sample_events_decode_to_plain_dicts():
+    for path in sorted(TASK.glob("*.json")):
+        event = decode_event_json(path.read_bytes())
+        assert type(event) is dict and event == json.loads(path.read_text(encoding="utf-8"))
+
+
+def test_unknown_fields_are_kept():
+    event = decode_event({"taskId": "T1", "type": "click", "eventTarget": {"rect": [1, 2]}, "extra": 1})
+    assert event["extra"] == 1 and event["eventTarget"]["rect"] == [1, 2]
+
+
+@pytest.mark.parametrize("raw, message", [
+    ({"type": "click"}, "taskId"),
+    ({"taskId": "T1", "type": "scroll"}, "type"),
+    ({"taskId": "T1", "type": "click", "actionTimestamp": "soon"}, "actionTimestamp"),
+    ({"taskId": "T1", "type": "task-start", "allEvents": []}, "current_url"),
+    ({"taskId": "T1", "type": "go-back-or-forward", "eventTarget": {}}, "eventTarget.target"),
+    ({"taskId": "T1", "type": "click", "pageHTMLDelta": {"base": "a", "hash": "b", "start": 0}}, "pageHTMLDelta"),
+])
+def test_invalid_events_are_rejected(raw, message):
+    assert message in validate_event(raw)
+    with pytest.raises(EventSchemaError):
+        decode_event_json(json.dumps(raw))
+
+
+@pytest.mark.parametrize("task_id", ["", "*", "T?", "[T]1", "../x", "a/b", "a\\b", ".", "x" * 129, "café"])
+def test_task_ids_must_be_safe_folder_names(task_id):
+    with pytest.raises(EventSchemaError, match="taskId"):
+        decode_event({"taskId": task_id, "type": "click"})
+
+
+def test_task_id_alphabet():
+    assert validate_event({"taskId": "y757R6w6y17LVHXl", "type": "click"}) is None
+    assert validate_event({"taskId": "task_2025-05-23", "type": "click"}) is None
+
+
+def test_headers_are_validated_without_a_snapshot():
+    header = {"taskId": "T1", "type": "click", "actionTimestamp": 5}
+    assert decode_event_header(header) == header and decode_event_header({}) == {}
+    for bad in ({"type": "scroll"}, {"taskId": "../x"}, {"actionTimestamp": "soon"}):
+        with pytest.raises(EventSchemaError):
+            decode_event_header(bad)
@@ -0,0 +1,63 @@
+"""Output equivalence of the sanitizer engines.
+
+run with: pytest utils/tests/test_html_cleaner.py
+"""
+from pathlib import Path
+
+import pytest
+from html_sanitizer import Sanitizer
+
+from utils.html_cleaner import PROFILES, _load_pages, get_sanitizer, run_html_sanitizer
+from utils.lxml_sanitizer import LxmlSanitizer
+
+DATA_SAMPLES = Path(__file__).resolve().parents[2] / "data_samples"
+
+SNIPPETS = [
+    '<p>plain <b>bold</b> and <i>italic</i> text</p>',
+    '<a href="javascript:alert(1)">js</a> <a href=" /relative ">spaced</a> <a href="java%0Ascript:x">enc</a>',
+    '<a href="https://example.com/?next=data:text/html,hi">query</a> <a href="ftp://x">ftp</a> <a href="#top">top</a>',
+    '<a href="/x" onclick="steal()" target="_blank" id="anchor">new tab</a><a href="/y" rel="nofollow" target="_blank">y</a>',
+    '<span style="font-weight: bold">strong</span><span style="font-style:italic">em</span>'
+    '<span style="color:red;x:expression(alert(1))">red</span><span style="background:url(javascript:bold)">u</span>',
+    '<ul><li>- one</li><li><p>para in li</p></li><li>* two</li></ul><p><p>nested</p></p>',
+    '<p>line<br><br><br>break</p><p><br>lead</p><p> <br> </p><div>   </div>',
+    '<strong>a</strong><strong>b</strong> <em>c</em><em>d</em><h1>x</h1><h1>y</h1>',
+    '<script>evil()</script><style>p{}</style><!-- note --><iframe src="x">frame</iframe><object data="x">obj</object>',
+    '<form action="/go"><input name="q" value="v"><button aria-label="Go">Go</button><select><option>1</option></select></form>',
+    '<div data-testid="card" role="main" aria-label="card"><img src="a.png" alt="A"><span>x</span></div>',
+    'tabs\tand\nnewlines\r\n&nbsp;nbsp and thin　spaces \x01control\x7f chars',
+    '<table><tr><td>1</td><td></td></tr></table><video src="v.mp4"></video><title>t</title>',
+    '<meta http-equiv="refresh" content="0;url=javascript:x"><link rel="stylesheet" href="s.css"><p>after</p>',
+    'broken <div><p>unclosed <a href="/z">z',
+    '',
+]
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILES))
+@pytest.mark.parametrize("html", SNIPPETS)
+def test_snippets_match_reference(profile, html):
+    reference = Sanitizer(PROFILES[profile]).sanitize(html)
+    assert LxmlSanitizer(PROFILES[profile]).sanitize(html) == reference
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILES))
+def test_recorded_pages_match_reference(profile):
+    pages = _load_pages(DATA_SAMPLES)
+    assert pages
+    reference, fast = Sanitizer(PROFILES[profile]), get_sanitizer(profile, "lxml")
+    for _, html in pages:
+        assert fast.sanitize(html) == reference.sanitize(html)
+
+
+def test_sanitizers_are_cached_per_profile_and_engine():
+    assert get_sanitizer("default", "lxml") is get_sanitizer("default", "lxml")
+    assert get_sanitizer("default", "lxml") is not get_sanitizer("task-finish", "lxml")
+    assert run_html_sanitizer("<p>x</p>", "click", "html_sanitizer") == "<p>x</p>"
+    with pytest.raises(ValueError):
+        get_sanitizer("default", "regex")
+
+
+def test_unsupported_settings_fall_back_to_reference():
+    settings = {"tags": {"p", "style"}, "attributes": {}, "empty": set(), "separate": {"p"}}
+    html = '<style>p{color:red}</style><p onclick="x">a</p>'
+    assert LxmlSanitizer(settings).sanitize(html) == Sanitizer(settings).sanitize(html)
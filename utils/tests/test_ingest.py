@@ -0,0 +1,275 @@
+"""Collector ingest: batch decoding, the bounded queue and the event writer behind it.
+
+run with: pytest utils/tests/test_ingest.py
+"""
+import asyncio
+import gzip
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import pytest
+
+from utils.event_coalescer import EventCoalescer
+from utils.event_log import TaskEventLog
+from utils.event_schema import EventSchemaError
+from utils.ingest import EventWriter, IngestQueue, ack_map, client_seqs, decode_event_batch
+from utils.snapshot_store import SnapshotStore, snapshot_hash
+
+
+def click(n, task_id="T1", **extra):
+    return {"taskId": task_id, "type": "click", "eventHash": f"h{n}", "actionTimestamp": n, **extra}
+
+
+def logged(writer, task_id="T1"):
+    return [event for _, event in writer.task_log(task_id).iter_events()]
+
+
+def test_full_queue_refuses_events(tmp_path):
+    async def go():
+        queue = IngestQueue(EventWriter(tmp_path, durable=False), maxsize=2)
+        accepted = [queue.offer(click(0)), queue.offer(click(1)), queue.offer(click(2))]
+        return accepted, queue.offer_many([click(3)]), queue.depth
+
+    accepted, batch_accepted, depth = asyncio.run(go())
+    assert accepted == [True, True, False]
+    assert not batch_accepted and depth == 2
+
+
+def test_batch_is_queued_whole_or_not_at_all(tmp_path):
+    async def go():
+        queue = IngestQueue(EventWriter(tmp_path, durable=False), maxsize=3)
+        queue.offer(click(0))
+        return queue.offer_many([click(1), click(2), click(3)]), queue.offer_many([click(1), click(2)]), queue.depth
+
+    assert asyncio.run(go()) == (False, True, 3)
+
+
+def test_close_writes_everything_queued(tmp_path):
+    writer = EventWriter(tmp_path, durable=False)
+
+    async def go():
+        queue = IngestQueue(writer, maxsize=16, batch_size=2)
+        queue.start()
+        assert queue.offer_many([click(n) for n in range(5)])
+        await queue.close()
+
+    asyncio.run(go())
+    events = logged(writer)
+    assert [e["actionTimestamp"] for e in events] == [0, 1, 2, 3, 4]
+    assert [e["seq"] for e in events] == [0, 1, 2, 3, 4]
+    assert TaskEventLog(writer.task_log("T1").folder).next_seq == 5      # index on disk
+
+
+def test_task_ids_are_not_glob_patterns(tmp_path):
+    writer = EventWriter(tmp_path, durable=False)
+    writer.write_batch([click(0, task_id="T1")])
+
+    reopened = EventWriter(tmp_path, durable=False)              # looks up existing logs on disk
+    for pattern in ("*", "T?", "[T]1"):
+        assert reopened.task_log(pattern).folder.name == pattern
+    assert reopened.task_log("T1").folder == writer.task_log("T1").folder
+
+
+def uploaded(n, **extra):
+    return click(n, clientSeq=n, **extra)
+
+
+def test_retries_of_written_events_are_skipped_after_a_restart(tmp_path):
+    EventWriter(tmp_path, durable=False).write_batch([uploaded(0), uploaded(1), uploaded(3)])
+
+    restarted = EventWriter(tmp_path, durable=False)
+    written = restarted.write_batch([uploaded(n) for n in range(5)])
+    assert [e["seq"] for e in written] == [3, 4]                  # clientSeq 2 and 4
+    assert [e["clientSeq"] for e in logged(restarted)] == [0, 1, 3, 2, 4]
+
+
+def test_held_events_are_settled_only_when_written(tmp_path):
+    writer = EventWriter(tmp_path, durable=False, coalescer=EventCoalescer(window=60))
+    assert writer.write_batch([uploaded(0), uploaded(1)]) == []
+    assert writer.write_batch([uploaded(0), uploaded(1, eventHash="other")]) == []   # retries while held
+    assert [e["clientSeq"] for e in writer.flush_due(force=True)] == [0, 1]
+    assert writer.write_batch([uploaded(0)]) == [] and writer.flush_due(force=True) == []
+
+    # held, then lost with the process: the retry is accepted by the next one
+    lost = EventWriter(tmp_path, durable=False, coalescer=EventCoalescer(window=60))
+    lost.write_batch([uploaded(2)])
+    restarted = EventWriter(tmp_path, durable=False, coalescer=EventCoalescer(window=60))
+    restarted.write_batch([uploaded(2)])
+    assert [e["clientSeq"] for e in restarted.flush_due(force=True)] == [2]
+
+
+def test_duplicates_dropped_by_the_coalescer_are_settled(tmp_path):
+    writer = EventWriter(tmp_path, durable=False, coalescer=EventCoalescer(window=60))
+    writer.write_batch([uploaded(0, eventHash="a"), uploaded(1, eventHash="a")])
+    writer.flush_due(force=True)
+    assert 1 in writer._settled_seqs("T1") and not writer._in_flight["T1"]
+    assert writer.write_batch([uploaded(1, eventHash="a")]) == [] and writer.flush_due(force=True) == []
+
+
+def test_failed_writes_can_be_retried(tmp_path, monkeypatch):
+    def disk_full(self, records):
+        raise OSError("disk full")
+
+    writer = EventWriter(tmp_path, durable=False)
+    monkeypatch.setattr(TaskEventLog, "append_many", disk_full)
+    with pytest.raises(OSError):
+        writer.write_batch([uploaded(0)])
+    monkeypatch.undo()
+    assert [e["clientSeq"] for e in writer.write_batch([uploaded(0)])] == [0]
+
+
+def ndjson(events):
+    return "\n".join(json.dumps(e) for e in events).encode("utf-8")
+
+
+@pytest.mark.parametrize("encoding, compress", [
+    (None, lambda b: b),
+    ("gzip", gzip.compress),
+    ("deflate", zlib.compress),
+    ("deflate", lambda b: zlib.compress(b)[2:-4]),               # raw deflate, no zlib header
+])
+def test_batches_decode_in_client_seq_order(encoding, compress):
+    body = ndjson([uploaded(1), uploaded(0, task_id="T2"), uploaded(0), uploaded(1, task_id="T2")])
+    events, rejected = decode_event_batch(compress(body), encoding)
+    assert [(e["taskId"], e["clientSeq"]) for e in events] == [("T1", 0), ("T2", 0), ("T1", 1), ("T2", 1)]
+    assert rejected == []
+
+
+def test_malformed_lines_are_rejected_one_by_one():
+    body = b"\n".join([json.dumps(uploaded(0)).encode(), b"{not json", b"",
+                       json.dumps({"type": "click", "clientSeq": 7}).encode(), json.dumps(uploaded(1)).encode()])
+    events, rejected = decode_event_batch(body)
+    assert [e["clientSeq"] for e in events] == [0, 1]
+    assert [(r["index"], r["clientSeq"]) for r in rejected] == [(1, None), (2, 7)]
+
+    events, rejected = decode_event_batch(json.dumps([uploaded(0), {"taskId": "*"}]).encode())
+    assert len(events) == 1 and rejected[0]["index"] == 1
+
+
+@pytest.mark.parametrize("body, encoding", [
+    (b"not gzip", "gzip"), (b"[1, 2", None), (ndjson([uploaded(0)]), "br"),
+])
+def test_unreadable_bodies_raise(body, encoding):
+    with pytest.raises(EventSchemaError):
+        decode_event_batch(body, encoding)
+
+
+def test_acks_wait_for_held_events(tmp_path):
+    writer = EventWriter(tmp_path, durable=False, coalescer=EventCoalescer(window=0.2))
+    writer.write_batch([uploaded(0), uploaded(1)])
+    assert writer.settled(client_seqs([uploaded(0), uploaded(1)])) == set()
+    assert writer.wait_settled({("T1", 0)}, timeout=0.05) == set()
+
+    flusher = threading.Timer(0.3, writer.flush_due)
+    flusher.start()
+    assert writer.wait_settled({("T1", 0), ("T1", 1)}, timeout=5) == {("T1", 0), ("T1", 1)}
+    flusher.join()
+    assert ack_map({("T2", 0), ("T1", 1), ("T1", 0)}) == {"T1": [0, 1], "T2": [0]}
+
+
+def test_queue_acks_only_written_events(tmp_path):
+    writer = EventWriter(tmp_path, durable=False, coalescer=EventCoalescer(window=0.3))
+
+    async def go():
+        queue = IngestQueue(writer, flush_interval=0.05)
+        queue.start()
+        batch = [uploaded(0), uploaded(1)]
+        queue.offer_many(batch)
+        early = await queue.acknowledge(client_seqs(batch), timeout=0.1)    # still held
+        acked = await queue.acknowledge(client_seqs(batch), timeout=5)
+        queue.offer_many([uploaded(1)])                                     # a retry is acked at once
+        retried = await queue.acknowledge({("T1", 1)}, timeout=5)
+        await queue.close()
+        return early, acked, retried
+
+    early, acked, retried = asyncio.run(go())
+    assert early == set()
+    assert acked == {("T1", 0), ("T1", 1)} and retried == {("T1", 1)}
+
+
+def page(n):
+    return f"<html><body><p>visit {n}</p>{'<li>row</li>' * 200}</body></html>"
+
+
+def delta_event(base_html, html, task_id="T1", **extra):
+    """A recorder event whose snapshot is uploaded as a splice of *base_html*."""
+    start = 0
+    while base_html[start] == html[start]:
+        start += 1
+    delta = {"base": snapshot_hash(base_html), "hash": snapshot_hash(html),
+             "start": start, "end": len(base_html), "text": html[start:]}
+    return {"taskId": task_id, "type": "click", "pageHTMLDelta": delta, **extra}
+
+
+def test_unknown_delta_bases_ask_for_a_resync(tmp_path):
+    writer = EventWriter(tmp_path, durable=False, snapshots=SnapshotStore(tmp_path / "blobs"))
+    first = {"taskId": "T1", "type": "task-start", "pageHTMLContent": page(0)}
+    events = [first, delta_event(page(0), page(1)), delta_event(page(5), page(6), task_id="T2"),
+              delta_event(page(6), page(7), task_id="T2")]
+    kept, resync = writer.prepare(events)
+    assert resync == ["T2"] and kept == events[:2]               # T2 is not written from its lost base on
+    assert events[1]["pageHTMLContent"] == page(1) and "pageHTMLDelta" not in events[1]
+
+    bad_hash = delta_event(page(1), page(2))
+    bad_hash["pageHTMLDelta"]["hash"] = snapshot_hash("something else")
+    assert writer.prepare([bad_hash]) == ([], ["T1"])
+
+    writer.write_batch(kept)                                     # bases are found in the blob store later on
+    restarted = EventWriter(tmp_path, durable=False, snapshots=SnapshotStore(tmp_path / "blobs"))
+    retry = delta_event(page(1), page(3))
+    assert restarted.prepare([retry]) == ([retry], []) and retry["pageHTMLContent"] == page(3)
+
+
+def test_events_with_lost_bases_are_not_acked(tmp_path):
+    writer = EventWriter(tmp_path, durable=False, snapshots=SnapshotStore(tmp_path / "blobs"))
+    batch = [uploaded(0, pageHTMLContent=page(0)), uploaded(1, **delta_event(page(0), page(1))),
+             uploaded(2, **delta_event(page(1), page(2)))]
+    writer.prepare(batch[:1])
+    writer.write_batch(batch[:1])
+
+    restarted = EventWriter(tmp_path, durable=False, snapshots=SnapshotStore(tmp_path / "blobs"))
+    lost = delta_event(page(9), page(1))                         # base never stored
+    lost["pageHTMLDelta"]["hash"] = batch[1]["pageHTMLDelta"]["hash"]
+    retry = [batch[0], uploaded(1, **lost), batch[2]]
+    kept, resync = restarted.prepare(retry)
+    restarted.write_batch(kept)
+    assert resync == ["T1"] and restarted.settled(client_seqs(retry)) == {("T1", 0)}
+
+    whole = [uploaded(1, pageHTMLContent=page(1)), uploaded(2, **delta_event(page(1), page(2)))]
+    kept, resync = restarted.prepare(whole)                      # resent as a keyframe
+    restarted.write_batch(kept)
+    assert resync == [] and restarted.settled(client_seqs(retry)) == {("T1", 0), ("T1", 1), ("T1", 2)}
+    assert [e["clientSeq"] for e in logged(restarted)] == [0, 1, 2]
+
+
+class SlowCache(OrderedDict):
+    """Yields to other threads on every lookup, widening check-then-use races."""
+
+    def __contains__(self, key):
+        found = super().__contains__(key)
+        time.sleep(0.0002)
+        return found
+
+
+def test_deltas_expand_while_the_writer_persists(tmp_path):
+    store = SnapshotStore(tmp_path / "blobs", codec="zlib", cache_size=2)
+    store._cache = SlowCache()
+    writer = EventWriter(tmp_path, durable=False, snapshots=store)
+    writer.write_batch([{"taskId": "W", "type": "click", "pageHTMLContent": page(n)} for n in range(8)])
+
+    def persist():
+        for n in range(8, 200):
+            writer.write_batch([{"taskId": "W", "type": "click", "pageHTMLContent": page(n)}])
+
+    thread = threading.Thread(target=persist)
+    thread.start()
+    try:
+        while thread.is_alive():
+            events = [delta_event(page(n), page(n + 1000), task_id="R") for n in range(8)]
+            assert writer.prepare(events) == (events, [])         # bases are read through the store
+            assert [e["pageHTMLContent"] for e in events] == [page(n + 1000) for n in range(8)]
+    finally:
+        thread.join()
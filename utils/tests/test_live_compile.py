@@ -0,0 +1,90 @@
+"""Exact-replay plans compiled while recording.
+
+run with: pytest utils/tests/test_live_compile.py
+"""
+import json
+
+import pytest
+
+from utils import live_compile
+from utils.ingest import EventWriter
+from utils.live_compile import PARTIAL_NAME, PLAN_NAME, LiveCompiler, compiled_actions
+
+
+def fake_compile(events):
+    """One action per event, so plans are easy to compare (browser_use is not needed)."""
+    return [{"action": event["type"], "at": event.get("actionTimestamp")} for event in events]
+
+
+@pytest.fixture(autouse=True)
+def compiler_fn(monkeypatch):
+    calls = []
+
+    def compile_fn(events):
+        calls.extend(events)
+        return fake_compile(events)
+
+    monkeypatch.setattr(live_compile, "_compile_fn", compile_fn)
+    return calls
+
+
+def recording(task_id="T1"):
+    return [{"taskId": task_id, "type": "task-start", "taskDescription": "buy a keyboard", "actionTimestamp": 0,
+             "allEvents": [{"current_url": "https://example.com/"}]},
+            {"taskId": task_id, "type": "click", "actionTimestamp": 1},
+            {"taskId": task_id, "type": "input-change", "actionTimestamp": 2},
+            {"taskId": task_id, "type": "task-finish", "actionTimestamp": 3}]
+
+
+def test_plan_is_written_on_task_finish(tmp_path):
+    writer = EventWriter(tmp_path, durable=False, compiler=LiveCompiler())
+    events = recording()
+    writer.write_batch(events[:2])
+    folder = writer.task_log("T1").folder
+    assert not (folder / PLAN_NAME).exists()
+    assert [json.loads(line)["seq"] for line in (folder / PARTIAL_NAME).open()] == [0, 1]
+
+    writer.write_batch(events[2:])
+    plan = json.loads((folder / PLAN_NAME).read_text(encoding="utf-8"))
+    assert plan["ultimate_goal"] == "buy a keyboard" and plan["task_id"] == "T1"
+    assert plan["action_list"] == fake_compile(events)
+
+
+def test_missing_and_torn_partial_records_are_recompiled(tmp_path, compiler_fn):
+    writer = EventWriter(tmp_path, durable=False, compiler=LiveCompiler())
+    events = recording()[:3]
+    writer.write_batch(events)
+    partial = writer.task_log("T1").folder / PARTIAL_NAME
+    lines = partial.read_text(encoding="utf-8").splitlines()
+    partial.write_text(lines[0] + "\n" + lines[2][:10], encoding="utf-8")   # seq 1 lost, seq 2 torn
+
+    compiler_fn.clear()
+    assert compiled_actions(partial.parent) == fake_compile(events)
+    assert [e["actionTimestamp"] for e in compiler_fn] == [1, 2]
+    assert compiled_actions(tmp_path) is None                               # not a logged task
+
+
+def test_compilation_is_disabled_without_browser_use(tmp_path, monkeypatch):
+    def missing(events):
+        raise ImportError("No module named 'langchain_core'")
+
+    monkeypatch.setattr(live_compile, "_compile_fn", missing)
+    compiler = LiveCompiler()
+    writer = EventWriter(tmp_path, durable=False, compiler=compiler)
+    assert [e["seq"] for e in writer.write_batch(recording())] == [0, 1, 2, 3]   # events are still written
+    assert not compiler.enabled
+    assert not (writer.task_log("T1").folder / PARTIAL_NAME).exists()
+
+
+def test_events_that_fail_to_compile_have_no_actions(tmp_path, monkeypatch):
+    def picky(events):
+        if events[0]["type"] == "input-change":
+            raise ValueError("no target")
+        return fake_compile(events)
+
+    monkeypatch.setattr(live_compile, "_compile_fn", picky)
+    writer = EventWriter(tmp_path, durable=False, compiler=LiveCompiler())
+    events = recording()
+    writer.write_batch(events)
+    plan = json.loads((writer.task_log("T1").folder / PLAN_NAME).read_text(encoding="utf-8"))
+    assert [a["at"] for a in plan["action_list"]] == [0, 1, 3]
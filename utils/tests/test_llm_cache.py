@@ -0,0 +1,50 @@
+"""Disk-backed LLM reply cache.
+
+run with: pytest utils/tests/test_llm_cache.py
+"""
+import time
+
+from utils.llm_cache import LLMCache, cache_key, cacheable
+
+
+def test_hits_misses_and_key(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite3")
+    assert cache.get("gpt-4o", 0, "sys", "prompt") is None
+    cache.put("gpt-4o", 0, "sys", "prompt", "reply")
+    assert cache.get("gpt-4o", 0, "sys", "prompt") == "reply"
+    assert cache.get("gpt-4o", 0.2, "sys", "prompt") is None       # every part of the key counts
+    assert cache.get("gpt-4o", 0, None, "prompt") is None
+    assert cache.get("gpt-4o-mini", 0, "sys", "prompt") is None
+    assert cache_key("m", 0, None, "p") == cache_key("m", 0.0, "", "p")
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 4
+    cache.close()
+
+    reopened = LLMCache(tmp_path / "cache.sqlite3")                # persisted on disk
+    assert reopened.get("gpt-4o", 0, "sys", "prompt") == "reply"
+    assert reopened.stats()["lifetime_hits"] == 2
+
+
+def test_age_and_size_eviction(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite3", max_mb=0, max_age_days=1)
+    cache.put("m", 0, None, "old", "x")
+    cache._conn.execute("UPDATE replies SET created_at = ?", (time.time() - 2 * 86400,))
+    assert cache.get("m", 0, None, "old") is None
+    assert cache.evict() == 1
+
+    cache = LLMCache(tmp_path / "sized.sqlite3", max_mb=0.01, max_age_days=0)     # ≈ 10 KB
+    for i in range(8):
+        cache.put("m", 0, None, f"p{i}", "r" * 2000)
+    cache.get("m", 0, None, "p0")                                  # recently used, survives
+    assert cache.evict() > 0
+    stats = cache.stats()
+    assert stats["bytes"] <= 0.9 * 0.01 * 1024 * 1024
+    assert cache.get("m", 0, None, "p0") is not None
+    assert cache.get("m", 0, None, "p1") is None
+
+
+def test_only_temperature_zero_is_cached_by_default(monkeypatch):
+    monkeypatch.delenv("OTA_LLM_CACHE_ALL_TEMPERATURES", raising=False)
+    assert cacheable(0) and cacheable(0.0)
+    assert not cacheable(0.7)
+    monkeypatch.setenv("OTA_LLM_CACHE_ALL_TEMPERATURES", "1")
+    assert cacheable(0.7)
@@ -0,0 +1,30 @@
+"""Shared LLM clients and their HTTP pools.
+
+run with: pytest utils/tests/test_llm_clients.py
+"""
+import asyncio
+
+import pytest
+
+llm = pytest.importorskip("utils.llm")
+
+
+def test_each_loop_closes_its_async_pool(monkeypatch):
+    monkeypatch.setattr(llm, "_build_llm", lambda model, temperature, **kwargs: kwargs)
+    registry = llm._ClientRegistry()
+    monkeypatch.setattr(llm, "_REGISTRY", registry)
+
+    async def run():
+        client = llm.get_chat_model("gpt-4o")
+        assert llm.get_chat_model("gpt-4o") is client
+        pool = client["http_async_client"]
+        await llm.aclose_chat_models()
+        assert pool.is_closed and not registry._per_loop
+        assert llm.get_chat_model("gpt-4o") is not client         # a fresh pool after closing
+        await llm.aclose_chat_models()
+        return pool
+
+    first = asyncio.run(run())
+    second = asyncio.run(run())
+    assert first is not second
+    registry.close()
@@ -0,0 +1,122 @@
+"""Rate limiting, retries and ordered fan-out of LLM calls.
+
+run with: pytest utils/tests/test_llm_concurrency.py
+"""
+import asyncio
+import random
+import time
+
+import pytest
+
+from utils.llm_concurrency import RateLimiter, call_with_retries, is_retryable, ordered_fan_out
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+
+def test_limiter_spreads_requests_and_tokens_over_the_minute():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=60, tpm=1000, clock=clock, sleep=clock.sleep)
+
+    async def go():
+        stamps = []
+        for _ in range(65):
+            await limiter.acquire(10)
+            stamps.append(clock.now)
+        return stamps
+
+    stamps = asyncio.run(go())
+    assert stamps[59] == 0                          # a full minute of budget up front
+    assert stamps[64] == pytest.approx(5)           # then one request per second
+
+    clock.now += 60                                 # refill
+    asyncio.run(limiter.acquire(900))
+    before = clock.now
+    asyncio.run(limiter.acquire(600))               # needs 500 more tokens: 30 s at 1000 tpm
+    assert clock.now - before == pytest.approx(30)
+
+
+def test_retries_429_and_5xx_but_not_client_errors():
+    assert is_retryable(StatusError(429)) and is_retryable(StatusError(503))
+    assert not is_retryable(StatusError(400)) and not is_retryable(ValueError("bad prompt"))
+
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+    calls = []
+
+    async def flaky():
+        calls.append(clock.now)
+        if len(calls) < 3:
+            raise StatusError(429, retry_after="2")
+        return "ok"
+
+    result = asyncio.run(call_with_retries(flaky, limiter=limiter, sleep=clock.sleep))
+    assert result == "ok"
+    assert calls == [0, 2, 4]                       # Retry-After honoured
+
+    async def broken():
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        asyncio.run(call_with_retries(broken, sleep=clock.sleep))
+
+    async def down():
+        raise StatusError(500)
+
+    with pytest.raises(StatusError):
+        asyncio.run(call_with_retries(down, max_retries=2, sleep=clock.sleep))
+
+
+def test_fan_out_is_concurrent_and_emits_in_input_order():
+    rng = random.Random(7)
+    delays = [rng.uniform(0.01, 0.05) for _ in range(20)]
+    in_flight, peak, emitted = 0, 0, []
+
+    async def call(i):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(delays[i])
+        in_flight -= 1
+        return i * i
+
+    start = time.perf_counter()
+    results = asyncio.run(ordered_fan_out(range(20), call, concurrency=5,
+                                          emit=lambda i, item, r: emitted.append((i, item, r))))
+    elapsed = time.perf_counter() - start
+    assert results == [i * i for i in range(20)]
+    assert emitted == [(i, i, i * i) for i in range(20)]
+    assert peak == 5
+    assert elapsed < sum(delays) / 2
+
+
+def test_fan_out_stops_after_a_failure():
+    started, emitted = [], []
+
+    async def call(i):
+        started.append(i)
+        await asyncio.sleep(0.01 if i != 3 else 0)
+        if i == 3:
+            raise RuntimeError("boom")
+        return i
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(ordered_fan_out(range(100), call, concurrency=4,
+                                    emit=lambda i, item, r: emitted.append(i)))
+    assert emitted == [0, 1, 2]
+    assert len(started) < 10
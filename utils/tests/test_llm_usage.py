@@ -0,0 +1,59 @@
+"""Token and cost accounting of LLM calls.
+
+run with: pytest utils/tests/test_llm_usage.py
+"""
+import asyncio
+from types import SimpleNamespace
+
+from utils.llm_usage import TOTAL, Usage, record_reply, record_usage, token_cost, track_usage, usage_of
+from utils.tokenizer import count_tokens
+
+
+def test_prices_by_longest_prefix():
+    assert token_cost("gpt-4o-mini-2024-07-18", 1_000_000, 0) == 0.15
+    assert token_cost("gpt-4o", 1_000_000, 1_000_000) == 12.5
+    assert token_cost("some-local-model", 10, 10) is None
+
+
+def test_reply_usage_metadata_or_counted():
+    reported = SimpleNamespace(content="ok", usage_metadata={"input_tokens": 120, "output_tokens": 7})
+    legacy = SimpleNamespace(content="ok", response_metadata={"token_usage": {"prompt_tokens": 9,
+                                                                             "completion_tokens": 2}})
+    assert usage_of(reported) == (120, 7) and usage_of(legacy) == (9, 2)
+    assert usage_of(SimpleNamespace(content="ok")) is None
+    with track_usage() as usage:
+        record_reply("gpt-4o", SimpleNamespace(content="x" * 40), input_tokens=500)
+    assert usage.input_tokens == 500 and usage.output_tokens > 0
+
+
+def test_scopes_nest_and_follow_tasks():
+    before = TOTAL.totals()[0]
+    task = Usage()
+
+    async def step():
+        record_usage("gpt-4o", 100, 10)
+
+    async def run():
+        with track_usage(task):
+            with track_usage() as inner:
+                await asyncio.gather(step(), step())
+            record_usage("unpriced-model", 5, 5)
+        record_usage("gpt-4o", 1, 1)                        # outside the task scope
+        return inner
+
+    inner = asyncio.run(run())
+    assert inner.totals() == (200, 20, token_cost("gpt-4o", 200, 20))
+    summary = task.as_dict()
+    assert summary["calls"] == 3 and summary["unpriced_calls"] == 1
+    assert summary["by_model"]["unpriced-model"]["cost"] is None
+    assert TOTAL.totals()[0] - before == 206
+
+
+def test_usage_records_replies_given_to_it():
+    run, outer = Usage(), Usage()
+    with track_usage(outer):
+        run.record_reply("gpt-4o", SimpleNamespace(content="ok", usage_metadata={"input_tokens": 50,
+                                                                              "output_tokens": 5}))
+    run.record_reply("gpt-4o", SimpleNamespace(content="ok"), input_tokens=10)
+    assert run.totals()[:2] == (60, 5 + count_tokens("ok", "gpt-4o"))
+    assert outer.totals()[:2] == (50, 5)
@@ -0,0 +1,66 @@
+"""In-process metrics in the Prometheus text format.
+
+run with: pytest utils/tests/test_metrics.py
+"""
+import pytest
+
+from utils.metrics import MetricsRegistry
+
+
+def test_counters_render_per_label_set():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests served.", ("route",))
+    requests.labels(route="/a").inc()
+    requests.labels("/a").inc(2)
+    requests.labels(route='say "hi"\n').inc()
+    assert registry.render() == (
+        "# HELP requests_total Requests served.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/a"} 3\n'
+        'requests_total{route="say \\"hi\\"\\n"} 1\n')
+    with pytest.raises(ValueError):
+        requests.labels(route="/a").inc(-1)
+    with pytest.raises(ValueError):
+        requests.labels("/a", "extra")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_gauge_functions_are_read_at_render_time():
+    registry = MetricsRegistry()
+    depth = [3]
+    registry.gauge("queue_depth", "Queued events.").set_function(lambda: depth[0])
+    assert "queue_depth 3" in registry.render()
+    depth[0] = 5
+    assert "queue_depth 5" in registry.render()
+
+    registry.gauge("broken", "Dead callback.", fn=lambda: 1 / 0)
+    assert registry.render().splitlines()[-2:] == ["# HELP broken Dead callback.", "# TYPE broken gauge"]
+
+
+def test_series_beyond_max_series_are_evicted_oldest_first():
+    registry = MetricsRegistry()
+    per_task = registry.counter("events_total", "Events per task.", ("task",), max_series=2)
+    for task in ("A", "B", "A", "C"):
+        per_task.labels(task=task).inc()
+    assert registry.render().splitlines()[2:] == ['events_total{task="A"} 2', 'events_total{task="C"} 1']
+
+
+def test_names_are_registered_once():
+    registry = MetricsRegistry()
+    counter = registry.counter("x_total", "X.")
+    assert registry.counter("x_total", "X again.") is counter
+    with pytest.raises(ValueError):
+        registry.gauge("x_total", "X as a gauge.")
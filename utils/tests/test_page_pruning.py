@@ -0,0 +1,77 @@
+"""Event-anchored page pruning.
+
+run with: pytest utils/tests/test_page_pruning.py
+"""
+import lxml.html
+
+from utils.action_processing import extract_action_bundle
+from utils.page_pruning import HIDDEN, estimate_tokens, find_anchors, prune_page
+
+FILLER = "".join(f'<div class="card"><p>{"filler text " * 40}{i}</p></div>' for i in range(60))
+PAGE = (f'<header><h1>Shop</h1></header><main>{FILLER}'
+        '<form id="search"><input id="q" name="q"><button id="go">Search now</button></form>'
+        f'{FILLER}</main><footer>{"footer " * 200}</footer>')
+
+
+def _text(html):
+    return lxml.html.fragment_fromstring(html, create_parent="div").text_content()
+
+
+def test_small_pages_and_zero_budget_are_unchanged():
+    assert prune_page("<p>short</p>", {}, 100) == "<p>short</p>"
+    assert prune_page(PAGE, {}, 0) == PAGE
+
+
+def test_keeps_target_and_its_context_within_budget():
+    event = {"type": "click", "eventTarget": {"type": "click", "targetId": "go",
+                                              "target": "<button id=\"go\">Search now</button>"}}
+    pruned = prune_page(PAGE, event, 500)
+    assert estimate_tokens(PAGE) > 10 * 500
+    assert "Search now" in _text(pruned)
+    assert 'id="q"' in pruned                       # sibling of the target
+    assert HIDDEN in pruned
+    assert len(pruned) < len(PAGE) / 5
+
+
+def test_prompts_keep_the_whole_page_unless_a_budget_is_set():
+    event = {"type": "click", "eventTarget": {"targetId": "go", "target": "<button id=\"go\">Search now</button>"},
+             "pageHTMLContent": PAGE}
+    assert extract_action_bundle(event)["page_content"] == PAGE
+    pruned = extract_action_bundle(event, token_budget=500)["page_content"]
+    assert "Search now" in _text(pruned) and len(pruned) < len(PAGE) / 5
+
+
+def test_tiny_budgets_never_fall_back_to_the_whole_page(monkeypatch):
+    from utils import action_processing
+
+    # a tokenizer far stricter than the pruning estimate: the next budget rounds down
+    monkeypatch.setattr(action_processing, "count_tokens", lambda text, model=None: len(text))
+    event = {"type": "click", "eventTarget": {"targetId": "go", "target": "<button id=\"go\">Search now</button>"},
+             "pageHTMLContent": PAGE}
+    pruned = extract_action_bundle(event, token_budget=5)["page_content"]
+    assert len(pruned) < len(PAGE) / 5
+
+
+def test_whole_pages_are_not_counted(monkeypatch):
+    from utils import action_processing
+
+    def count_tokens(text, model=None):
+        raise AssertionError("counted a page with pruning off")
+
+    monkeypatch.setattr(action_processing, "count_tokens", count_tokens)
+    assert extract_action_bundle({"type": "click", "pageHTMLContent": PAGE})["page_content"] == PAGE
+
+
+def test_anchors_from_snippet_and_recorded_selectors():
+    root = lxml.html.fragment_fromstring(PAGE, create_parent="div")
+    by_snippet = find_anchors(root, {"eventTarget": {"target": "<button>Search now</button>"}})
+    assert [el.get("id") for el, _ in by_snippet] == ["go"]
+    by_selector = find_anchors(root, {"eventTarget": {}, "allEvents": {
+        "q": {"value": "kb", "selector": "#q"},
+        "x": [{"type": "nodes added", "target": {"selector": "FORM > INPUT"}}]}})
+    assert {el.get("id") for el, _ in by_selector} == {"q"}
+
+
+def test_without_anchors_keeps_landmarks_first():
+    pruned = prune_page(PAGE, {"type": "task-finish", "eventTarget": {}}, 300)
+    assert "Shop" in _text(pruned)
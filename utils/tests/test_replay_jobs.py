@@ -0,0 +1,116 @@
+"""In-process replay job queue.
+
+run with: pytest utils/tests/test_replay_jobs.py
+"""
+import asyncio
+
+import pytest
+
+from utils.replay_jobs import JobQueue, QueueFull
+
+
+class FakeBrowsers:
+    """Numbered stand-in resources, recording which were released."""
+
+    def __init__(self):
+        self.launched = 0
+        self.closed = []
+
+    async def setup(self):
+        self.launched += 1
+        return self.launched
+
+    async def teardown(self, browser):
+        self.closed.append(browser)
+
+
+async def replay(job, browser, progress):
+    for step in range(job.params.get("steps", 2)):
+        await asyncio.sleep(job.params.get("delay", 0))
+        await progress("step", step=step)
+    if job.params.get("fail"):
+        raise RuntimeError("page crashed")
+    return {"browser": browser}
+
+
+def run_queue(body, **kwargs):
+    browsers = FakeBrowsers()
+
+    async def go():
+        jobs = JobQueue(replay, setup=browsers.setup, teardown=browsers.teardown, **kwargs)
+        jobs.start()
+        try:
+            return await body(jobs)
+        finally:
+            await jobs.close()
+
+    return asyncio.run(go()), browsers
+
+
+def test_workers_reuse_their_resources():
+    async def body(jobs):
+        submitted = [await jobs.submit(n=n) for n in range(6)]
+        for job in submitted:
+            await jobs.wait(job, 5)
+        return submitted
+
+    done, browsers = run_queue(body, workers=2)
+    assert [job.status for job in done] == ["succeeded"] * 6
+    assert {job.result["browser"] for job in done} == {1, 2}
+    assert browsers.launched == 2 and sorted(browsers.closed) == [1, 2]    # closed at shutdown
+    assert [e["type"] for e in done[0].events] == ["queued", "running", "step", "step", "succeeded"]
+
+
+def test_failed_job_rebuilds_resources():
+    async def body(jobs):
+        failed = await jobs.submit(fail=True)
+        after = await jobs.submit()
+        await jobs.wait(after, 5)
+        return failed, after
+
+    (failed, after), browsers = run_queue(body, workers=1)
+    assert failed.status == "failed" and failed.error == "RuntimeError: page crashed"
+    assert after.status == "succeeded" and after.result == {"browser": 2}
+    assert browsers.closed == [1, 2]
+
+
+def test_events_stream_until_the_end():
+    async def body(jobs):
+        job = await jobs.submit(steps=3, delay=0.01)
+        live = [event["type"] async for event in jobs.events(job)]
+        resumed = [event["seq"] async for event in jobs.events(job, after=2)]
+        return live, resumed
+
+    (live, resumed), _ = run_queue(body)
+    assert live == ["queued", "running", "step", "step", "step", "succeeded"]
+    assert resumed == [3, 4, 5]
+
+
+def test_cancel_queued_and_running_jobs():
+    async def body(jobs):
+        running = await jobs.submit(steps=100, delay=0.01)
+        queued = await jobs.submit()
+        while running.status != "running":
+            await asyncio.sleep(0.01)
+        await jobs.cancel(queued)
+        await jobs.cancel(running)
+        await jobs.wait(running, 5)
+        return running, queued
+
+    (running, queued), browsers = run_queue(body, workers=1)
+    assert running.status == queued.status == "cancelled"
+    assert running.events[-1]["type"] == "cancelled" and queued.started_at is None
+    assert browsers.closed == [1]
+
+
+def test_full_queue_refuses_jobs():
+    async def body(jobs):
+        await jobs.submit(delay=1)              # taken by the worker
+        await asyncio.sleep(0.01)
+        await jobs.submit()
+        with pytest.raises(QueueFull):
+            await jobs.submit()
+        return jobs.list()
+
+    submitted, _ = run_queue(body, workers=1, max_queued=1)
+    assert [job.status for job in submitted] == ["cancelled", "cancelled"]    # unfinished jobs are cancelled on close
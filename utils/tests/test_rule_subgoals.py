@@ -0,0 +1,49 @@
+"""Rule-based sub-goals.
+
+run with: pytest utils/tests/test_rule_subgoals.py (needs browser_use importable)
+"""
+import json
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("browser_use.wap.exact_replay")
+
+from utils.action_processing import iter_subgoal_prompts  # noqa: E402
+from utils.rule_subgoals import RuleSubgoals, synthesize_subgoal  # noqa: E402
+
+TASK = Path("data_samples/action_set_y757R6w6y17LVHXl")
+
+
+@pytest.mark.parametrize("event, goal, confident", [
+    ({"type": "click", "eventTarget": {"target": '<button class="x">Dinners</button>'}},
+     "Click on the button with text 'Dinners'", True),
+    ({"type": "click", "eventTarget": {"target": '<a href="/cart" aria-label="Cart"><svg></svg></a>'}},
+     "Click on the 'Cart' link", True),
+    ({"type": "input-change", "eventTarget": {"target": '<input type="text" placeholder="Where to?" id="d">',
+                                              "value": "Singapore"}},
+     "Enter 'Singapore' in the 'Where to?' field.", True),
+    ({"type": "go-back-or-forward", "eventTarget": {"target": "https://www.amazon.ca/s?k=keyboard"}},
+     "Navigate to https://www.amazon.ca/s?k=keyboard.", True),
+    ({"type": "click", "eventTarget": {"target": f'<span>{"a long product title " * 4}</span>'}},
+     None, False),
+])
+def test_templates_and_confidence(event, goal, confident):
+    subgoal = synthesize_subgoal(event)
+    assert (subgoal["confidence"] >= 0.8) is confident
+    if goal:
+        assert subgoal["next_goal"] == goal
+
+
+def test_no_rule_for_task_finish_or_field_focus():
+    assert synthesize_subgoal({"type": "task-finish"}) is None
+    assert synthesize_subgoal({"type": "click", "eventTarget": {"target": '<input type="text" id="q">'}}) is None
+
+
+def test_only_unconfident_events_are_rendered():
+    rules = RuleSubgoals(0.8)
+    prompts = dict(iter_subgoal_prompts(TASK, "find a keyboard", skip=rules.skip))
+    answered = {r["file"] for r in rules.records}
+    assert answered and prompts and not answered & set(prompts)
+    assert all(json.loads(r["reply"])["next_goal"] for r in rules.records)
+    assert not RuleSubgoals(1.5).skip("x", {"type": "task-start", "pageURL": "https://amazon.ca"})
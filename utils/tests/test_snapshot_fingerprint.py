@@ -0,0 +1,54 @@
+"""SimHash fingerprints of page snapshots.
+
+run with: pytest utils/tests/test_snapshot_fingerprint.py
+"""
+from pathlib import Path
+
+import numpy as np
+
+from utils.snapshot_fingerprint import (fingerprint_task, group_near_duplicates, hamming_distances,
+                                        load_fingerprints, prompt_groups, save_fingerprints, simhash,
+                                        task_fingerprints)
+
+TASK = Path("data_samples/action_set_y757R6w6y17LVHXl")
+
+PRODUCTS = " ".join(f"<li><a href='/p/{i}'>Mechanical keyboard model {i} with RGB backlight</a>"
+                    f"<span>${40 + i}.99</span></li>" for i in range(60))
+PAGE = f"<html><body><h1>Results for keyboard</h1><ul>{PRODUCTS}</ul></body></html>"
+
+
+def test_near_identical_pages_are_close():
+    edited = PAGE.replace("$45.99", "$44.99")
+    other = "<html><body><h1>Your cart</h1><p>Your shopping cart is empty. Continue shopping.</p></body></html>"
+    fps = simhash([PAGE, edited, other, ""])
+    assert fps.dtype == np.uint64 and fps[3] == 0
+    assert hamming_distances(fps[0], fps[1]) <= 3
+    assert hamming_distances(fps[0], fps[2]) > 10
+    assert (simhash([edited])[0], simhash([PAGE])[0]) == (fps[1], fps[0])    # independent of the batch
+
+
+def test_groups_follow_the_first_of_each_run():
+    fps = np.array([0b0, 0b1, 0b11, 0b1111_0000, 0b1111_0001, 0b0], dtype=np.uint64)
+    assert group_near_duplicates(fps, max_distance=1) == [0, 0, 1, 2, 2, 3]
+    assert group_near_duplicates([], max_distance=1) == []
+
+
+def test_fingerprints_are_reused_by_snapshot(tmp_path, monkeypatch):
+    events = [("a", {"pageHTMLContent": PAGE}), ("b", {"pageHTMLContent": PAGE}), ("c", {"type": "task-finish"})]
+    fingerprints = task_fingerprints(events)
+    assert set(fingerprints) == {"a", "b"} and fingerprints["a"] == fingerprints["b"]
+
+    save_fingerprints(tmp_path / "fingerprints.json", fingerprints)
+    known = load_fingerprints(tmp_path / "fingerprints.json")
+    monkeypatch.setattr("utils.snapshot_fingerprint.run_html_sanitizer", None)    # not sanitized again
+    assert task_fingerprints(events, known) == fingerprints
+    assert load_fingerprints(tmp_path / "missing.json") == {}
+
+
+def test_sample_task_groups():
+    fingerprints = fingerprint_task(TASK)
+    groups = prompt_groups(fingerprints)
+    assert list(groups) == list(fingerprints) and len(groups) == 6
+    assert groups["subgoal_summary_event_20250523_011248_click.md"] == \
+        groups["subgoal_summary_event_20250523_011250_click.md"]
+    assert len(set(groups.values())) == 5
@@ -0,0 +1,82 @@
+"""Content-addressed snapshot blob store.
+
+run with: pytest utils/tests/test_snapshot_store.py
+"""
+import json
+
+import pytest
+
+from utils.snapshot_store import SnapshotStore, apply_snapshot_delta, pack_tree, resolve_event_snapshot, snapshot_hash
+
+ROWS = "".join(f"<tr><td>row {i}</td><td>{i * 7}</td></tr>" for i in range(200))
+
+
+def page(n):
+    return f"<html><body><h1>Results</h1><p>visit {n}</p><table>{ROWS}</table></body></html>"
+
+
+def header(store, ref):
+    with store._path(ref).open("rb") as fh:
+        return json.loads(fh.readline())
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+def test_deltas_round_trip(tmp_path, codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    store = SnapshotStore(tmp_path, codec=codec)
+    refs = [store.put(page(0))]
+    for n in range(1, 4):
+        refs.append(store.put(page(n), base=refs[-1]))
+
+    assert refs[0] == snapshot_hash(page(0))
+    assert header(store, refs[0]) == {"codec": codec, "base": None, "depth": 0}
+    assert header(store, refs[3]) == {"codec": codec, "base": refs[2], "depth": 3}
+    assert store._path(refs[3]).stat().st_size < store._path(refs[0]).stat().st_size / 5
+
+    cold = SnapshotStore(tmp_path, codec=codec)          # nothing cached: walks the chain
+    assert [cold.get(ref) for ref in reversed(refs)] == [page(n) for n in reversed(range(4))]
+
+
+def test_keyframe_interval_bounds_the_chain(tmp_path):
+    store = SnapshotStore(tmp_path, codec="zlib", keyframe_interval=2)
+    ref = store.put(page(0))
+    depths = []
+    for n in range(1, 6):
+        ref = store.put(page(n), base=ref)
+        depths.append(header(store, ref)["depth"])
+    assert depths == [1, 0, 1, 0, 1]
+
+
+def test_same_snapshot_is_stored_once(tmp_path):
+    store = SnapshotStore(tmp_path, codec="zlib")
+    ref = store.put(page(0))
+    written = store.bytes_written
+    assert store.put(page(0), base=ref) == ref and store.bytes_written == written
+    with pytest.raises(FileNotFoundError):
+        store.get("0" * 64)
+
+
+@pytest.mark.parametrize("base, start, end, text, expected", [
+    ("<p>abc</p>", 4, 5, "X", "<p>aXc</p>"),
+    ("<p>café 中</p>", 8, 9, "文", "<p>café 文</p>"),                        # BMP: one unit per char
+    ("<p>\U0001F600 hi</p>", 6, 8, "yo", "<p>\U0001F600 yo</p>"),        # emoji = two units
+    ("<p>\U0001F600</p>", 3, 5, "\U0001F389!", "<p>\U0001F389!</p>"),
+])
+def test_deltas_count_utf16_code_units(base, start, end, text, expected):
+    assert apply_snapshot_delta(base, {"start": start, "end": end, "text": text}) == expected
+
+
+def test_pack_tree_moves_snapshots_into_blobs(tmp_path):
+    task = tmp_path / "20250101" / "T1"
+    task.mkdir(parents=True)
+    for n in range(3):
+        event = {"taskId": "T1", "type": "click", "pageHTMLContent": page(n)}
+        (task / f"summary_event_{n}.json").write_text(json.dumps(event), encoding="utf-8")
+
+    pack_tree(tmp_path)
+    for n in range(3):
+        path = task / f"summary_event_{n}.json"
+        event = json.loads(path.read_text(encoding="utf-8"))
+        assert "pageHTMLContent" not in event and event["pageHTMLRef"] == snapshot_hash(page(n))
+        assert resolve_event_snapshot(event, path)["pageHTMLContent"] == page(n)
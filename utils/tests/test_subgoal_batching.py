@@ -0,0 +1,99 @@
+"""Batched sub-goal requests.
+
+run with: pytest utils/tests/test_subgoal_batching.py (needs langchain importable)
+"""
+import asyncio
+import json
+
+import pytest
+
+from utils.action_processing import render_batch_prompt
+
+pytest.importorskip("utils.llm")
+
+from utils import subgoal_generator as sg  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    """One token per character, so budgets are easy to read."""
+    monkeypatch.setattr(sg, "count_tokens", lambda text, model=None: len(text))
+
+
+def names(batches):
+    return [[name for name, _ in batch] for batch in batches]
+
+
+def test_batches_split_on_tokens_and_event_count():
+    prompts = [(f"p{i}", "x" * 40) for i in range(4)]
+    assert names(sg._batches(prompts, {}, batch_tokens=100)) == [["p0", "p1"], ["p2", "p3"]]
+    assert names(sg._batches(prompts, {}, batch_tokens=0)) == [["p0"], ["p1"], ["p2"], ["p3"]]
+    many = [(f"p{i}", "x") for i in range(sg.MAX_BATCH_EVENTS + 2)]
+    assert [len(b) for b in sg._batches(many, {}, batch_tokens=10_000)] == [sg.MAX_BATCH_EVENTS, 2]
+
+
+def test_answered_prompts_cost_nothing():
+    prompts = [("p0", "x" * 60), ("p1", "y" * 60), ("p2", "z" * 30)]
+    answered = {("p1", sg.prompt_sha256("y" * 60)): {}}
+    assert names(sg._batches(prompts, answered, batch_tokens=100)) == [["p0", "p1", "p2"]]
+
+
+def test_groups_keep_batches_apart():
+    prompts = [("a", "x"), ("b", "x"), ("c", "x"), ("d", "x")]
+    groups = {"a": 0, "b": 0, "c": 1}
+    assert names(sg._batches(prompts, {}, batch_tokens=0, groups=groups)) == [["a", "b"], ["c"], ["d"]]
+
+
+def test_batch_replies_are_reordered_by_index():
+    reply = '```json\n[{"index": 2, "next_goal": "two"}, {"index": 1, "next_goal": "one"}, "three"]\n```'
+    assert sg._parse_batch_reply(reply, 3) == ["one", "two", "three"]
+
+
+@pytest.mark.parametrize("reply", [
+    '[{"index": 1, "next_goal": "one"}]',                                          # too short
+    '[{"index": 1, "next_goal": "one"}, {"index": 1, "next_goal": "again"}]',      # duplicate index
+    '[{"index": 3, "next_goal": "one"}, {"index": 1, "next_goal": "two"}]',        # out of range
+    '[{"index": 1, "next_goal": "one"}, {"index": 2}]',                            # no next_goal
+    '{"next_goal": "one"}',
+    "Sure! Here are the goals",
+])
+def test_malformed_batch_replies_raise(reply):
+    with pytest.raises(ValueError):
+        sg._parse_batch_reply(reply, 2)
+
+
+def run(monkeypatch, tmp_path, batch_reply, prompts, answered=()):
+    asked = []
+
+    async def ask_llm_async(prompt, **options):
+        asked.append(prompt)
+        if prompt.startswith("Below are"):
+            return batch_reply
+        return json.dumps({"next_goal": f"single {prompt}"})
+
+    monkeypatch.setattr(sg, "ask_llm_async", ask_llm_async)
+    monkeypatch.setattr(sg, "cached_reply", lambda *args: None)
+    path = tmp_path / "out.jsonl"
+    path.write_text("".join(json.dumps({"file": n, "prompt": p, "prompt_sha256": sg.prompt_sha256(p),
+                                        "reply": json.dumps({"next_goal": f"old {p}"})}) + "\n"
+                            for n, p in answered), encoding="utf-8")
+    results = asyncio.run(sg.generate_subgoals_async(prompts, save_jsonl=path, resume=True, batch_tokens=1000))
+    return asked, [json.loads(r["reply"])["next_goal"] for r in results]
+
+
+def test_batched_query_sends_only_unanswered_prompts(monkeypatch, tmp_path):
+    prompts = [("a.md", "A"), ("b.md", "B"), ("c.md", "C")]
+    asked, goals = run(monkeypatch, tmp_path, '[{"index": 1, "next_goal": "ga"}, {"index": 2, "next_goal": "gc"}]',
+                       prompts, answered=[("b.md", "B")])
+    assert asked == [render_batch_prompt(["A", "C"])]
+    assert goals == ["ga", "old B", "gc"]
+
+
+@pytest.mark.parametrize("batch_reply", [
+    '[{"index": 1, "next_goal": "ga"}]',
+    '[{"index": 1, "next_goal": "ga"}, {"index": 1, "next_goal": "gb"}]',
+])
+def test_unusable_batch_replies_fall_back_to_single_requests(monkeypatch, tmp_path, batch_reply):
+    asked, goals = run(monkeypatch, tmp_path, batch_reply, [("a.md", "A"), ("b.md", "B")])
+    assert asked[0] == render_batch_prompt(["A", "B"]) and sorted(asked[1:]) == ["A", "B"]
+    assert goals == ["single A", "single B"]
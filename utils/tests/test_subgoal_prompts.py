@@ -0,0 +1,54 @@
+"""In-memory sub-goal prompt rendering.
+
+run with: pytest utils/tests/test_subgoal_prompts.py (from the repository root)
+"""
+from pathlib import Path
+
+from jinja2 import Template
+
+from utils.action_processing import (
+    choose_template,
+    extract_action_bundle,
+    generate_subgoal_speculate_prompt,
+    iter_subgoal_prompts,
+    load_template,
+    render_batch_prompt,
+)
+from utils.event_log import iter_task_events
+
+TASK = Path("data_samples/action_set_y757R6w6y17LVHXl")
+GOAL = "find a keyboard"
+
+
+def test_templates_are_compiled_once():
+    assert load_template("click") is load_template("scroll")        # both use common.md
+    assert load_template("task-finish") is load_template("task-finish")
+
+
+def test_streamed_prompts_match_file_rendering(tmp_path):
+    expected = {}
+    for name, event in iter_task_events(TASK):
+        bundle = extract_action_bundle(event, True)
+        text = choose_template(bundle["action_type"]).read_text(encoding="utf-8")
+        prompt = Template(text).render(ultimate_goal=GOAL, action=bundle["action"],
+                                       change_events=bundle["change_events"],
+                                       page_content=bundle["page_content"])
+        expected[f"subgoal_{name}_{bundle['action_type']}.md"] = prompt
+
+    streamed = dict(iter_subgoal_prompts(TASK, GOAL))
+    assert streamed == expected
+    assert not list(tmp_path.iterdir())
+
+    dumped = dict(iter_subgoal_prompts(TASK, GOAL, dump_dir=tmp_path))
+    assert {p.name: p.read_text(encoding="utf-8") for p in tmp_path.iterdir()} == dumped == expected
+
+    name, event = next(iter(iter_task_events(TASK)))
+    path = generate_subgoal_speculate_prompt(event, GOAL, name, tmp_path / "single")
+    assert path.read_text(encoding="utf-8") == expected[path.name]
+
+
+def test_batch_prompt_numbers_each_action():
+    text = render_batch_prompt(["first prompt", "second prompt"])
+    assert text.index("=== ACTION 1 ===\nfirst prompt") < text.index("=== ACTION 2 ===\nsecond prompt")
+    assert text.count("\n=== ACTION ") == 2 and "=== END OF ACTIONS ===" in text
+    assert "exactly 2 objects" in text
@@ -0,0 +1,98 @@
+"""Resuming sub-goal generation from its JSONL checkpoint.
+
+run with: pytest utils/tests/test_subgoal_resume.py (needs langchain importable)
+"""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("utils.llm")
+
+from utils import subgoal_generator as sg  # noqa: E402
+
+
+@pytest.fixture
+def asked(monkeypatch):
+    """Stub the LLM: every reply is a next_goal naming the prompt; record the prompts asked."""
+    prompts = []
+
+    def reply(prompt):
+        prompts.append(prompt)
+        return json.dumps({"next_goal": f"goal for {prompt}"})
+
+    async def reply_async(prompt, **options):
+        return reply(prompt)
+
+    monkeypatch.setattr(sg, "ask_llm", lambda prompt, **options: reply(prompt))
+    monkeypatch.setattr(sg, "ask_llm_async", reply_async)
+    monkeypatch.setattr(sg, "cached_reply", lambda *args: None)
+    return prompts
+
+
+def record(name, prompt, goal=None):
+    return {"file": name, "prompt": prompt, "prompt_sha256": sg.prompt_sha256(prompt),
+            "reply": json.dumps({"next_goal": goal or f"goal for {prompt}"})}
+
+
+def lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def generate(mode, prompts, path):
+    if mode == "serial":
+        return sg.generate_subgoals(prompts, save_jsonl=path, resume=True)
+    return asyncio.run(sg.generate_subgoals_async(prompts, save_jsonl=path, resume=True, concurrency=2))
+
+
+@pytest.mark.parametrize("mode", ["serial", "async"])
+def test_resume_skips_answered_prompts_and_a_torn_last_line(tmp_path, asked, mode):
+    path = tmp_path / "subgoals_output.jsonl"
+    path.write_text(json.dumps(record("a.md", "A")) + "\n" + json.dumps(record("b.md", "B"))[:25],
+                    encoding="utf-8")                            # b.md was cut short by a crash
+
+    results = generate(mode, [("a.md", "A"), ("b.md", "B"), ("c.md", "C")], path)
+    assert asked == ["B", "C"]
+    assert [r["file"] for r in results] == ["a.md", "b.md", "c.md"]
+    assert [r["file"] for r in lines(path)] == ["a.md", "b.md", "c.md"]
+
+
+@pytest.mark.parametrize("mode", ["serial", "async"])
+def test_answers_match_on_file_and_prompt_hash(tmp_path, asked, mode):
+    path = tmp_path / "subgoals_output.jsonl"
+    path.write_text("".join(json.dumps(r) + "\n" for r in [
+        record("a.md", "A"),
+        record("b.md", "old B"),                                 # prompt changed since
+        record("gone.md", "G"),                                  # event removed since
+        {"file": "c.md", "prompt": "C", "reply": json.dumps({"next_goal": "kept"})},   # no hash yet
+    ]), encoding="utf-8")
+
+    generate(mode, [("a.md", "A"), ("b.md", "B"), ("c.md", "C"), ("d.md", "A")], path)
+    assert sorted(asked) == ["A", "B"]                           # same text under another name is asked
+    compacted = lines(path)
+    assert [r["file"] for r in compacted] == ["a.md", "b.md", "c.md", "d.md"]
+    assert [json.loads(r["reply"])["next_goal"] for r in compacted] == \
+        ["goal for A", "goal for B", "kept", "goal for A"]
+
+
+def test_without_resume_the_checkpoint_starts_afresh(tmp_path, asked):
+    path = tmp_path / "subgoals_output.jsonl"
+    path.write_text(json.dumps(record("a.md", "A")) + "\n", encoding="utf-8")
+    sg.generate_subgoals([("b.md", "B")], save_jsonl=path)
+    assert asked == ["B"] and [r["file"] for r in lines(path)] == ["b.md"]
+
+
+def test_last_record_wins_in_event_order(tmp_path):
+    path = tmp_path / "subgoals_output.jsonl"
+    path.write_text("".join(json.dumps(r) + "\n" for r in [
+        record("subgoal_event_000002_click.md", "2", "second, first try"),
+        record("subgoal_event_000001_click.md", "1", "first"),
+        record("subgoal_event_000002_click.md", "2", "second"),
+        {"file": "subgoal_event_000003_click.md", "reply": "not json"},
+    ]) + '{"file": "subgoal_event_000004', encoding="utf-8")
+
+    goals = sg.wap_subgoal_list_generation("goal", "T1", path, tmp_path / "list.json")
+    assert [g["subgoal"] for g in goals] == \
+        ["task starts, go for the next sub-goal", "first", "second", "task done"]
+    assert [g["index"] for g in goals] == [0, 1, 2, 3]
+    assert json.loads((tmp_path / "list.json").read_text(encoding="utf-8"))["subgoal_list"] == goals
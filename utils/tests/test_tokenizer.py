@@ -0,0 +1,80 @@
+"""Pluggable token counting.
+
+run with: pytest utils/tests/test_tokenizer.py
+"""
+import pytest
+
+from utils import tokenizer
+from utils.tokenizer import EstimateTokenizer, count_tokens, get_tokenizer, register_tokenizer, truncate_to_tokens
+
+
+class WordTokenizer:
+    name = "words"
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode_len(self, text):
+        self.calls += 1
+        return len(text.split())
+
+
+@pytest.fixture
+def words(monkeypatch):
+    plugged = WordTokenizer()
+    register_tokenizer("words", lambda model: plugged)
+    monkeypatch.setenv("OTA_TOKENIZER", "words")
+    get_tokenizer.cache_clear()
+    yield plugged
+    get_tokenizer.cache_clear()
+
+
+def test_plugged_tokenizer_and_cache(words):
+    text = "click on the search button " * 50
+    assert count_tokens(text) == 250 and count_tokens(text, "gpt-4o-mini") == 250
+    assert words.calls == 1                                 # same tokenizer, same content: counted once
+    assert count_tokens("") == 0
+    assert count_tokens(text, chars_per_token=3) == 250     # the estimate setting only applies to the fallback
+
+
+def test_estimate_fallback(monkeypatch):
+    monkeypatch.setenv("OTA_TOKENIZER", "estimate")
+    get_tokenizer.cache_clear()
+    try:
+        assert isinstance(get_tokenizer("gpt-4o"), EstimateTokenizer)
+        assert count_tokens("x" * 10) == 3
+        assert count_tokens("x" * 10, chars_per_token=3) == 4
+    finally:
+        get_tokenizer.cache_clear()
+
+
+def test_unknown_tokenizer(monkeypatch):
+    get_tokenizer.cache_clear()
+    with pytest.raises(ValueError):
+        get_tokenizer(None, "nope")
+
+
+def test_truncate_to_tokens(words):
+    text = " ".join(f"w{i}" for i in range(1000))
+    cut = truncate_to_tokens(text, 100)
+    assert text.startswith(cut) and count_tokens(cut) <= 100
+    assert truncate_to_tokens(text, 2000) == text
+
+
+def test_lru_is_bounded():
+    cache = tokenizer._CountCache(2)
+    plugged = WordTokenizer()
+    for text in ("a", "b", "c", "a"):
+        cache.count(plugged, text)
+    assert plugged.calls == 4 and len(cache._counts) == 2
+
+
+def test_auto_falls_back_when_tiktoken_fails(monkeypatch, capsys):
+    def offline(model):
+        raise ConnectionError("cannot download o200k_base.tiktoken")
+
+    monkeypatch.setattr(tokenizer, "TiktokenTokenizer", offline)
+    monkeypatch.setattr(tokenizer, "_warned_fallback", False)
+    assert isinstance(tokenizer._auto("gpt-4o"), EstimateTokenizer)
+    assert isinstance(tokenizer._auto("gpt-4"), EstimateTokenizer)
+    assert capsys.readouterr().out.count("[OTA warning]") == 1
@@ -0,0 +1,163 @@
+"""Token counting for prompt budgets and cost accounting.
+
+`count_tokens(text, model)` counts with the model's tiktoken encoding when
+tiktoken is installed and can load it, and falls back to a characters-per-token
+estimate otherwise.  Counts are kept in an LRU keyed by (tokenizer, content hash), so
+the pages, prompts and chat messages that are counted again and again (every
+agent step re-counts its history) are encoded once.
+
+Other tokenizers plug in by name:
+
+    register_tokenizer("hf-llama", lambda model: MyTokenizer(model))
+    OTA_TOKENIZER=hf-llama
+
+A tokenizer is any object with a ``name`` and an ``encode_len(text)``.
+
+Configuration (environment):
+
+    OTA_TOKENIZER              auto (default: tiktoken if installed), tiktoken, estimate, or a registered name
+    OTA_TOKENIZER_MODEL        model counted for when none is given (default gpt-4o)
+    OTA_TOKEN_CACHE_SIZE       counts kept in the LRU (default 4096)
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+__all__ = ["DEFAULT_MODEL", "EstimateTokenizer", "TiktokenTokenizer", "count_tokens", "get_tokenizer",
+           "register_tokenizer", "truncate_to_tokens"]
+
+DEFAULT_MODEL = os.getenv("OTA_TOKENIZER_MODEL", "gpt-4o")
+CACHE_SIZE = int(os.getenv("OTA_TOKEN_CACHE_SIZE", "4096"))
+CHARS_PER_TOKEN = 4
+# encodings of model families tiktoken does not know by name
+_FALLBACK_ENCODINGS = (("gpt-4o", "o200k_base"), ("gpt-4.1", "o200k_base"), ("o1", "o200k_base"),
+                       ("o3", "o200k_base"), ("o4", "o200k_base"), ("gpt-4", "cl100k_base"),
+                       ("gpt-3.5", "cl100k_base"))
+
+
+class EstimateTokenizer:
+    """About *chars_per_token* characters per token; no dependency."""
+
+    def __init__(self, chars_per_token: float = CHARS_PER_TOKEN) -> None:
+        self.chars_per_token = chars_per_token
+        self.name = f"estimate/{chars_per_token}"
+
+    def encode_len(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+class TiktokenTokenizer:
+    """Exact counts with the tiktoken encoding of *model*."""
+
+    def __init__(self, model: str) -> None:
+        import tiktoken
+
+        try:
+            self._encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            name = next((enc for prefix, enc in _FALLBACK_ENCODINGS if model.startswith(prefix)), "o200k_base")
+            self._encoding = tiktoken.get_encoding(name)
+        self.name = f"tiktoken/{self._encoding.name}"
+
+    def encode_len(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+_warned_fallback = False
+
+
+def _auto(model: str):
+    """tiktoken when it works, else the estimate (tiktoken missing, or its BPE
+    file not downloadable, e.g. offline)."""
+    global _warned_fallback
+    try:
+        return TiktokenTokenizer(model)
+    except ImportError:
+        return EstimateTokenizer()
+    except Exception as exc:
+        if not _warned_fallback:
+            _warned_fallback = True
+            print(f"[OTA warning] tiktoken unavailable ({exc!r}), estimating token counts instead")
+        return EstimateTokenizer()
+
+
+_FACTORIES: Dict[str, Callable[[str], object]] = {
+    "auto": _auto,
+    "tiktoken": TiktokenTokenizer,
+    "estimate": lambda model: EstimateTokenizer(),
+}
+
+
+def register_tokenizer(name: str, factory: Callable[[str], object]) -> None:
+    """Make ``OTA_TOKENIZER=<name>`` build tokenizers with ``factory(model)``."""
+    _FACTORIES[name] = factory
+    get_tokenizer.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model: Optional[str] = None, kind: Optional[str] = None):
+    """The shared tokenizer of *model* (default OTA_TOKENIZER_MODEL)."""
+    kind = kind or os.getenv("OTA_TOKENIZER", "auto")
+    factory = _FACTORIES.get(kind)
+    if factory is None:
+        raise ValueError(f"unknown tokenizer {kind!r}, expected one of {sorted(_FACTORIES)}")
+    return factory(model or DEFAULT_MODEL)
+
+
+class _CountCache:
+    """LRU of token counts keyed by (tokenizer name, BLAKE2 digest of the text)."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, tokenizer, text: str) -> int:
+        if self.size <= 0:
+            return tokenizer.encode_len(text)
+        key = (tokenizer.name, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                return tokens
+        tokens = tokenizer.encode_len(text)
+        with self._lock:
+            self._counts[key] = tokens
+            if len(self._counts) > self.size:
+                self._counts.popitem(last=False)
+        return tokens
+
+
+_CACHE = _CountCache(CACHE_SIZE)
+
+
+def count_tokens(text: str, model: Optional[str] = None, chars_per_token: Optional[float] = None) -> int:
+    """Tokens of *text* for *model*.
+
+    *chars_per_token* is the estimate used when no real tokenizer is
+    available (the message manager's setting); it is ignored otherwise.
+    """
+    if not text:
+        return 0
+    tokenizer = get_tokenizer(model)
+    if chars_per_token is not None and isinstance(tokenizer, EstimateTokenizer):
+        tokenizer = EstimateTokenizer(chars_per_token)
+    return _CACHE.count(tokenizer, text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """*text* cut to at most *max_tokens* tokens (at a character boundary)."""
+    tokens = count_tokens(text, model)
+    if max_tokens <= 0 or tokens <= max_tokens:
+        return text
+    keep = int(len(text) * max_tokens / tokens)
+    while keep > 0 and count_tokens(text[:keep], model) > max_tokens:
+        keep = int(keep * 0.95)
+    return text[:keep]
@@ -0,0 +1,465 @@
+"""
+Incrementally build exact- and smart-replay lists for a whole data tree.
+
+`generate_exact_replay_list.py` and `generate_smart_replay_list.py` handle one
+task folder and redo everything on every run.  This command discovers every
+task folder under the data root and keeps a manifest with the content hash
+of each recorded event, so a rebuild only touches what changed:
+
+    exact    exact-replay list of every task with new or changed events
+    prompts  sanitized sub-goal prompts, re-rendered per changed event only,
+             and a SimHash fingerprint per page snapshot (kept in the manifest);
+             events the sub-goal rules answer get no prompt, their sub-goal
+             is kept in subgoals_<task_id>/rule_subgoals.json instead
+    smart    LLM sub-goals + smart-replay list of tasks whose prompts changed
+
+Stages run on a process pool; the manifest is only consulted through file
+stats (events.idx of logged tasks, the *.json files of older recordings), so
+unchanged tasks are not read at all.  Per-stage timings are printed at the end.
+With --group_near_duplicates the smart stage sends the events of each run of
+near-identical snapshots as one batched request, grouped by the stored
+fingerprints (see utils/snapshot_fingerprint.py).
+
+Usage
+-----
+python wap_replay/build_replay_corpus.py build --data_root_path <data_root> \
+                             [--output_dir_path data_processed] [--stages exact,prompts,smart] \
+                             [--workers N] [--force] [--group_near_duplicates]
+                             [--rule_min_confidence 0.8]
+
+Example
+-----
+python wap_replay/build_replay_corpus.py build --data_root_path data --stages exact,prompts
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from utils.event_log import INDEX_NAME, LEGACY_PATTERN, TaskEventLog, event_name, has_event_log
+from utils.rule_subgoals import DEFAULT_MIN_CONFIDENCE
+from utils.snapshot_store import BLOB_DIR_NAME
+
+load_dotenv()
+
+MANIFEST_NAME = "build_manifest.json"
+RULES_NAME = "rule_subgoals.json"           # {event name: JSONL record} of rule-answered events
+MANIFEST_VERSION = 1
+STAGES = ("exact", "prompts", "smart")
+
+# ---------------------------------------------------------------------------#
+# discovery and change detection (main process)                              #
+# ---------------------------------------------------------------------------#
+def discover_task_folders(data_root: Path) -> List[Path]:
+    """Every folder holding an event log or ``summary_event_*.json`` recordings."""
+    folders: List[Path] = []
+    for dirpath, dirnames, filenames in os.walk(data_root):
+        if INDEX_NAME in filenames:
+            folders.append(Path(dirpath))
+            dirnames[:] = []                    # a task folder has no nested tasks
+            continue
+        dirnames[:] = [d for d in dirnames if d != BLOB_DIR_NAME]
+        if any(f.startswith("summary_event_") and f.endswith(".json") for f in filenames):
+            folders.append(Path(dirpath))
+            dirnames[:] = []
+    return sorted(folders)
+
+
+def input_signature(folder: Path) -> Any:
+    """Cheap stat fingerprint of a task's inputs; equal signatures mean equal events."""
+    if has_event_log(folder):
+        st = (folder / INDEX_NAME).stat()       # the log is append-only and indexed last
+        return [st.st_size, st.st_mtime_ns]
+    return {p.stem: [st.st_size, st.st_mtime_ns]
+            for p in sorted(folder.rglob(LEGACY_PATTERN)) for st in (p.stat(),)}
+
+
+def events_digest(events: Dict[str, Dict[str, Any]]) -> str:
+    h = hashlib.sha256()
+    for name in sorted(events):
+        h.update(f"{name}\0{events[name]['sha256']}\n".encode())
+    return h.hexdigest()
+
+
+# ---------------------------------------------------------------------------#
+# pool workers — each returns (result, seconds spent)                        #
+# ---------------------------------------------------------------------------#
+def hash_task(folder: str, previous: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], float]:
+    """Content hash of every event of *folder*, reusing *previous* where the
+    event provably did not change (same log location / same file stat)."""
+    start = time.perf_counter()
+    folder_path = Path(folder)
+    events: Dict[str, Dict[str, Any]] = {}
+    if has_event_log(folder_path):
+        log = TaskEventLog(folder_path)
+        handles: Dict[int, Any] = {}
+        try:
+            for entry in log.entries():
+                name = event_name(entry)
+                at = [entry["segment"], entry["offset"], entry["length"]]
+                old = previous.get(name)
+                if old is not None and old.get("at") == at:
+                    events[name] = old
+                    continue
+                fh = handles.get(entry["segment"])
+                if fh is None:
+                    fh = handles[entry["segment"]] = log.segment_path(entry["segment"]).open("rb")
+                fh.seek(entry["offset"])
+                events[name] = {"sha256": hashlib.sha256(fh.read(entry["length"])).hexdigest(), "at": at}
+        finally:
+            for fh in handles.values():
+                fh.close()
+    else:
+        for path in sorted(folder_path.rglob(LEGACY_PATTERN)):
+            st = path.stat()
+            stat = [st.st_size, st.st_mtime_ns]
+            old = previous.get(path.stem)
+            if old is not None and old.get("stat") == stat:
+                events[path.stem] = old
+                continue
+            events[path.stem] = {"sha256": hashlib.sha256(path.read_bytes()).hexdigest(), "stat": stat}
+    return events, time.perf_counter() - start
+
+
+def _task_prompt(folder: Path) -> Tuple[str, str]:
+    from utils.action_processing import find_task_prompt
+
+    try:
+        return find_task_prompt(folder)
+    except SystemExit as exc:                   # the CLI helper exits on malformed tasks
+        raise RuntimeError(str(exc)) from None
+
+
+def build_exact(folder: str, output_dir: str) -> Tuple[Dict[str, Any], float]:
+    """Compile and write ``wap_exact_replay_list_<task_id>.json``."""
+    from utils.event_log import iter_task_events
+    from utils.live_compile import compile_event, compiled_actions, write_plan
+
+    start = time.perf_counter()
+    folder_path = Path(folder)
+    task_prompt, task_id = _task_prompt(folder_path)
+    actions = compiled_actions(folder_path)
+    if actions is None:                         # recording without an event log
+        actions = [action for _, event in iter_task_events(folder_path, resolve_snapshot=False)
+                   for action in compile_event(event)]
+    out_path = Path(output_dir) / "exact_replay" / f"wap_exact_replay_list_{task_id}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    write_plan(out_path, ultimate_goal=task_prompt, task_id=task_id, actions=actions)
+    return {"task_id": task_id, "path": str(out_path), "actions": len(actions)}, time.perf_counter() - start
+
+
+def _read_rules(path: Path) -> Dict[str, Dict[str, Any]]:
+    if not path.is_file():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _write_rules(path: Path, records: Dict[str, Dict[str, Any]]) -> None:
+    if not records:
+        path.unlink(missing_ok=True)
+        return
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(records, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def render_prompts(folder: str, output_dir: str, changed: List[str], stale: List[str],
+                   previous_goal: Optional[str],
+                   fingerprints: Optional[Dict[str, Dict[str, str]]] = None,
+                   rule_min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> Tuple[Dict[str, Any], float]:
+    """Sanitize and render the sub-goal prompt of each *changed* event.
+
+    Every event is re-rendered when the task goal changed, since it is part
+    of each prompt.  Prompt files of *stale* (removed) events are deleted.
+    Events the sub-goal rules answer with at least *rule_min_confidence*
+    get no prompt file; their record goes to ``rule_subgoals.json``.
+    The snapshot fingerprints of the task are refreshed, reusing the stored
+    *fingerprints* of unchanged snapshots.
+    """
+    from utils.action_processing import generate_subgoal_speculate_prompt, prompt_file_name
+    from utils.event_log import iter_task_headers, read_task_event
+    from utils.rule_subgoals import RuleSubgoals
+    from utils.snapshot_fingerprint import fingerprint_task
+
+    start = time.perf_counter()
+    folder_path = Path(folder)
+    task_prompt, task_id = _task_prompt(folder_path)
+    subgoals_dir = Path(output_dir) / "smart_replay" / f"subgoals_{task_id}"
+    subgoals_dir.mkdir(parents=True, exist_ok=True)
+
+    render_all = task_prompt != previous_goal
+    wanted = set(changed)
+    rules_path = subgoals_dir / RULES_NAME
+    rule_records = {} if render_all else _read_rules(rules_path)
+    for name in set(stale) | wanted:
+        for old in subgoals_dir.glob(f"subgoal_{name}_*.md"):   # the type may have changed
+            old.unlink()
+        rule_records.pop(name, None)
+
+    rules = RuleSubgoals(rule_min_confidence)
+    rendered: List[str] = []
+    for header in iter_task_headers(folder_path):
+        name = header["name"]
+        if not render_all and name not in wanted:
+            continue
+        if render_all:
+            for old in subgoals_dir.glob(f"subgoal_{name}_*.md"):
+                old.unlink()
+        event = read_task_event(folder_path, header)
+        if rules.skip(prompt_file_name(name, event.get("type")), event):
+            rule_records[name] = rules.records[-1]
+        else:
+            generate_subgoal_speculate_prompt(event, task_prompt, name, subgoals_dir)
+        rendered.append(name)
+    _write_rules(rules_path, rule_records)
+    fingerprints = fingerprint_task(folder_path, _known_snapshots(fingerprints))
+    return ({"task_id": task_id, "goal": task_prompt, "rendered": rendered, "render_all": render_all,
+             "rules": len(rules.records), "fingerprints": fingerprints}, time.perf_counter() - start)
+
+
+def _known_snapshots(fingerprints: Optional[Dict[str, Dict[str, str]]]) -> Dict[str, str]:
+    return {fp["snapshot"]: fp["simhash"] for fp in (fingerprints or {}).values()}
+
+
+def build_smart(folder: str, output_dir: str,
+                fingerprints: Optional[Dict[str, Dict[str, str]]] = None) -> Tuple[Dict[str, Any], float]:
+    """Query the LLM for the task's prompts and write ``wap_smart_replay_list_<task_id>.json``.
+
+    Given the stored *fingerprints* (None leaves grouping off), the events of
+    each run of near-identical snapshots share one batched request.  The
+    records of rule-answered events (``rule_subgoals.json``) are appended to
+    the JSONL after the LLM replies, since resuming keeps only the records
+    of the prompt files.
+    """
+    from utils.snapshot_fingerprint import fingerprint_task, prompt_groups
+    from utils.subgoal_generator import append_results, generate_subgoals_from_dir, wap_subgoal_list_generation
+
+    start = time.perf_counter()
+    task_prompt, task_id = _task_prompt(Path(folder))
+    smart_dir = Path(output_dir) / "smart_replay"
+    subgoals_dir = smart_dir / f"subgoals_{task_id}"
+    subgoals_jsonl = subgoals_dir / "subgoals_output.jsonl"
+    out_path = smart_dir / f"wap_smart_replay_list_{task_id}.json"
+    groups = None
+    if fingerprints is not None:
+        fingerprints = fingerprint_task(folder, _known_snapshots(fingerprints))
+        groups = prompt_groups(fingerprints)
+    if any(subgoals_dir.glob("*.md")):
+        generate_subgoals_from_dir(
+            subgoals_dir,
+            system_prompt="You are a concise sub-goal assistant fot analysis of actions in browser.",
+            model="gpt-4o",
+            temperature=0,
+            save_jsonl=subgoals_jsonl,
+            resume=True,                        # re-query only prompts that changed or failed
+            groups=groups,
+        )
+    else:                                       # every event is answered by the rules
+        subgoals_jsonl.unlink(missing_ok=True)
+    append_results(subgoals_jsonl, _read_rules(subgoals_dir / RULES_NAME).values())
+    wap_subgoal_list_generation(task_prompt, task_id, subgoals_jsonl, out_path)
+    return ({"task_id": task_id, "path": str(out_path), "fingerprints": fingerprints},
+            time.perf_counter() - start)
+
+
+# ---------------------------------------------------------------------------#
+# build driver                                                               #
+# ---------------------------------------------------------------------------#
+class StageTimings:
+    """Wall time per stage plus the time its jobs spent in the workers."""
+
+    def __init__(self) -> None:
+        self.wall: Dict[str, float] = defaultdict(float)
+        self.work: Dict[str, float] = defaultdict(float)
+        self.slowest: Dict[str, float] = defaultdict(float)
+        self.jobs: Dict[str, int] = defaultdict(int)
+        self.failed: Dict[str, int] = defaultdict(int)
+
+    def job(self, stage: str, seconds: float) -> None:
+        self.jobs[stage] += 1
+        self.work[stage] += seconds
+        self.slowest[stage] = max(self.slowest[stage], seconds)
+
+    def report(self) -> str:
+        lines = [f"{'stage':<10}{'jobs':>7}{'failed':>8}{'wall s':>10}{'worker s':>10}{'max s':>9}"]
+        for stage, wall in self.wall.items():
+            lines.append(f"{stage:<10}{self.jobs[stage]:>7}{self.failed[stage]:>8}{wall:>10.2f}"
+                         f"{self.work[stage]:>10.2f}{self.slowest[stage]:>9.2f}")
+        return "\n".join(lines)
+
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    if path.is_file():
+        try:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+            print(f"[OTA Info] manifest {path} is from another build version; rebuilding everything")
+        except json.JSONDecodeError:
+            print(f"[OTA warning] unreadable manifest {path}; rebuilding everything")
+    return {"version": MANIFEST_VERSION, "tasks": {}}
+
+
+def save_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _run(pool: ProcessPoolExecutor, timings: StageTimings, stage: str,
+         jobs: Dict[str, Tuple[Any, ...]], fn) -> Dict[str, Any]:
+    """Run *fn* for every {rel_folder: args} job; return the successful results."""
+    start = time.perf_counter()
+    results: Dict[str, Any] = {}
+    futures = {pool.submit(fn, *args): rel for rel, args in jobs.items()}
+    for future in as_completed(futures):
+        rel = futures[future]
+        try:
+            result, seconds = future.result()
+        except Exception as exc:
+            timings.failed[stage] += 1
+            print(f"[OTA warning] {stage} failed for {rel}: {exc}")
+            continue
+        timings.job(stage, seconds)
+        results[rel] = result
+    timings.wall[stage] += time.perf_counter() - start
+    return results
+
+
+def _output_missing(record: Dict[str, Any], stage: str) -> bool:
+    path = record.get("outputs", {}).get(stage)
+    return path is None or not Path(path).is_file()
+
+
+def build(data_root: Path, output_dir: Path, *, stages=STAGES, workers: Optional[int] = None,
+          force: bool = False, group_near_duplicates: bool = False,
+          rule_min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> int:
+    """Bring every replay list under *output_dir* up to date; return the number of failed jobs."""
+    timings = StageTimings()
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest = {"version": MANIFEST_VERSION, "tasks": {}} if force else load_manifest(manifest_path)
+    tasks: Dict[str, Dict[str, Any]] = manifest["tasks"]
+
+    start = time.perf_counter()
+    folders = {folder.relative_to(data_root).as_posix(): folder for folder in discover_task_folders(data_root)}
+    removed = [rel for rel in tasks if rel not in folders]
+    for rel in removed:
+        del tasks[rel]
+    to_hash: Dict[str, Tuple[Any, ...]] = {}
+    signatures: Dict[str, Any] = {}
+    for rel, folder in folders.items():
+        signatures[rel] = input_signature(folder)
+        record = tasks.setdefault(rel, {"events": {}, "built": {}, "prompts": {}, "outputs": {}})
+        if record.get("signature") != signatures[rel]:
+            to_hash[rel] = (str(folder), record["events"])
+    timings.wall["discover"] = time.perf_counter() - start
+    print(f"[OTA Info] {len(folders)} task folders, {len(to_hash)} with changed inputs, "
+          f"{len(removed)} removed since the last build")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rel, events in _run(pool, timings, "hash", to_hash, hash_task).items():
+                tasks[rel]["events"] = events
+                tasks[rel]["signature"] = signatures[rel]
+
+            # tasks whose hashing failed keep a stale signature and wait for the next build
+            digests = {rel: events_digest(tasks[rel]["events"]) for rel in folders
+                       if tasks[rel].get("signature") == signatures[rel]}
+
+            exact_jobs, prompt_jobs = {}, {}
+            for rel, digest in digests.items():
+                record = tasks[rel]
+                if "exact" in stages and (record["built"].get("exact") != digest or _output_missing(record, "exact")):
+                    exact_jobs[rel] = (str(folders[rel]), str(output_dir))
+                if "prompts" in stages:
+                    current = {name: ev["sha256"] for name, ev in record["events"].items()}
+                    changed = [name for name, sha in current.items() if record["prompts"].get(name) != sha]
+                    stale = [name for name in record["prompts"] if name not in current]
+                    if changed or stale:
+                        prompt_jobs[rel] = (str(folders[rel]), str(output_dir), changed, stale, record.get("goal"),
+                                            record.get("fingerprints"), rule_min_confidence)
+
+            for rel, result in _run(pool, timings, "exact", exact_jobs, build_exact).items():
+                record = tasks[rel]
+                record["task_id"] = result["task_id"]
+                record["built"]["exact"] = digests[rel]
+                record["outputs"]["exact"] = result["path"]
+            for rel, result in _run(pool, timings, "prompts", prompt_jobs, render_prompts).items():
+                record = tasks[rel]
+                record["task_id"] = result["task_id"]
+                record["goal"] = result["goal"]
+                current = {name: ev["sha256"] for name, ev in record["events"].items()}
+                rendered = current if result["render_all"] else {n: current[n] for n in result["rendered"]}
+                record["prompts"] = {n: s for n, s in {**record["prompts"], **rendered}.items() if n in current}
+                record["fingerprints"] = result["fingerprints"]
+
+            smart_jobs = {}
+            if "smart" in stages:
+                for rel, digest in digests.items():
+                    record = tasks[rel]
+                    prompts_current = record["prompts"] == {n: ev["sha256"] for n, ev in record["events"].items()}
+                    if prompts_current and (record["built"].get("smart") != digest or _output_missing(record, "smart")):
+                        smart_jobs[rel] = (str(folders[rel]), str(output_dir),
+                                           record.get("fingerprints", {}) if group_near_duplicates else None)
+            for rel, result in _run(pool, timings, "smart", smart_jobs, build_smart).items():
+                tasks[rel]["built"]["smart"] = digests[rel]
+                tasks[rel]["outputs"]["smart"] = result["path"]
+                if result["fingerprints"] is not None:
+                    tasks[rel]["fingerprints"] = result["fingerprints"]
+    finally:
+        start = time.perf_counter()
+        save_manifest(manifest_path, manifest)
+        timings.wall["manifest"] = time.perf_counter() - start
+
+    print("[OTA Info] build timings\n" + timings.report())
+    return sum(timings.failed.values())
+
+
+# ---------------------------------------------------------------------------#
+# command-line interface                                                     #
+# ---------------------------------------------------------------------------#
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Incrementally build replay lists for every recorded task.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="rebuild the replay lists whose recorded events changed")
+    p_build.add_argument("--data_root_path", default="data")
+    p_build.add_argument("--output_dir_path", default="data_processed",
+                         help="root of exact_replay/ and smart_replay/ (default: data_processed)")
+    p_build.add_argument("--stages", default=",".join(STAGES),
+                         help="comma-separated subset of exact,prompts,smart (smart queries the LLM)")
+    p_build.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    p_build.add_argument("--force", action="store_true", help="ignore the manifest and rebuild everything")
+    p_build.add_argument("--group_near_duplicates", action="store_true",
+                         help="batch the LLM queries of events with near-identical page snapshots")
+    p_build.add_argument("--rule_min_confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                         help="answer events scored at least this by the sub-goal rules without the LLM "
+                              "(above 1 disables the rules; rebuild with --force after changing it)")
+    args = parser.parse_args()
+
+    stages = tuple(s.strip() for s in args.stages.split(",") if s.strip())
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    data_root = Path(args.data_root_path)
+    if not data_root.is_dir():
+        sys.exit(f"[OTA error] path is not a directory: {data_root}")
+
+    failed = build(data_root, Path(args.output_dir_path), stages=stages, workers=args.workers, force=args.force,
+                   group_near_duplicates=args.group_near_duplicates,
+                   rule_min_confidence=args.rule_min_confidence)
+    if failed:
+        sys.exit(f"[OTA error] {failed} job(s) failed; they are retried on the next build")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 """
-Batch-convert recorded event-JSON files into the canonical “exact-replay”
+Batch-convert recorded events into the canonical “exact-replay”
 action list by calling `record_metadata_to_actions` from browser-use.
 
+Tasks recorded with ``action_collect_server.py --live_compile`` are already
+compiled: their plan is exported from the task folder and only events
+missing from it are compiled here.
+
 Usage
 -----
 python wap_replay/generate_exact_replay_list.py --data_dir_path <folder_with_json_files> \
@@ -15,44 +19,48 @@ python wap_replay/generate_exact_replay_list.py --data_dir_path data/20250423/Al
 from __future__ import annotations
 
 import argparse
-import json
 from pathlib import Path
 from typing import List, Dict, Any
 from browser_use.wap.exact_replay import record_metadata_to_actions
-from utils.action_processing import find_task_prompt, load_event_json
+from utils.action_processing import find_task_prompt
+from utils.event_log import iter_task_events
+from utils.live_compile import PARTIAL_NAME, compiled_actions, write_plan
 
 # ---------------------------------------------------------------------------#
 # core function                                                              #
 # ---------------------------------------------------------------------------#
 def folder_to_actions(folder_path: str | Path) -> List[Dict[str, Any]]:
     """
-    Walk sub-directories recursively, load every *.json file, convert each
-    to replay actions via `record_metadata_to_actions`, and return the
-    concatenated list.
+    Read every recorded event of the task folder in order (event log, or
+    *.json files of older recordings), convert each to replay actions via
+    `record_metadata_to_actions`, and return the concatenated list.
     """
     folder_path = Path(folder_path)
 
     if not folder_path.is_dir():
         raise NotADirectoryError(folder_path)
 
-    json_paths = list(folder_path.rglob("*.json"))   # recursive search
-    if not json_paths:
-        print(f"[OTA Info] No JSON files found under {folder_path}")
-        return []
-
-    print(f"[OTA Info] Found {len(json_paths)} event files.")
+    if (folder_path / PARTIAL_NAME).is_file():
+        actions = compiled_actions(folder_path)
+        print(f"[OTA Info] Exported {len(actions)} actions compiled at ingest.")
+        return actions
 
     all_actions: List[Dict[str, Any]] = []
+    count = 0
 
-    for idx, event_path in enumerate(json_paths, 1):
-        print(f"[{idx}/{len(json_paths)}] Loading {event_path}")
+    for count, (name, event_json) in enumerate(iter_task_events(folder_path, resolve_snapshot=False), 1):
+        print(f"[{count}] Loading {name}")
         try:
-            event_json = load_event_json(event_path)
             actions = record_metadata_to_actions([event_json])
             all_actions.extend(actions)
         except Exception as exc:
-            print(f"[warn] could not process {event_path.name}: {exc}")
+            print(f"[warn] could not process {name}: {exc}")
+
+    if not count:
+        print(f"[OTA Info] No recorded events found under {folder_path}")
+        return []
 
+    print(f"[OTA Info] Processed {count} events.")
     print("[OTA Info] All done.")
     return all_actions
 
@@ -66,14 +74,9 @@ def save_exact_replay_bundle(
 ) -> None:
     """
     Write a JSON file shaped like
+    {"ultimate_goal", "task_id", "type": "exact_replay", "action_list"}
     """
-    bundle = {
-        "ultimate_goal": ultimate_goal,
-        "task_id": task_id,
-        "type": "exact_replay",
-        "action_list": actions,
-    }
-    path.write_text(json.dumps(bundle, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_plan(path, ultimate_goal=ultimate_goal, task_id=task_id, actions=actions)
     print(f"[OTA info] wrote {len(actions)} actions → {path}")
 
 
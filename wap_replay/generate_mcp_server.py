@@ -38,12 +38,13 @@ def extract_ultimate_goal(task_id: str) -> str:
     
     raise ValueError(f"Could not find ultimate_goal in replay files for task_id {task_id}")
 
-def summarize_goal(ultimate_goal: str) -> str:
+def summarize_goal(ultimate_goal: str, bypass_cache: bool = False) -> str:
     """
     Generate a function name from the ultimate goal.
-    This is a placeholder - in practice you would call OpenAI API here.
+    The reply is cached, so regenerating a server keeps its function name.
     """
-    return utils.llm.ask_llm(f"Summarize the following to a single function name with underscore in plaintext: {ultimate_goal}")
+    return utils.llm.ask_llm(f"Summarize the following to a single function name with underscore in plaintext: {ultimate_goal}",
+                             bypass_cache=bypass_cache)
 
 def create_mcp_server(ultimate_goal: str, function_name: str, task_id: str) -> str:
     """
@@ -64,10 +65,31 @@ def create_mcp_server(ultimate_goal: str, function_name: str, task_id: str) -> s
     exact_docstring = f"exact replay: {ultimate_goal}"
     
     code = f'''
+import json
+import os
+
 from mcp.server.fastmcp import FastMCP
 import httpx
 
 mcp = FastMCP("{ultimate_goal}")
+'''
+    code += '''
+REPLAY_SERVICE = os.getenv("OTA_REPLAY_SERVICE", "http://localhost:3089")
+
+
+async def run_replay(file_path: str) -> str:
+    """Queue a replay on the replay service (wap_service.py) and wait for its result."""
+    async with httpx.AsyncClient(base_url=REPLAY_SERVICE, timeout=90.0) as client:
+        response = await client.post("/jobs", json={"model": "openai", "file_path": file_path})
+        if response.status_code != 202:
+            return response.text
+        job = response.json()
+        while job["status"] in ("queued", "running"):
+            response = await client.get(f"/jobs/{job['id']}", params={"wait": 55})
+            if response.status_code != 200:        # e.g. 404 once the service restarted
+                return response.text
+            job = response.json()
+        return json.dumps({"status": job["status"], "result": job["result"], "error": job["error"]})
 '''
     
     # Only include the tool function for the existing replay file
@@ -76,34 +98,14 @@ mcp = FastMCP("{ultimate_goal}")
 @mcp.tool()
 async def {function_name}_smart_replay() -> str:
     """{smart_docstring}"""
-    async with httpx.AsyncClient(timeout=600.0) as client:
-        response = await client.get(
-            "http://localhost:3089/replay",
-            params={{
-                "concurrent": 1,
-                "model": "openai",
-                "file_path": 'data_processed/smart_replay/wap_smart_replay_list_{task_id}.json'
-            }}
-        )
-        return response.text
-    return "FAILED"
+    return await run_replay('data_processed/smart_replay/wap_smart_replay_list_{task_id}.json')
 '''
     if os.path.exists(exact_replay_path):
         code += f'''
 @mcp.tool()
 async def {function_name}_exact_replay() -> str:
     """{exact_docstring}"""
-    async with httpx.AsyncClient(timeout=600.0) as client:
-        response = await client.get(
-            "http://localhost:3089/replay",
-            params={{
-                "concurrent": 1,
-                "model": "openai",
-                "file_path": 'data_processed/exact_replay/wap_exact_replay_list_{task_id}.json'
-            }}
-        )
-        return response.text
-    return "FAILED"
+    return await run_replay('data_processed/exact_replay/wap_exact_replay_list_{task_id}.json')
 '''
     
     code += '''
@@ -115,6 +117,8 @@ if __name__ == "__main__":
 def main():
     parser = argparse.ArgumentParser(description='Create MCP server file from replay data')
     parser.add_argument('--task_id', required=True, help='Task ID to process')
+    parser.add_argument('--no_llm_cache', action='store_true',
+                        help='ask the LLM again instead of reusing the cached function name')
     args = parser.parse_args()
     
     try:
@@ -122,7 +126,7 @@ def main():
         ultimate_goal = extract_ultimate_goal(args.task_id)
         
         # Generate function name
-        function_name = summarize_goal(ultimate_goal)
+        function_name = summarize_goal(ultimate_goal, bypass_cache=args.no_llm_cache)
         
         # Generate the code
         server_code = create_mcp_server(ultimate_goal, function_name, args.task_id)
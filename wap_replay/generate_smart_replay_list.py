@@ -5,49 +5,70 @@ action list by calling `record_metadata_to_actions` from browser-use.
 Usage
 -----
 python wap_replay/generate_smart_replay_list.py --data_dir_path <folder_with_json_files> \
-                             [--output_dir_path data_processed/exact_replay]
-                             
+                             [--output_dir_path data_processed/exact_replay] [--dump_prompts] \
+                             [--concurrency 8] [--rpm N] [--tpm N] [--no_llm_cache] [--resume] [--batch_tokens N] \
+                             [--rule_min_confidence 0.8] [--group_near_duplicates]
+
+Events whose sub-goal is obvious (a click on a short visible text, typing into
+a labelled field, a navigation …) are answered by rules when their
+confidence reaches --rule_min_confidence; only the others are rendered and
+sent to the LLM, --concurrency of them at a time within the --rpm/--tpm
+limits of the account.  --group_near_duplicates sends the events of each run
+of near-identical pages (SimHash of the sanitized snapshot, kept in
+subgoals_<task_id>/fingerprints.json) as one batched request.
+--dump_prompts also writes each prompt to subgoals_<task_id>/ for inspection.
+
 Example
 -----
 python wap_replay/generate_smart_replay_list.py --data_dir_path data/20250423/Allrecipes--4 \
                              --output_dir_path data_processed/smart_replay
 """
 import argparse
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
-from utils.action_processing import generate_subgoal_speculate_prompt, find_task_prompt, load_event_json
-from utils.subgoal_generator import generate_subgoals_from_dir, wap_subgoal_list_generation
+from utils.action_processing import find_task_prompt, iter_subgoal_prompts
+from utils.rule_subgoals import DEFAULT_MIN_CONFIDENCE, RuleSubgoals
+from utils.snapshot_fingerprint import fingerprint_task, load_fingerprints, prompt_groups, save_fingerprints
+from utils.subgoal_generator import append_results, generate_subgoals_async, wap_subgoal_list_generation
 load_dotenv()
 
 
-def subgoal_prompt_generation(path: str,  output_path: str, ultimate_goal: str) -> None:
-    # 1️⃣  collect every .json file under the root folder --------------------
-    root = Path(path)
-    json_paths = list(root.rglob("*.json"))
-    if not json_paths:
-        print(f"[OTA Info] No JSON files found under {root}")
-        return
-
-    print(f"[OTA Info] Found {len(json_paths)} event files.")
-    # 2️⃣  process each event file ------------------------------------------
-    for idx, event_path in enumerate(json_paths, 1):
-        print(f"\n[{idx}/{len(json_paths)}] Loading {event_path}")
-        summary_event = load_event_json(event_path)
-
-        print("   Generating sub-goal …")
-        generate_subgoal_speculate_prompt(summary_event, ultimate_goal, event_path.stem, output_path)
-
-    print("\n[OTA Info] All done.")
-
-
-def subgoal_llm_generation(folder, jsonl_name):
-    results = generate_subgoals_from_dir(
-        folder,
+def subgoal_llm_generation(path, ultimate_goal, jsonl_name, dump_dir=None,
+                           concurrency=8, rpm=None, tpm=None, bypass_cache=False, resume=False,
+                           batch_tokens=0, rule_min_confidence=DEFAULT_MIN_CONFIDENCE,
+                           fingerprints_json=None):
+    # walk the recorded events in order; each prompt the rules cannot answer
+    # goes straight to the LLM
+    rules = RuleSubgoals(rule_min_confidence)
+    groups = None
+    if fingerprints_json is not None:
+        fingerprints = fingerprint_task(path, load_fingerprints(fingerprints_json))
+        save_fingerprints(fingerprints_json, fingerprints)
+        groups = prompt_groups(fingerprints)
+        print(f"[OTA Info] {len(fingerprints)} snapshots in {len(set(groups.values()))} near-duplicate groups")
+    results = asyncio.run(generate_subgoals_async(
+        iter_subgoal_prompts(path, ultimate_goal, dump_dir, skip=rules.skip),
         system_prompt="You are a concise sub-goal assistant fot analysis of actions in browser.",
         model="gpt-4o",
         temperature=0,
-        save_jsonl= jsonl_name
-    )
+        save_jsonl= jsonl_name,
+        concurrency=concurrency,
+        rpm=rpm,
+        tpm=tpm,
+        bypass_cache=bypass_cache,
+        resume=resume,
+        batch_tokens=batch_tokens,
+        groups=groups,
+    ))
+    append_results(jsonl_name, rules.records)
+    if not results and not rules.records:
+        print(f"[OTA Info] No recorded events found under {path}")
+        return results
+
+    print(f"\n[OTA Info] Processed {len(results) + len(rules.records)} events, "
+          f"{len(rules.records)} answered by rules.")
+    return results + rules.records
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Smart-replay pipeline")
@@ -56,6 +77,25 @@ def main() -> None:
     parser.add_argument("--output_dir_path", default="data_processed/smart_replay",
                     help="Directory where all output will be placed "
                          "(default: data_processed/smart_replay)")
+    parser.add_argument("--dump_prompts", action="store_true",
+                        help="also write the rendered prompts to subgoals_<task_id>/ (debugging)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="LLM queries in flight at a time (default: 8)")
+    parser.add_argument("--rpm", type=float, default=None,
+                        help="requests-per-minute limit of the OpenAI account (default: none)")
+    parser.add_argument("--tpm", type=float, default=None,
+                        help="tokens-per-minute limit of the OpenAI account (default: none)")
+    parser.add_argument("--no_llm_cache", action="store_true",
+                        help="query the LLM even for prompts whose reply is cached")
+    parser.add_argument("--resume", action="store_true",
+                        help="keep the replies already in subgoals_output.jsonl and only query missing prompts")
+    parser.add_argument("--batch_tokens", type=int, default=0,
+                        help="send consecutive prompts of up to this many tokens as one request (default: 0, off)")
+    parser.add_argument("--rule_min_confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help="answer events scored at least this by the sub-goal rules without the LLM "
+                             f"(default: {DEFAULT_MIN_CONFIDENCE}; above 1 sends every event to the LLM)")
+    parser.add_argument("--group_near_duplicates", action="store_true",
+                        help="batch the events of each run of near-identical page snapshots into one request")
     args = parser.parse_args()
 
     data_dir   = Path(args.data_dir_path)
@@ -72,15 +112,19 @@ def main() -> None:
     subgoals_jsonl = subgoals_dir / "subgoals_output.jsonl"
     wap_json       = output_dir / f"wap_smart_replay_list_{task_id}.json"
 
-    subgoal_prompt_generation(
+    subgoal_llm_generation(
         data_dir,
-        subgoals_dir,
         task_prompt,
-    )
-
-    subgoal_llm_generation(
-        subgoals_dir,
         subgoals_jsonl,
+        subgoals_dir if args.dump_prompts else None,
+        concurrency=args.concurrency,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        bypass_cache=args.no_llm_cache,
+        resume=args.resume,
+        batch_tokens=args.batch_tokens,
+        rule_min_confidence=args.rule_min_confidence,
+        fingerprints_json=subgoals_dir / "fingerprints.json" if args.group_near_duplicates else None,
     )
 
     wap_subgoal_list_generation(
@@ -1,26 +1,214 @@
-from flask import Flask, request
+"""Replay service: runs WAP replay lists as queued jobs.
+
+A replay runs for minutes, so requests do not wait on it.  ``POST /jobs``
+queues a replay and answers 202 with the job id; a pool of workers on the
+service's event loop runs the jobs, each in a browser it launched once and
+keeps open across jobs (`utils.replay_jobs`).
+
+    POST   /jobs                {"file_path": ..., "model": "openai"}  -> 202 {"id", "status", "links"}
+    GET    /jobs                recent jobs
+    GET    /jobs/{id}?wait=30   status and result, long-polling up to ``wait`` seconds for the end
+    GET    /jobs/{id}/events    progress as server-sent events (queued, running, step..., final status)
+    DELETE /jobs/{id}           cancel
+    GET    /replay?model=&file_path=   the former blocking endpoint: queue, wait, answer
+    GET    /metrics
+
+Usage
+-----
+python wap_service.py [--port 3089] [--workers 2] [--max_queued 100]
+"""
+import argparse
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.responses import Response as StarletteResponse
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
 import run_replay
+from utils.llm import aclose_chat_models
+from utils.metrics import CONTENT_TYPE, REGISTRY
+from utils.replay_jobs import Job, JobQueue, QueueFull
+
+MODEL_PROVIDERS = ("openai", "azure", "anthropic", "ollama")
+RESULTS_DIR = Path("results") / "jobs"
+MAX_WAIT = 60.0
+
+
+async def launch_browser():
+    browser = run_replay.make_browser()
+    await browser.get_playwright_browser()
+    return browser
+
+
+async def close_browser(browser) -> None:
+    await browser.close()
+
+
+async def replay_job(job: Job, browser, progress) -> Dict[str, Any]:
+    """Run the replay list of *job* in the worker's *browser*, reporting each step."""
+    replay_list = json.loads(await asyncio.to_thread(Path(job.params["file_path"]).read_text, encoding="utf-8"))
+    client = next(run_replay.get_llm_model_generator(job.params["model"]))
+
+    async def on_step_end(agent) -> None:
+        if not agent.state.history.history:
+            return
+        last = agent.state.history.history[-1]
+        await progress("step",
+                       step=last.metadata.step_number if last.metadata else agent.state.n_steps,
+                       url=last.state.url,
+                       actions=[a.model_dump(exclude_unset=True) for a in last.model_output.action]
+                       if last.model_output else [],
+                       errors=[r.error for r in last.result if r.error],
+                       done=any(r.is_done for r in last.result))
+
+    return await run_replay.replay_task(replay_list, client, RESULTS_DIR / job.id, browser, on_step_end=on_step_end)
+
+
+def job_links(job: Job) -> Dict[str, str]:
+    return {"self": f"/jobs/{job.id}", "events": f"/jobs/{job.id}/events"}
 
-app = Flask(__name__)
 
-@app.route('/replay', methods=['GET'])
-async def run_replay_endpoint():
-    try:
-        # Get parameters from query string
-        iterations = int(request.args.get('concurrent')) 
-        model = request.args.get('model') 
-        file_path = request.args.get('file_path') 
+def create_app(workers: int = 2, max_queued: int = 100, runner=replay_job,
+               setup=launch_browser, teardown=close_browser) -> Starlette:
+    jobs = JobQueue(runner, workers=workers, max_queued=max_queued, setup=setup, teardown=teardown)
 
-        # Validate required parameters
-        if not model or not file_path:
-            return {"status": "error", "message": "Model and file_path are required"}, 400
+    async def submit(params: Dict[str, Any]) -> Job | JSONResponse:
+        file_path, model = params.get("file_path"), params.get("model") or "openai"
+        if not file_path:
+            return JSONResponse({"status": "error", "message": "file_path is required"}, status_code=400)
+        if model not in MODEL_PROVIDERS:
+            return JSONResponse({"status": "error", "message": f"model must be one of {', '.join(MODEL_PROVIDERS)}"},
+                                status_code=400)
+        if not Path(file_path).is_file():
+            return JSONResponse({"status": "error", "message": f"No replay list at {file_path}"}, status_code=404)
+        try:
+            return await jobs.submit(file_path=file_path, model=model)
+        except QueueFull as exc:
+            return JSONResponse({"status": "error", "message": f"Replay queue is full ({exc}), retry later"},
+                                status_code=503, headers={"Retry-After": "30"})
+
+    def lookup(request: Request) -> Job | JSONResponse:
+        job = jobs.get(request.path_params["job_id"])
+        if job is None:
+            return JSONResponse({"status": "error", "message": "Unknown job"}, status_code=404)
+        return job
+
+    async def create_job(request: Request) -> JSONResponse:
+        try:
+            params = await request.json()
+        except ValueError:
+            return JSONResponse({"status": "error", "message": "Body must be a JSON object"}, status_code=400)
+        if not isinstance(params, dict):
+            return JSONResponse({"status": "error", "message": "Body must be a JSON object"}, status_code=400)
+        job = await submit(params)
+        if isinstance(job, JSONResponse):
+            return job
+        return JSONResponse({"id": job.id, "status": job.status, "links": job_links(job)}, status_code=202,
+                            headers={"Location": f"/jobs/{job.id}"})
+
+    async def list_jobs(request: Request) -> JSONResponse:
+        return JSONResponse({"jobs": [job.to_dict() for job in jobs.list()]})
+
+    async def get_job(request: Request) -> JSONResponse:
+        job = lookup(request)
+        if isinstance(job, JSONResponse):
+            return job
+        try:
+            wait = min(float(request.query_params.get("wait", 0)), MAX_WAIT)
+        except ValueError:
+            return JSONResponse({"status": "error", "message": "wait must be a number of seconds"}, status_code=400)
+        if wait > 0 and not job.finished:
+            await jobs.wait(job, wait)
+        return JSONResponse({**job.to_dict(events=request.query_params.get("events") == "1"),
+                             "links": job_links(job)})
+
+    async def cancel_job(request: Request) -> JSONResponse:
+        job = lookup(request)
+        if isinstance(job, JSONResponse):
+            return job
+        await jobs.cancel(job)
+        await jobs.wait(job, 5)
+        return JSONResponse(job.to_dict())
+
+    async def job_events(request: Request) -> StarletteResponse:
+        job = lookup(request)
+        if isinstance(job, JSONResponse):
+            return job
+        try:
+            after = int(request.headers.get("last-event-id", request.query_params.get("after", -1)))
+        except ValueError:
+            after = -1
+
+        async def stream():
+            async for event in jobs.events(job, after):
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    async def replay(request: Request) -> JSONResponse:
+        job = await submit(dict(request.query_params))
+        if isinstance(job, JSONResponse):
+            return job
+        while not job.finished:
+            await jobs.wait(job, MAX_WAIT)
+        if job.status == "succeeded":
+            return JSONResponse({"status": "success", "message": "Replay executed successfully", "job": job.to_dict()})
+        return JSONResponse({"status": "error", "message": job.error or f"Replay {job.status}", "job": job.to_dict()},
+                            status_code=500)
+
+    async def metrics_text(request: Request) -> StarletteResponse:
+        return StarletteResponse(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+
+    @asynccontextmanager
+    async def lifespan(_app):
+        jobs.start()
+        try:
+            yield
+        finally:
+            await jobs.close()
+            await aclose_chat_models()          # the workers' shared pool of this loop
+
+    app = Starlette(
+        routes=[Route('/jobs', create_job, methods=['POST']),
+                Route('/jobs', list_jobs, methods=['GET']),
+                Route('/jobs/{job_id}', get_job, methods=['GET']),
+                Route('/jobs/{job_id}', cancel_job, methods=['DELETE']),
+                Route('/jobs/{job_id}/events', job_events, methods=['GET']),
+                Route('/replay', replay, methods=['GET']),
+                Route('/metrics', metrics_text, methods=['GET'])],
+        middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+        lifespan=lifespan,
+    )
+    app.state.jobs = jobs
+    return app
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve WAP replays as queued jobs.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=3089)
+    parser.add_argument("--workers", type=int, default=2,
+                        help="replays run at once, each worker keeping one browser open (default: 2)")
+    parser.add_argument("--max_queued", type=int, default=100,
+                        help="jobs allowed to wait for a worker before POST /jobs answers 503 (default: 100)")
+    return parser.parse_args()
 
-        await run_replay.main(iterations, model, file_path)
-        return {"status": "success", "message": "Replay executed successfully"}
-    except ValueError as ve:
-        return {"status": "error", "message": "Invalid iterations value: must be an integer"}, 400
-    except Exception as e:
-        return {"status": "error", "message": str(e)}, 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=3089)
\ No newline at end of file
+    import uvicorn
+
+    args = parse_args()
+    logging.getLogger("browser_use").setLevel(logging.INFO)
+    run_replay.cleanup_webdriver_cache()
+    uvicorn.run(create_app(args.workers, args.max_queued), host=args.host, port=args.port)